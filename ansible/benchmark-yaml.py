@@ -0,0 +1,126 @@
+#!/usr/bin/python3 -tt
+"""
+Compare the speed of the ways that the scripts here can load yaml
+
+Usage: benchmark-yaml.py [FILE_OR_DIRECTORY ...]
+
+With arguments, the yaml files given (directories are searched for .yml and .yaml files) are
+loaded.  Point it at lib/ansible/config/routing.yml and test/integration/targets of an ansible
+checkout for real inputs.  Without arguments, inputs of about the same size are generated: a
+routing.yml with 5000 redirects and 1500 task files.
+"""
+import os
+import sys
+import time
+
+import yaml
+
+import fastyaml
+
+
+ROUNDS = 3
+
+
+def generate_routing():
+    plugin_routing = {}
+    for plugin_type in ('modules', 'module_utils', 'action', 'lookup', 'filter'):
+        plugin_routing[plugin_type] = {
+            f'{plugin_type}_plugin_{n}': {'redirect': f'community.ns{n % 50}.plugin_{n}'}
+            for n in range(1000)}
+    return yaml.dump({'plugin_routing': plugin_routing})
+
+
+def generate_task_file(n):
+    tasks = []
+    for t in range(10):
+        tasks.append({'name': f'Task {t} of file {n}',
+                      f'module_{t}': {'path': f'/tmp/{n}/{t}', 'state': 'present'},
+                      'register': f'result_{t}'})
+        tasks.append({'block': [{'assert': {'that': [f'result_{t} is changed']}}],
+                      'when': f'item_{t} is defined'})
+    return yaml.dump(tasks)
+
+
+def find_inputs(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dummy, files in os.walk(path):
+                for filename in files:
+                    if filename.endswith('.yml') or filename.endswith('.yaml'):
+                        yield os.path.join(root, filename)
+        else:
+            yield path
+
+
+def read_inputs(paths):
+    inputs = []
+    for filename in find_inputs(paths):
+        with open(filename, 'rb') as f:
+            inputs.append(f.read().decode('utf-8'))
+    return inputs
+
+
+def time_loader(load, inputs):
+    """
+    Return the best time of ROUNDS rounds of loading all of the inputs
+    """
+    best = None
+    for _round in range(ROUNDS):
+        start = time.perf_counter()
+        for text in inputs:
+            load(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loaders():
+    yield 'yaml.safe_load (pure python)', lambda text: yaml.load(text, Loader=yaml.SafeLoader)
+    if fastyaml.SafeLoader is not yaml.SafeLoader:
+        yield 'fastyaml.safe_load (LibYAML)', fastyaml.safe_load
+    else:
+        print('LibYAML bindings are not available.  fastyaml falls back to pure python.')
+
+    yield 'fastyaml.load_ansible_yaml', fastyaml.load_ansible_yaml
+
+    try:
+        from ansible.parsing.dataloader import DataLoader
+    except ImportError:
+        print('ansible is not installed.  Skipping its DataLoader.')
+    else:
+        yield 'ansible DataLoader', DataLoader().load
+
+
+def main():
+    if sys.argv[1:]:
+        input_sets = {'given files': read_inputs(sys.argv[1:])}
+    else:
+        input_sets = {
+            'routing.yml': [generate_routing()],
+            'task files': [generate_task_file(n) for n in range(1500)],
+        }
+
+    for name, inputs in input_sets.items():
+        size = sum(len(text) for text in inputs) / 1024 / 1024
+        print(f'## {name}: {len(inputs)} documents, {size:.1f} MiB ##')
+
+        baseline = None
+        for loader_name, load in loaders():
+            elapsed = time_loader(load, inputs)
+            baseline = baseline or elapsed
+            print(f'{loader_name:32} {elapsed:8.3f}s  {baseline / elapsed:6.1f}x')
+        print()
+
+    # The scripts dump small lists so the dumpers are timed on routing-sized data
+    data = yaml.load(generate_routing(), Loader=yaml.SafeLoader)
+    print('## dumping routing.yml ##')
+    baseline = None
+    for dumper_name, dump in (('yaml.dump (pure python)', yaml.dump),
+                              ('fastyaml.dump', fastyaml.dump)):
+        elapsed = time_loader(dump, [data])
+        baseline = baseline or elapsed
+        print(f'{dumper_name:32} {elapsed:8.3f}s  {baseline / elapsed:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+On-disk caches which let repeated builds avoid network transfers
+"""
+
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import time
+
+
+#: Default maximum size of the artifact cache (2 GiB)
+DEFAULT_ARTIFACT_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+
+#: Default maximum size of the caches of built packages and sdist blocks (2 GiB)
+DEFAULT_PACKAGE_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+
+
+class NotCached(Exception):
+    pass
+
+
+def default_cache_dir():
+    """Return the directory that caches should live in when the user has not specified one"""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'build-acd')
+
+
+def link_or_copy(src, dest):
+    """Hardlink src to dest, falling back to a copy when the two are on different filesystems"""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def _is_staging_file(name):
+    return name.startswith('.tmp-') or name.endswith('.tmp')
+
+
+def evict_least_recently_used(cache_dir, max_size):
+    """
+    Remove the files with the oldest mtimes beneath cache_dir until it fits within max_size bytes
+
+    Caches update the mtime of an entry when they use it so the oldest mtime is the least recently
+    used entry.  Files which are still being written are left alone.
+    """
+    entries = []
+    total_size = 0
+    for dirpath, _dirnames, filenames in os.walk(cache_dir):
+        for name in filenames:
+            if _is_staging_file(name):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    entries.sort()
+    for _mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            # Another build evicted it first
+            pass
+        total_size -= size
+
+
+class ArtifactCache:
+    """
+    Content addressed store of collection tarballs
+
+    Artifacts are stored under their sha256 checksum.  Every time an artifact is used its mtime is
+    updated so that, when the cache grows larger than max_size bytes, the least recently used
+    artifacts can be evicted first.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_ARTIFACT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _artifact_path(self, sha256sum):
+        return os.path.join(self.cache_dir, sha256sum[:2], sha256sum)
+
+    def retrieve(self, sha256sum, dest_filename):
+        """
+        Place the artifact with the given checksum at dest_filename
+
+        :returns: True if the artifact was in the cache, False otherwise
+        """
+        artifact = self._artifact_path(sha256sum)
+        try:
+            # Mark the artifact as recently used
+            os.utime(artifact)
+        except FileNotFoundError:
+            return False
+
+        link_or_copy(artifact, dest_filename)
+        return True
+
+    def store(self, sha256sum, filename):
+        """Add an already verified artifact to the cache"""
+        if self.max_size <= 0:
+            return
+
+        artifact = self._artifact_path(sha256sum)
+        if os.path.exists(artifact):
+            os.utime(artifact)
+            return
+
+        artifact_dir = os.path.dirname(artifact)
+        os.makedirs(artifact_dir, exist_ok=True)
+
+        # Stage the file next to its final location so that other builds sharing the cache never
+        # see a partially written artifact
+        tmp_filename = os.path.join(artifact_dir, f'.tmp-{os.getpid()}-{sha256sum}')
+        try:
+            link_or_copy(filename, tmp_filename)
+            os.replace(tmp_filename, artifact)
+        except Exception:
+            if os.path.exists(tmp_filename):
+                os.unlink(tmp_filename)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used artifacts until the cache fits within max_size"""
+        evict_least_recently_used(self.cache_dir, self.max_size)
+
+
+class MetadataCache:
+    """
+    On-disk cache of JSON responses together with the HTTP validators needed to revalidate them
+
+    Entries younger than ttl seconds are used without contacting the server at all.  Older entries
+    are revalidated with a conditional request (If-None-Match/If-Modified-Since) so that an
+    unchanged resource costs a 304 response with no body.  In offline mode every cached entry is
+    used as is and anything which is not in the cache raises :exc:`NotCached`.
+    """
+
+    def __init__(self, cache_dir, ttl=0, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def load(self, url):
+        """Return the cache entry for url or None if there isn't one"""
+        try:
+            with open(self._entry_path(url), 'r') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Guard against hash collisions
+        if entry.get('url') != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """Whether entry can be used without asking the server if it has changed"""
+        return self.offline or time.time() - entry['fetched'] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Return the request headers which ask the server to only send entry if it changed"""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _write(self, url, entry):
+        entry_path = self._entry_path(url)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, entry_path)
+
+    def store(self, url, body, response_headers):
+        """Save a response body along with the validators the server sent for it"""
+        self._write(url, {'url': url,
+                          'etag': response_headers.get('ETag'),
+                          'last_modified': response_headers.get('Last-Modified'),
+                          'fetched': time.time(),
+                          'body': body})
+
+    def refresh(self, url, entry):
+        """Record that the server confirmed entry is still current"""
+        entry['fetched'] = time.time()
+        self._write(url, entry)
+
+    def load_value(self, key):
+        """Return a value derived from cached metadata or None if it has not been stored"""
+        entry = self.load(key)
+        return None if entry is None else entry['body']
+
+    def store_value(self, key, value):
+        """Save a value which was derived from cached metadata"""
+        self._write(key, {'url': key, 'fetched': time.time(), 'body': value})
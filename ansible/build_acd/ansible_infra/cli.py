@@ -9,18 +9,31 @@ import argparse
 import asyncio
 import os
 import os.path
-import pkgutil
+import shutil
 import sys
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urljoin
 
-import aiohttp
 import semantic_version as semver
-import sh
-from mako.template import Template
 
-from .dependency_files import InvalidFileFormat, BuildFile, parse_pieces_file, write_deps_file
+from .cache import (DEFAULT_ARTIFACT_CACHE_SIZE, DEFAULT_PACKAGE_CACHE_SIZE, ArtifactCache,
+                    MetadataCache, default_cache_dir, link_or_copy)
+from .compat import CompatibilityChecker
+from .dependency_files import (InvalidFileFormat, BuildFile, DepsFile, LockedRelease, LockFile,
+                               changed_collections, parse_pieces_file, write_deps_file)
 from .galaxy import CollectionDownloader, GalaxyClient
+from .install import install_collection
+from .packages import (PackageCache, build_acd_sdist, build_collection_sdist,
+                       build_meta_sdist)
+from .resolver import DependencyConflict, DependencyResolver
+from .retry import PartialFailure, gather_all
+from .sdist import TreeBlockCache
+from .session import (DEFAULT_CONNECTIONS_PER_HOST, DEFAULT_MAX_REQUESTS, PooledSession,
+                      get_json)
+from .stats import BuildStats
+from .versions import version_index
 
 
 DEFAULT_FILE_BASE = 'acd'
@@ -40,6 +53,23 @@ def parse_args(program_name, args):
                                help='The X.Y.Z version of ACD that this will be for')
     common_parser.add_argument('--dest-dir', default='.',
                               help='Directory to write the output to')
+    common_parser.add_argument('--cache-dir', default=default_cache_dir(),
+                               help='Directory to cache downloaded data in between runs')
+    common_parser.add_argument('--metadata-ttl', type=int, default=0,
+                               help='Number of seconds that cached Galaxy metadata is used'
+                               ' without checking whether it has changed')
+    common_parser.add_argument('--offline', action='store_true', default=False,
+                               help='Only use cached Galaxy metadata.  Fail if something has not'
+                               ' been cached')
+    common_parser.add_argument('--galaxy-server', default=GALAXY_SERVER_URL,
+                               help='Galaxy server to get collections from')
+    common_parser.add_argument('--pypi-server', default=PYPI_SERVER_URL,
+                               help='Python Package Index to look up ansible-base on')
+    common_parser.add_argument('--connections-per-host', type=int,
+                               default=DEFAULT_CONNECTIONS_PER_HOST,
+                               help='Maximum number of connections to open to any one server')
+    common_parser.add_argument('--max-requests', type=int, default=DEFAULT_MAX_REQUESTS,
+                               help='Maximum number of requests to have in flight at once')
 
     build_parser = argparse.ArgumentParser(add_help=False)
     build_parser.add_argument('--build-file', default=None,
@@ -47,6 +77,25 @@ def parse_args(program_name, args):
     build_parser.add_argument('--deps-file', default=None,
                               help='File which will be written containing the list of collections'
                               ' at versions which were included in this version of ACD')
+    build_parser.add_argument('--lock-file', default=None,
+                              help='File written by new-acd with the exact releases to use.'
+                              ' Defaults to the build file with a .lock extension if that'
+                              ' exists.  It is only used when it was written for this exact'
+                              ' acd_version')
+    build_parser.add_argument('--artifact-cache-size', type=int,
+                              default=DEFAULT_ARTIFACT_CACHE_SIZE // (1024 * 1024),
+                              help='Maximum size in MiB of the cache of downloaded collection'
+                              ' tarballs.  0 disables the cache')
+    build_parser.add_argument('--package-cache-size', type=int,
+                              default=DEFAULT_PACKAGE_CACHE_SIZE // (1024 * 1024),
+                              help='Maximum size in MiB of the cache of packaged collections.'
+                              '  0 disables the cache')
+    build_parser.add_argument('--no-pipeline', dest='pipeline', action='store_false',
+                              default=True,
+                              help='Wait for all of the collections to download before starting'
+                              ' to install them')
+    build_parser.add_argument('--progress', action='store_true', default=False,
+                              help='Show the progress of downloads and installs')
 
     parser = argparse.ArgumentParser(prog=program_name,
                                      description='Script to manage building ACD')
@@ -62,10 +111,21 @@ def parse_args(program_name, args):
     new_parser.add_argument('--build-file', default=None,
                             help='File which will be written which contains the list'
                             ' of collections with version ranges')
+    new_parser.add_argument('--lock-file', default=None,
+                            help='File which will be written which contains the exact'
+                            ' releases that were picked for each collection')
 
     build_single_parser = subparsers.add_parser('build-single',
                                                 parents=[common_parser, build_parser],
                                                 description='Build a single-file ACD')
+    build_single_parser.add_argument('--previous-deps-file', default=None,
+                                     help='The .deps file of an earlier build.  Only the'
+                                     ' collections whose version changed since then are'
+                                     ' downloaded and installed')
+    build_single_parser.add_argument('--previous-build-dir', default=None,
+                                     help='The ansible-X.Y.Z directory created by the build which'
+                                     ' wrote --previous-deps-file.  Unchanged collections are'
+                                     ' copied from it')
 
     build_multiple_parser = subparsers.add_parser('build-multiple',
                                                   parents=[common_parser, build_parser],
@@ -91,6 +151,9 @@ def parse_args(program_name, args):
             basename = os.path.basename(os.path.splitext(args.pieces_file)[0])
             args.build_file = f'{basename}-{args.acd_version.major}.{args.acd_version.minor}.build'
 
+        if args.lock_file is None:
+            args.lock_file = f'{os.path.splitext(args.build_file)[0]}.lock'
+
     if args.command in ('build-single', 'build-multiple'):
         if args.build_file is None:
             args.build_file = (os.path.splitext(DEFAULT_FILE_BASE)[0]
@@ -104,14 +167,39 @@ def parse_args(program_name, args):
             basename = os.path.basename(os.path.splitext(args.build_file)[0])
             args.deps_file =f'{basename}-{args.acd_version}.deps'
 
+        if args.lock_file is None:
+            lock_file = f'{os.path.splitext(args.build_file)[0]}.lock'
+            if os.path.isfile(lock_file):
+                args.lock_file = lock_file
+        elif not os.path.isfile(args.lock_file):
+            raise InvalidArgumentError(f'The lock file, {args.lock_file} must already exist')
+
+    if args.command == 'build-single':
+        if (args.previous_deps_file is None) != (args.previous_build_dir is None):
+            raise InvalidArgumentError('--previous-deps-file and --previous-build-dir must be'
+                                       ' used together')
+
+        if args.previous_deps_file is not None:
+            if not os.path.isfile(args.previous_deps_file):
+                raise InvalidArgumentError(f'The previous deps file, {args.previous_deps_file}'
+                                           ' must already exist')
+            if not os.path.isdir(args.previous_build_dir):
+                raise InvalidArgumentError(f'The previous build dir, {args.previous_build_dir}'
+                                           ' must already exist')
+
+            ansible_dir = os.path.join(args.dest_dir, f'ansible-{args.acd_version}')
+            if os.path.realpath(args.previous_build_dir) == os.path.realpath(ansible_dir):
+                raise InvalidArgumentError(f'The previous build dir, {args.previous_build_dir}'
+                                           ' would be overwritten by this build')
+
     return args
 
 
-async def get_ansible_base_version(aio_session, pypi_server_url=PYPI_SERVER_URL):
+async def get_ansible_base_version(aio_session, pypi_server_url=PYPI_SERVER_URL,
+                                   metadata_cache=None):
     # Retrieve the ansible-base package info from pypi
     query_url = urljoin(pypi_server_url, 'pypi/ansible-base/json')
-    async with aio_session.get(query_url) as response:
-        pkg_info = await response.json()
+    pkg_info = await get_json(aio_session, query_url, metadata_cache=metadata_cache)
 
     # Calculate the newest version of the package
     return [pkg_info['info']['version']]
@@ -121,173 +209,501 @@ def display_exception(loop, context):
     print(context.get('exception'))
 
 
-async def get_version_info(collections):
+def create_session(args, stats=None):
+    """Create the connection pool which all of the requests made by a build will share"""
+    return PooledSession(connections_per_host=args.connections_per_host,
+                         max_requests=args.max_requests, stats=stats)
+
+
+def load_locked_releases(args):
+    """
+    Return the releases pinned by the lock file or an empty dict if it cannot be used
+
+    A lock file pins the releases of the one ACD version that new-acd was run for.  Respins of
+    that version resolve the build file again so that they get newer releases in range.
+    """
+    if args.lock_file is None:
+        return {}
+
+    lock_acd_version, _lock_base_version, releases = LockFile(args.lock_file).parse()
+    if lock_acd_version != str(args.acd_version):
+        print(f'Ignoring {args.lock_file} because it is for version {lock_acd_version} but we'
+              f' are building {args.acd_version}')
+        return {}
+
+    return releases
+
+
+def create_stats(args):
+    return BuildStats(progress=sys.stderr if args.progress else None)
+
+
+def write_stats_report(stats, deps_filename):
+    """Write the timings of a build next to the deps file it wrote"""
+    stats.write_report(f'{os.path.splitext(deps_filename)[0]}.stats.json')
+
+
+def report_failures(failure):
+    """Tell the user which collections failed and why"""
+    for name, exc in sorted(failure.failures.items()):
+        print(f'{name}: {exc}')
+    print(f'{len(failure.failures)} of {len(failure.failures) + len(failure.results)} collections'
+          ' failed.  Run the command again to retry them.')
+
+
+def create_metadata_cache(args):
+    return MetadataCache(os.path.join(args.cache_dir, 'metadata'), ttl=args.metadata_ttl,
+                         offline=args.offline)
+
+
+async def get_version_info(collections, galaxy_client, pypi_server=PYPI_SERVER_URL):
     loop = asyncio.get_running_loop()
     loop.set_exception_handler(display_exception)
 
     requestors = {}
-    async with aiohttp.ClientSession() as aio_session:
-        requestors['_ansible_base'] = asyncio.create_task(get_ansible_base_version(aio_session))
-        galaxy_client = GalaxyClient(GALAXY_SERVER_URL, aio_session)
-
-        for collection in collections:
-            requestors[collection] = asyncio.create_task(
-                galaxy_client.get_versions(collection))
+    requestors['_ansible_base'] = asyncio.create_task(
+        get_ansible_base_version(galaxy_client.aio_session, pypi_server_url=pypi_server,
+                                 metadata_cache=galaxy_client.metadata_cache))
 
-        collection_versions = {}
-        responses = await asyncio.gather(*requestors.values())
+    for collection in collections:
+        requestors[collection] = asyncio.create_task(
+            galaxy_client.get_versions(collection))
 
-        for idx, collection_name in enumerate(requestors):
-            collection_versions[collection_name] = responses[idx]
+    # Every listing that can be fetched is fetched (and cached) even if some fail
+    collection_versions = await gather_all(requestors)
 
     return collection_versions
 
 
-def version_is_compatible(ansible_base_version, collection, version):
-    # Metadata for this is not currently implemented.  So everything is rated as compatible
-    return True
+async def find_latest_compatible(ansible_base_version, raw_dependency_versions, galaxy_client):
+    """
+    Select the newest version of each collection whose requires_ansible allows ansible_base_version
 
+    Collections with no compatible version are left out (with a warning).
 
-def find_latest_compatible(ansible_base_version, raw_dependency_versions):
-    # Note: ansible-base compatibility is not currently implemented.  It will be a piece of
-    # collection metadata that is present in the collection but may not be present in galaxy.  We'll
-    # have to figure that out once the pieces are finalized
+    :raises PartialFailure: if the versions of any of the collections could not be checked
+    """
+    metadata_cache = galaxy_client.metadata_cache
+    checker = CompatibilityChecker(galaxy_client, ansible_base_version,
+                                   metadata_cache=metadata_cache)
 
-    # Order versions
-    reduced_versions = {}
-    for dep, versions in raw_dependency_versions.items():
-        # Order the versions
-        versions = [semver.Version(v) for v in versions]
-        versions.sort(reverse=True)
+    # The index holds the versions in order so candidates can be tried newest first
+    requestors = {dep: checker.latest_compatible(dep, version_index(dep, versions, metadata_cache))
+                  for dep, versions in raw_dependency_versions.items()}
+    latest = await gather_all(requestors)
 
-        # Step through the versions to select the latest one which is compatible
-        for version in versions:
-            if version_is_compatible(ansible_base_version, dep, version):
-                reduced_versions[dep] = version
-                break
+    reduced_versions = {}
+    for dep, version in latest.items():
+        if version is None:
+            print(f'Leaving out {dep} because none of its versions are compatible with'
+                  f' ansible-base {ansible_base_version}')
+            continue
+        reduced_versions[dep] = version
 
     return reduced_versions
 
 
+async def add_dependencies(dependencies, galaxy_client, ansible_base_version):
+    """
+    Add the collections which the chosen collection versions depend on
+
+    The dependencies are held to the same requires_ansible check as the collections themselves.
+    """
+    metadata_cache = galaxy_client.metadata_cache
+    checker = CompatibilityChecker(galaxy_client, ansible_base_version,
+                                   metadata_cache=metadata_cache)
+    resolver = DependencyResolver(galaxy_client, metadata_cache=metadata_cache,
+                                  compatibility_checker=checker)
+    return await resolver.resolve(dependencies)
+
+
+async def get_locked_releases(dependencies, galaxy_client):
+    """
+    Look up the artifact for each of the chosen collection versions
+
+    :raises PartialFailure: if the release info of any of the collections could not be retrieved
+    """
+    release_infos = await gather_all({c: galaxy_client.get_release_info(c, v)
+                                      for c, v in dependencies.items()})
+
+    releases = {}
+    for collection, release_info in release_infos.items():
+        releases[collection] = LockedRelease(release_info['version'],
+                                             release_info['artifact']['sha256'],
+                                             release_info['artifact']['filename'],
+                                             release_info['download_url'])
+    return releases
+
+
 def new_acd(args):
-    collections = parse_pieces_file(args.pieces_file)
-    dependencies = asyncio.run(get_version_info(collections))
+    return asyncio.run(_new_acd(args))
 
-    ansible_base_version = dependencies.pop('_ansible_base')[0]
-    dependencies = find_latest_compatible(ansible_base_version, dependencies)
+
+async def _new_acd(args):
+    collections = parse_pieces_file(args.pieces_file)
+    metadata_cache = create_metadata_cache(args)
+
+    # All of the steps share one connection pool and one client so that the connections, the
+    # request rate learned from Galaxy, and the documents already fetched carry over between them
+    async with create_session(args) as aio_session:
+        galaxy_client = GalaxyClient(args.galaxy_server, aio_session,
+                                     metadata_cache=metadata_cache)
+        try:
+            dependencies = await get_version_info(collections, galaxy_client,
+                                                  pypi_server=args.pypi_server)
+        except PartialFailure as e:
+            e.results.pop('_ansible_base', None)
+            report_failures(e)
+            return 1
+
+        ansible_base_version = dependencies.pop('_ansible_base')[0]
+        try:
+            dependencies = await find_latest_compatible(ansible_base_version, dependencies,
+                                                        galaxy_client)
+            dependencies = await add_dependencies(dependencies, galaxy_client,
+                                                  ansible_base_version)
+            # Record exactly what was picked so build-single does not have to look it up again
+            releases = await get_locked_releases(dependencies, galaxy_client)
+        except PartialFailure as e:
+            report_failures(e)
+            return 1
+        except DependencyConflict as e:
+            print(e)
+            return 1
 
     build_filename = os.path.join(args.dest_dir, args.build_file)
     build_file = BuildFile(build_filename)
     build_file.write(args.acd_version, ansible_base_version, dependencies)
 
+    lock_file = LockFile(os.path.join(args.dest_dir, args.lock_file))
+    lock_file.write(args.acd_version, ansible_base_version, releases)
+
     return 0
 
 
-async def download_collections(deps, download_dir):
+async def download_collections(deps, download_dir, downloader, install_queue=None, stats=None):
+    """
+    Download the collections in deps into download_dir
+
+    If install_queue is given, the collection name, filename, and time of each tarball is put onto
+    it as soon as the tarball has been downloaded and verified.
+
+    :raises PartialFailure: if any of the collections could not be downloaded
+    """
+    async def retrieve(collection_name, version_spec):
+        start = time.monotonic()
+        version, filename = await downloader.download(collection_name, version_spec, download_dir)
+        finished = time.monotonic()
+        if stats is not None:
+            stats.record_download(collection_name, finished - start, os.path.getsize(filename))
+        if install_queue is not None:
+            install_queue.put_nowait((collection_name, filename, finished))
+        return version
+
+    if stats is not None:
+        stats.expect_collections(len(deps))
+
     requestors = {}
-    async with aiohttp.ClientSession() as aio_session:
-        for collection_name, version_spec in deps.items():
-            downloader = CollectionDownloader(GALAXY_SERVER_URL, aio_session, download_dir)
-            requestors[collection_name] = asyncio.create_task(
-                downloader.retrieve(collection_name, version_spec, download_dir))
+    for collection_name, version_spec in deps.items():
+        requestors[collection_name] = asyncio.create_task(retrieve(collection_name, version_spec))
 
-        included_versions = {}
-        responses = await asyncio.gather(*requestors.values())
-        for idx, collection_name in enumerate(requestors):
-            included_versions[collection_name] = responses[idx]
+    # Downloads which succeed are kept in the artifact cache even if others fail so that the next
+    # run only has to download the failed ones
+    included_versions = await gather_all(requestors)
 
     return included_versions
 
 
-async def install_collections(version, tmp_dir):
+async def install_collections(ansible_dir, tmp_dir, stats=None):
     loop = asyncio.get_running_loop()
-    ansible_dir = os.path.join(tmp_dir, f'ansible-{version}')
-    os.mkdir(ansible_dir)
+    os.makedirs(ansible_dir, exist_ok=True)
+
+    async def install(pool, filename):
+        start = time.monotonic()
+        collection = await loop.run_in_executor(pool, install_collection, filename, ansible_dir)
+        if stats is not None:
+            stats.record_install(collection, 0, time.monotonic() - start)
 
-    installers = []
     collection_tarballs = (p for f in os.listdir(tmp_dir)
                            if os.path.isfile(p := os.path.join(tmp_dir, f)))
-    for filename in collection_tarballs:
-        installers.append(loop.run_in_executor(None, sh.ansible_galaxy, 'collection',
-                                               'install', '-p', ansible_dir,
-                                               filename, '-vvv'))
-    await asyncio.gather(*installers)
-
-
-def copy_boilerplate_files(package_dir):
-    gpl_license = pkgutil.get_data('ansible_infra', 'gplv3.txt')
-    with open(os.path.join(package_dir, 'COPYING'), 'wb') as f:
-        f.write(gpl_license)
-
-    readme = pkgutil.get_data('ansible_infra', 'acd-readme.txt')
-    with open(os.path.join(package_dir, 'README'), 'wb') as f:
-        f.write(readme)
+    with ProcessPoolExecutor() as pool:
+        await asyncio.gather(*(install(pool, filename) for filename in collection_tarballs))
 
 
-def write_manifest(package_dir, data_files):
-    manifest_file = os.path.join(package_dir, 'MANIFEST.IN')
-    with open(manifest_file, 'w') as f:
-        f.write('COPYING\n')
-        f.write('README\n')
-        f.write('\n'.join(data_files))
+async def download_and_install_collections(ansible_dir, deps, download_dir, downloader,
+                                           stats=None):
+    """
+    Download the collections and install each one as soon as its download finishes
 
+    This overlaps installing with downloading so that a build takes about as long as the slower of
+    the two instead of the sum of them.
 
-def write_setup(package_dir, acd_version, python_dirs):
-    setup_tmpl = Template(pkgutil.get_data('ansible_infra', 'setup_py.mk'))
-    python_packages = "[ '%s' ]"
+    :raises PartialFailure: if any of the collections could not be downloaded or installed.  The
+        collections which were installed are its results.
+    """
+    loop = asyncio.get_running_loop()
+    os.makedirs(ansible_dir, exist_ok=True)
+
+    install_queue = asyncio.Queue()
+    num_workers = os.cpu_count() or 1
+    install_failures = {}
+
+    async def install_worker():
+        while (queued := await install_queue.get()) is not None:
+            collection_name, filename, queued_at = queued
+            start = time.monotonic()
+            try:
+                await loop.run_in_executor(pool, install_collection, filename, ansible_dir)
+            except Exception as e:
+                # Keep installing the rest so that all of the failures are reported together
+                install_failures[collection_name] = e
+                continue
+            if stats is not None:
+                stats.record_install(collection_name, start - queued_at,
+                                     time.monotonic() - start)
+
+    download_failures = {}
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        installers = [asyncio.create_task(install_worker()) for _ in range(num_workers)]
+        try:
+            try:
+                included_versions = await download_collections(deps, download_dir, downloader,
+                                                               install_queue=install_queue,
+                                                               stats=stats)
+            except PartialFailure as e:
+                # The downloads which succeeded are still installed
+                included_versions = e.results
+                download_failures = e.failures
+        except BaseException:
+            # Anything else means that the build is over.  Stop installing.
+            for installer in installers:
+                installer.cancel()
+            await asyncio.gather(*installers, return_exceptions=True)
+            raise
+
+        # Let the workers finish what has been queued and then exit
+        for _ in installers:
+            install_queue.put_nowait(None)
+        await asyncio.gather(*installers)
+
+    for collection_name in install_failures:
+        included_versions.pop(collection_name, None)
+    failures = {**download_failures, **install_failures}
+    if failures:
+        raise PartialFailure(included_versions, failures)
 
-    setup_contents = setup_tmpl.render(version=acd_version, python_packages=python_packages)
-    with open(setup_file, 'w') as f:
-        f.write(setup_contents)
+    return included_versions
 
 
-def write_python_build_files(acd_version, dest_dir):
-    toplevel_dir = os.path.join(dest_dir, f'ansible-{acd_version}')
-    package_dir = os.path.join(toplevel_dir, 'ansible_collections')
+def copy_installed_collection(collection, src_ansible_dir, dest_ansible_dir):
+    """
+    Copy an installed collection from one build tree to another, hardlinking files when possible
 
-    python_files = []
-    python_dirs = ['ansible_collections']
-    data_files = []
-    for root, directories, filenames in os.walk(package_dir):
-        root = root[len(package_dir) + 1:]
-        for filename in (os.path.join(root, f) for f in filenames):
-            if filename.endswith('.py'):
-                python_files.append(filename)
-            else:
-                data_files.append(filename)
+    :returns: False if the collection was not installed in src_ansible_dir, otherwise True
+    """
+    collection_path = os.path.join('ansible_collections', *collection.split('.', 1))
+    src = os.path.join(src_ansible_dir, collection_path)
+    if not os.path.isdir(src):
+        return False
 
-        for dir_name in (os.path.join(root, d) for d in directories):
-            python_dirs.append(dir_name)
+    shutil.copytree(src, os.path.join(dest_ansible_dir, collection_path), symlinks=True,
+                    copy_function=link_or_copy)
+    return True
 
 
-    copy_boilerplate_files(toplevel_dir)
-    write_manifest(toplevel_dir, data_files)
-    write_setup(toplevel_dir, acd_version, python_dirs)
+def build_single(args):
+    return asyncio.run(_build_single(args))
 
 
-def build_single(args):
+async def _build_single(args):
     build_file = BuildFile(args.build_file)
     build_acd_version, ansible_base_version, deps = build_file.parse()
 
     if not str(args.acd_version).startswith(build_acd_version):
         print(f'{args.build_file} is for version {build_acd_version} but we need'
-              ' {args.acd_version.major}.{arg.acd_version.minor}')
+              f' {args.acd_version.major}.{args.acd_version.minor}')
+
+    artifact_cache = None
+    if args.artifact_cache_size > 0:
+        artifact_cache = ArtifactCache(os.path.join(args.cache_dir, 'artifacts'),
+                                       max_size=args.artifact_cache_size * 1024 * 1024)
 
-    with tempfile.TemporaryDirectory() as download_dir:
-        included_versions = asyncio.run(download_collections(deps, download_dir))
-        asyncio.run(install_collections(args.acd_version, download_dir))
-        write_python_build_files(args.acd_version, download_dir)
-        #make_dist()
+    metadata_cache = create_metadata_cache(args)
+    locked_releases = load_locked_releases(args)
+    stats = create_stats(args)
+
+    # The build tree is kept so that it can be the previous build of a later respin
+    ansible_dir = os.path.join(args.dest_dir, f'ansible-{args.acd_version}')
+    if os.path.exists(ansible_dir):
+        shutil.rmtree(ansible_dir)
+    os.mkdir(ansible_dir)
 
     deps_filename = os.path.join(args.dest_dir, args.deps_file)
+    included_versions = {}
+    async with create_session(args, stats) as aio_session:
+        galaxy_client = GalaxyClient(args.galaxy_server, aio_session,
+                                     artifact_cache=artifact_cache,
+                                     metadata_cache=metadata_cache)
+        downloader = CollectionDownloader(galaxy_client, locked_releases=locked_releases)
+
+        if args.previous_deps_file:
+            # Reuse every collection whose version has not changed since the previous build
+            previous_versions = DepsFile(args.previous_deps_file).parse()[2]
+            try:
+                with stats.phase('resolve'):
+                    new_versions = await resolve_versions(deps, downloader)
+            except PartialFailure as e:
+                report_failures(e)
+                write_stats_report(stats, deps_filename)
+                return 1
+            changed = changed_collections(previous_versions, new_versions)
+            with stats.phase('copy unchanged'):
+                for collection in new_versions.keys() - changed:
+                    if copy_installed_collection(collection, args.previous_build_dir,
+                                                 ansible_dir):
+                        included_versions[collection] = new_versions[collection]
+
+            deps = {collection: f'=={version}' for collection, version in new_versions.items()
+                    if collection not in included_versions}
+
+        with tempfile.TemporaryDirectory() as download_dir:
+            try:
+                if args.pipeline:
+                    with stats.phase('download and install'):
+                        included_versions.update(await download_and_install_collections(
+                            ansible_dir, deps, download_dir, downloader, stats=stats))
+                else:
+                    with stats.phase('download'):
+                        included_versions.update(await download_collections(
+                            deps, download_dir, downloader, stats=stats))
+                    with stats.phase('install'):
+                        await install_collections(ansible_dir, download_dir, stats=stats)
+            except PartialFailure as e:
+                report_failures(e)
+                write_stats_report(stats, deps_filename)
+                return 1
+
+    with stats.phase('package'):
+        block_cache = None
+        if args.package_cache_size > 0:
+            block_cache = TreeBlockCache(os.path.join(args.cache_dir, 'sdist-blocks'),
+                                         max_size=args.package_cache_size * 1024 * 1024)
+        build_acd_sdist(args.acd_version, ansible_base_version, ansible_dir, included_versions,
+                        args.dest_dir, block_cache=block_cache)
+
     write_deps_file(deps_filename, args.acd_version, ansible_base_version, included_versions)
+    write_stats_report(stats, deps_filename)
 
     return 0
 
 
+async def resolve_versions(deps, downloader):
+    """
+    Find the version of each collection to use for its version spec
+
+    :raises PartialFailure: if the version of any of the collections could not be found
+    """
+    return await gather_all({c: downloader.resolve(c, spec) for c, spec in deps.items()})
+
+
+def build_collection_packages(included_versions, ansible_dir, dest_dir):
+    """Build the sdists for the installed collections in parallel"""
+    collections_dir = os.path.join(ansible_dir, 'ansible_collections')
+    with ProcessPoolExecutor() as pool:
+        builders = {}
+        for collection, version in included_versions.items():
+            collection_dir = os.path.join(collections_dir, *collection.split('.', 1))
+            builders[collection] = pool.submit(build_collection_sdist, collection, version,
+                                               collection_dir, dest_dir)
+
+        return {collection: builder.result() for collection, builder in builders.items()}
+
+
 def build_multiple(args):
-    raise NotImplemented('build_multiple is not yet implemented')
-    pass
+    return asyncio.run(_build_multiple(args))
+
+
+async def _build_multiple(args):
+    build_file = BuildFile(args.build_file)
+    build_acd_version, ansible_base_version, deps = build_file.parse()
+
+    if not str(args.acd_version).startswith(build_acd_version):
+        print(f'{args.build_file} is for version {build_acd_version} but we need'
+              f' {args.acd_version.major}.{args.acd_version.minor}')
+
+    artifact_cache = None
+    if args.artifact_cache_size > 0:
+        artifact_cache = ArtifactCache(os.path.join(args.cache_dir, 'artifacts'),
+                                       max_size=args.artifact_cache_size * 1024 * 1024)
+
+    metadata_cache = create_metadata_cache(args)
+    locked_releases = load_locked_releases(args)
+    # The built packages are collected in the cache so it is used even when its size is 0.  It is
+    # only trimmed once they have been copied out of it.
+    package_cache = PackageCache(os.path.join(args.cache_dir, 'packages'),
+                                 max_size=args.package_cache_size * 1024 * 1024)
+    stats = create_stats(args)
+
+    deps_filename = os.path.join(args.dest_dir, args.deps_file)
+    async with create_session(args, stats) as aio_session:
+        galaxy_client = GalaxyClient(args.galaxy_server, aio_session,
+                                     artifact_cache=artifact_cache,
+                                     metadata_cache=metadata_cache)
+        downloader = CollectionDownloader(galaxy_client, locked_releases=locked_releases)
+
+        failures = {}
+        try:
+            with stats.phase('resolve'):
+                included_versions = await resolve_versions(deps, downloader)
+        except PartialFailure as e:
+            # Build the collections which were found so that a rerun only has to deal with the
+            # failures
+            included_versions = e.results
+            failures.update(e.failures)
+
+        # Only the collections whose version has not been packaged before need to be built
+        changed_deps = {collection: f'=={version}'
+                        for collection, version in included_versions.items()
+                        if not package_cache.has(collection, version)}
+
+        with tempfile.TemporaryDirectory() as download_dir:
+            if changed_deps:
+                ansible_dir = os.path.join(download_dir, f'ansible-{args.acd_version}')
+                installed = changed_deps
+                try:
+                    with stats.phase('download and install'):
+                        await download_and_install_collections(ansible_dir, changed_deps,
+                                                               download_dir, downloader,
+                                                               stats=stats)
+                except PartialFailure as e:
+                    installed = e.results
+                    failures.update(e.failures)
+
+                # Package whatever was installed so that a rerun only has to deal with the
+                # failures
+                changed_versions = {c: included_versions[c] for c in installed}
+                with stats.phase('package'):
+                    built = build_collection_packages(changed_versions, ansible_dir,
+                                                      download_dir)
+                for collection, filename in built.items():
+                    package_cache.store(collection, included_versions[collection], filename)
+
+    if failures:
+        report_failures(PartialFailure({c: v for c, v in included_versions.items()
+                                        if c not in failures}, failures))
+        package_cache.evict()
+        write_stats_report(stats, deps_filename)
+        return 1
+
+    for collection, version in included_versions.items():
+        package_cache.retrieve(collection, version, args.dest_dir)
+    package_cache.evict()
+    build_meta_sdist(args.acd_version, ansible_base_version, included_versions, args.dest_dir)
+
+    write_deps_file(deps_filename, args.acd_version, ansible_base_version, included_versions)
+    write_stats_report(stats, deps_filename)
+
+    return 0
 
 
 ARGS_MAP = {'new-acd': new_acd,
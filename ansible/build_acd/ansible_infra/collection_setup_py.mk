@@ -0,0 +1,20 @@
+#!/usr/bin/python -tt
+
+from setuptools import setup
+
+
+setup(
+    name='${dist_name}',
+    version='${version}',
+    description='The ${collection} collection for the Ansible Community Distribution',
+    author='Ansible, Inc.',
+    author_email='info@ansible.com',
+    url='https://galaxy.ansible.com/${namespace}/${name}',
+    license='GPLv3+',
+    python_requires='>=2.7,!=3.0.*,!=3.1.*,!=3.2.*,!=3.3.*,!=3.4.*',
+    package_dir={'ansible_collections': 'ansible_collections'},
+    packages=${python_packages},
+    include_package_data=True,
+    # Installing as zip files would break due to references to __file__
+    zip_safe=False
+)
@@ -0,0 +1,171 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Find the collection versions which work with a given version of ansible-base
+"""
+
+import asyncio
+import itertools
+import operator
+import re
+
+import semantic_version as semver
+
+from .ratelimit import PRIORITY_BACKGROUND, PRIORITY_NORMAL
+
+
+#: Number of candidate versions of one collection to fetch metadata for at the same time
+COMPAT_BATCH_SIZE = 4
+
+_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+_CLAUSE_RE = re.compile(r'^\s*(~=|===|==|!=|>=|<=|>|<)\s*([^\s]+)\s*$')
+
+
+class InvalidRequiresAnsible(Exception):
+    pass
+
+
+def requires_ansible(release_info):
+    """Return the requires_ansible specifier of a Galaxy release or None if it doesn't have one"""
+    return (release_info.get('requires_ansible')
+            or (release_info.get('metadata') or {}).get('requires_ansible'))
+
+
+def _check_clause(ansible_base_version, clause):
+    match = _CLAUSE_RE.match(clause)
+    if not match:
+        raise InvalidRequiresAnsible(f'Unable to parse requires_ansible clause: {clause}')
+    op, version = match.groups()
+
+    if op == '===':
+        return str(ansible_base_version) == version
+
+    if op == '~=':
+        # Compatible release: >= the version and the same release with the last part dropped
+        release = version.split('.')
+        if len(release) < 2:
+            raise InvalidRequiresAnsible(f'~= needs at least two version components: {clause}')
+        prefix = semver.Version.coerce('.'.join(release[:-1]))
+        lower = semver.Version.coerce(version)
+        if len(release) == 2:
+            upper = prefix.next_major()
+        else:
+            upper = prefix.next_minor()
+        return lower <= ansible_base_version < upper
+
+    if op in ('==', '!=') and version.endswith('.*'):
+        prefix = version[:-2].split('.')
+        matched = [str(p) for p in (ansible_base_version.major, ansible_base_version.minor,
+                                    ansible_base_version.patch)][:len(prefix)] == prefix
+        return matched if op == '==' else not matched
+
+    return _OPERATORS[op](ansible_base_version, semver.Version.coerce(version))
+
+
+def version_is_compatible(ansible_base_version, requires_ansible_spec):
+    """
+    Whether a collection with the given requires_ansible (a PEP 440 specifier) can be used with
+    ansible_base_version
+
+    Collections which do not declare requires_ansible are assumed to be compatible.
+
+    :raises InvalidRequiresAnsible: if requires_ansible_spec cannot be parsed
+    """
+    if not requires_ansible_spec:
+        return True
+
+    if not isinstance(ansible_base_version, semver.Version):
+        ansible_base_version = semver.Version.coerce(ansible_base_version)
+
+    try:
+        return all(_check_clause(ansible_base_version, clause)
+                   for clause in requires_ansible_spec.split(',') if clause.strip())
+    except ValueError as e:
+        # A clause whose version semantic_version cannot make sense of
+        raise InvalidRequiresAnsible(f'Unable to parse requires_ansible: {requires_ansible_spec}:'
+                                     f' {e}')
+
+
+class CompatibilityChecker:
+    """
+    Pick the newest version of collections which are compatible with an ansible-base version
+
+    The newest candidate is checked on its own since it is usually compatible.  Only when it is
+    not are the older candidates fetched, a few at a time, newest first, and the search stops at
+    the first compatible version.  Published releases never change so the metadata is stored in
+    the metadata cache and never fetched again.
+    """
+
+    def __init__(self, galaxy_client, ansible_base_version, metadata_cache=None):
+        self.galaxy_client = galaxy_client
+        self.ansible_base_version = semver.Version.coerce(str(ansible_base_version))
+        self.metadata_cache = metadata_cache
+
+    async def get_requires_ansible(self, collection, version, priority=PRIORITY_NORMAL):
+        key = f'requires-ansible:{collection}:{version}'
+        if self.metadata_cache and (cached := self.metadata_cache.load_value(key)) is not None:
+            return cached['requires_ansible']
+
+        release_info = await self.galaxy_client.get_release_info(collection, version, priority)
+        spec = requires_ansible(release_info)
+
+        if self.metadata_cache and not self.metadata_cache.offline:
+            self.metadata_cache.store_value(key, {'requires_ansible': spec})
+        return spec
+
+    async def is_compatible(self, collection, version, priority=PRIORITY_NORMAL):
+        """
+        Whether a release of collection can be used with the ansible-base version
+
+        A release whose requires_ansible cannot be parsed is treated as incompatible (with a
+        warning) so that one bad release does not stop a whole search.
+        """
+        spec = await self.get_requires_ansible(collection, version, priority)
+        try:
+            return version_is_compatible(self.ansible_base_version, spec)
+        except InvalidRequiresAnsible as e:
+            print(f'Skipping {collection} {version}: {e}')
+            return False
+
+    async def latest_compatible(self, collection, index, version_spec=None):
+        """
+        Return the newest compatible version of collection or None if there isn't one
+
+        :arg index: :class:`~ansible_infra.versions.VersionIndex` of the collection's versions
+        :kwarg version_spec: A :class:`semantic_version.SimpleSpec` which the version must also
+            match
+        """
+        if version_spec is None:
+            candidates = index.descending()
+        else:
+            candidates = index.matching(version_spec)
+
+        batch = list(itertools.islice(candidates, 1))
+        while batch:
+            # Only the first candidate of a batch is sure to be needed.  The others are fetched
+            # in the background in case it is not compatible.
+            checks = [asyncio.ensure_future(self.is_compatible(
+                collection, v, PRIORITY_NORMAL if i == 0 else PRIORITY_BACKGROUND))
+                for i, v in enumerate(batch)]
+            try:
+                for version, check in zip(batch, checks):
+                    if await check:
+                        return version
+            finally:
+                for check in checks:
+                    check.cancel()
+
+            batch = list(itertools.islice(candidates, COMPAT_BATCH_SIZE))
+
+        return None
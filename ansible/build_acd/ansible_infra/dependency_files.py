@@ -12,10 +12,17 @@ We don't want to install backwards incompatible collections until the next major
 """
 
 
+from collections import namedtuple
+
+
 class InvalidFileFormat(Exception):
     pass
 
 
+#: A collection release pinned by a lock file
+LockedRelease = namedtuple('LockedRelease', ('version', 'sha256', 'filename', 'download_url'))
+
+
 def parse_pieces_file(pieces_file):
     with open(pieces_file, 'r') as f:
         # One collection per line, ignoring comments and empty lines
@@ -33,11 +40,70 @@ def write_deps_file(deps_file, acd_version, ansible_base_version, included_versi
 
     with open(deps_file, 'w') as f:
         f.write(f'_acd_version: {acd_version}\n')
-        f.write(f'_ansible_base_version: {ansible_base_version[0]}\n')
+        f.write(f'_ansible_base_version: {ansible_base_version}\n')
         f.write('\n'.join(records))
         f.write('\n')
 
 
+def _parse_dependency_file(filename):
+    """
+    Parse a file of ``collection: version`` records headed by the ACD and ansible-base versions
+    """
+    deps = {}
+    ansible_base_version = acd_version = None
+    with open(filename, 'r') as f:
+        for line in f:
+            record = [entry.strip() for entry in line.split(':', 1)]
+
+            if record[0] == '_acd_version':
+                if acd_version is not None:
+                    raise InvalidFileFormat(f'{filename} specified _acd_version'
+                                            ' more than once')
+                acd_version = record[1]
+                continue
+
+            if record[0] == '_ansible_base_version':
+                if ansible_base_version is not None:
+                    raise InvalidFileFormat(f'{filename} specified _ansible_base_version'
+                                            ' more' ' than once')
+                ansible_base_version = record[1]
+                continue
+
+            deps[record[0]] = record[1]
+
+    if ansible_base_version is None or acd_version is None:
+        raise InvalidFileFormat(f'{filename} was invalid.  It did not contain'
+                                ' required fields')
+
+    return acd_version, ansible_base_version, deps
+
+
+def changed_collections(previous_versions, new_versions):
+    """
+    Return the collections which are new or whose version differs from the previous release
+
+    :arg previous_versions: Mapping of collection name to the version in the previous release.
+        The versions may be strings (as parsed from a deps file) or semver.Version objects.
+    :arg new_versions: Mapping of collection name to the version in the new release
+    """
+    return {collection for collection, version in new_versions.items()
+            if str(previous_versions.get(collection)) != str(version)}
+
+
+class DepsFile:
+    def __init__(self, deps_file):
+        self.filename = deps_file
+
+    def parse(self):
+        """
+        Parse the exact collection versions which were included in an ACD release
+        """
+        return _parse_dependency_file(self.filename)
+
+    def write(self, acd_version, ansible_base_version, included_versions):
+        write_deps_file(self.filename, acd_version, ansible_base_version, included_versions)
+
+
 class BuildFile:
     def __init__(self, build_file):
         self.filename = build_file
@@ -46,33 +112,7 @@ class BuildFile:
         """
         Parse the build from a dependency file
         """
-        deps = {}
-        ansible_base_version = acd_version = None
-        with open(self.filename, 'r') as f:
-            for line in f:
-                record = [entry.strip() for entry in line.split(':', 1)]
-
-                if record[0] == '_acd_version':
-                    if acd_version is not None:
-                        raise InvalidFileFormat(f'{self.filename} specified _acd_version'
-                                                ' more than once')
-                    acd_version = record[1]
-                    continue
-
-                if record[0] == '_ansible_base_version':
-                    if ansible_base_version is not None:
-                        raise InvalidFileFormat(f'{self.filename} specified _ansible_base_version'
-                                                ' more' ' than once')
-                    ansible_base_version = record[1]
-                    continue
-
-                deps[record[0]] = record[1]
-
-        if ansible_base_version is None or acd_version is None:
-            raise InvalidFileFormat(f'{self.filename} was invalid.  It did not contain'
-                                    ' required fields')
-
-        return acd_version, ansible_base_version, deps
+        return _parse_dependency_file(self.filename)
 
     def write(self, acd_version, ansible_base_version, dependencies):
         """
@@ -89,3 +129,48 @@ class BuildFile:
             f.write(f'_ansible_base_version: {ansible_base_version}\n')
             f.write('\n'.join(records))
             f.write('\n')
+
+
+class LockFile:
+    """
+    Exact resolution of a build file
+
+    new-acd writes the version, artifact checksum, artifact filename, and download url of every
+    collection that it picked.  build-single can then download the artifacts straight away instead
+    of asking Galaxy for the versions and release info again.
+
+    Unlike a build file, a lock file records the full X.Y.Z ACD version.  It is only valid for that
+    release; respins resolve the build file again so that they pick up new collection releases.
+    """
+
+    def __init__(self, lock_file):
+        self.filename = lock_file
+
+    def parse(self):
+        acd_version, ansible_base_version, records = _parse_dependency_file(self.filename)
+
+        releases = {}
+        for collection, record in records.items():
+            fields = record.split()
+            if len(fields) != len(LockedRelease._fields):
+                raise InvalidFileFormat(f'{self.filename} has an invalid entry for {collection}')
+            releases[collection] = LockedRelease(*fields)
+
+        return acd_version, ansible_base_version, releases
+
+    def write(self, acd_version, ansible_base_version, releases):
+        """
+        Write a lock file
+
+        :arg releases: Mapping of collection names to :class:`LockedRelease`
+        """
+        records = []
+        for collection, release in releases.items():
+            records.append(f'{collection}: {" ".join(str(f) for f in release)}')
+        records.sort()
+
+        with open(self.filename, 'w') as f:
+            f.write(f'_acd_version: {acd_version}\n')
+            f.write(f'_ansible_base_version: {ansible_base_version}\n')
+            f.write('\n'.join(records))
+            f.write('\n')
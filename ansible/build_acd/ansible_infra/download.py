@@ -0,0 +1,221 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Download engine for collection artifacts
+
+Downloads are written to ``.part`` files which are resumed with HTTP Range requests when a
+connection drops, unless the server's response said that it does not support ranges.  Artifacts
+whose release info says that they are large are split into several byte ranges that are downloaded
+in parallel.  If the server answers a range with the whole file, it is downloaded in one piece.
+
+Resuming happens between the attempts that :func:`download_file` makes.  When a download fails for
+good, its ``.part`` files are deleted, and the build commands download into a temporary directory,
+so a later run always starts the download over.  A ``.part`` file which is already there when a
+download starts is resumed as well.
+"""
+
+import asyncio
+import hashlib
+import os
+import os.path
+
+import aiohttp
+
+from .retry import MAX_RETRIES, RetryableError, backoff_delay, check_status
+from .session import NotFound, request_info
+
+
+#: Smallest and largest number of bytes to read from a download at once
+MIN_CHUNKSIZE = 64 * 1024
+MAX_CHUNKSIZE = 4 * 1024 * 1024
+
+#: Smallest byte range that a download will be split into.  Artifacts smaller than two of these
+#: are downloaded in a single request.
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+
+#: Maximum number of byte ranges to download a single artifact in
+MAX_SEGMENTS = 4
+
+
+class DownloadFailure(Exception):
+    pass
+
+
+class _RangesNotHonored(DownloadFailure):
+    """The server sent the whole file when it was asked for part of it"""
+
+
+def _chunk_size(content_length):
+    """Pick a read size which scales with the size of the download"""
+    if not content_length:
+        return MIN_CHUNKSIZE
+    return min(MAX_CHUNKSIZE, max(MIN_CHUNKSIZE, content_length // 64))
+
+
+def _file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except FileNotFoundError:
+        return 0
+
+
+class _Segment:
+    """A byte range of a download and the part file that it is saved to"""
+
+    def __init__(self, filename, start, length, whole_file=False):
+        self.filename = filename
+        self.start = start
+        # None when the server did not tell us how large the file is
+        self.length = length
+        self.whole_file = whole_file
+        # When the segment is the whole file it can be hashed while it downloads
+        self.hasher = hashlib.sha256() if whole_file else None
+        self.hashed = 0
+        # Whether a dropped transfer can be picked up with a Range request.  This is assumed until
+        # a response from the server says otherwise.
+        self.resumable = True
+
+    def restart(self):
+        """Throw away what has been downloaded so far"""
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+        if self.hasher is not None:
+            self.hasher = hashlib.sha256()
+            self.hashed = 0
+
+    def hash_existing(self, size):
+        """Hash the first size bytes of the part file if they have not been hashed yet"""
+        if self.hasher is None or self.hashed >= size:
+            return
+        with open(self.filename, 'rb') as f:
+            f.seek(self.hashed)
+            while self.hashed < size and (chunk := f.read(min(MAX_CHUNKSIZE,
+                                                              size - self.hashed))):
+                self.hasher.update(chunk)
+                self.hashed += len(chunk)
+
+
+async def _fetch_range(aio_session, url, segment):
+    offset = _file_size(segment.filename)
+    if not segment.resumable and offset:
+        segment.restart()
+        offset = 0
+
+    # The part file may be left over from before this download started
+    segment.hash_existing(offset)
+
+    if segment.length is not None and offset >= segment.length:
+        return
+
+    headers = {}
+    if offset or not segment.whole_file:
+        end = '' if segment.length is None else segment.start + segment.length - 1
+        headers['Range'] = f'bytes={segment.start + offset}-{end}'
+
+    async with aio_session.get(url, headers=headers,
+                               trace_request_ctx=request_info('download')) as response:
+        if response.status == 404:
+            raise NotFound(f'Nothing found at: {url}')
+        check_status(response, url)
+        if response.status not in (200, 206):
+            raise DownloadFailure(f'{url} returned HTTP status {response.status}')
+
+        segment.resumable = (response.status == 206
+                             or response.headers.get('Accept-Ranges', '').lower() == 'bytes')
+        if response.status == 200:
+            if not segment.whole_file:
+                raise _RangesNotHonored(f'{url} does not honor byte range requests')
+            if headers:
+                # The server sent the whole file instead of the rest of it
+                segment.restart()
+            if segment.length is None:
+                segment.length = response.content_length
+
+        with open(segment.filename, 'ab') as f:
+            while chunk := await response.content.read(_chunk_size(segment.length)):
+                f.write(chunk)
+                if segment.hasher is not None:
+                    segment.hasher.update(chunk)
+                    segment.hashed += len(chunk)
+
+    if segment.length is not None and _file_size(segment.filename) < segment.length:
+        raise RetryableError(f'Connection closed before all of {url} was received')
+
+
+async def _fetch_segment(aio_session, url, segment):
+    """Download one segment, resuming it with backoff when the transfer fails"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await _fetch_range(aio_session, url, segment)
+        except (RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                raise DownloadFailure(f'Giving up on {url} after {MAX_RETRIES} retries: {e}')
+            await asyncio.sleep(backoff_delay(attempt, getattr(e, 'retry_after', None)))
+
+
+def _split(dest_filename, size):
+    num_segments = min(MAX_SEGMENTS, size // MIN_SEGMENT_SIZE)
+    segment_size = -(-size // num_segments)
+    return [_Segment(f'{dest_filename}.part{idx}', start, min(segment_size, size - start))
+            for idx, start in enumerate(range(0, size, segment_size))]
+
+
+async def _download_segments(aio_session, url, dest_filename, sha256sum, segments):
+    fetchers = [asyncio.ensure_future(_fetch_segment(aio_session, url, s)) for s in segments]
+    try:
+        await asyncio.gather(*fetchers)
+
+        if segments[0].whole_file:
+            hasher = segments[0].hasher
+            os.replace(segments[0].filename, dest_filename)
+        else:
+            # Join the segments, hashing them on the way
+            hasher = hashlib.sha256()
+            with open(dest_filename, 'wb') as dest:
+                for segment in segments:
+                    with open(segment.filename, 'rb') as f:
+                        while chunk := f.read(MAX_CHUNKSIZE):
+                            hasher.update(chunk)
+                            dest.write(chunk)
+                    os.unlink(segment.filename)
+
+        if hasher.hexdigest() != sha256sum:
+            raise DownloadFailure(f'{url} failed to download correctly.  Failed checksum:\n'
+                                  f'Expected: {sha256sum}\n'
+                                  f'Actual:   {hasher.hexdigest()}')
+    except BaseException:
+        # Stop the other segments before cleaning up after them
+        for fetcher in fetchers:
+            fetcher.cancel()
+        await asyncio.gather(*fetchers, return_exceptions=True)
+
+        # Do not leave a partial or corrupt file where it could be mistaken for the collection
+        for filename in [dest_filename] + [s.filename for s in segments]:
+            if os.path.exists(filename):
+                os.unlink(filename)
+        raise
+
+
+async def download_file(aio_session, url, dest_filename, sha256sum, size=None):
+    """
+    Download url to dest_filename and verify that it has the expected checksum
+
+    :kwarg size: Size of the file from the release info, if it is known.  Only files which are
+        known to be large enough are split into byte ranges, so the download of most files starts
+        with a plain GET and no round trip to find out how large they are.
+    :raises NotFound: if there is nothing at url
+    :raises DownloadFailure: if the download could not be completed or was corrupt
+    """
+    if size and size >= 2 * MIN_SEGMENT_SIZE:
+        try:
+            return await _download_segments(aio_session, url, dest_filename, sha256sum,
+                                            _split(dest_filename, size))
+        except _RangesNotHonored:
+            # Fall back to downloading the file in one piece
+            pass
+
+    await _download_segments(aio_session, url, dest_filename, sha256sum,
+                             [_Segment(f'{dest_filename}.part', 0, size, whole_file=True)])
@@ -8,119 +8,242 @@ Functions to work with Galaxy
 """
 
 import asyncio
-import hashlib
+import math
 import os.path
-from urllib.parse import urljoin
+from urllib.parse import parse_qs, urlencode, urljoin, urlsplit, urlunsplit
 
-import aiohttp
 import semantic_version as semver
 
+from .download import download_file
+from .ratelimit import PRIORITY_CRITICAL, PRIORITY_NORMAL, RequestScheduler
+from .session import NotFound, get_json
+from .versions import version_index
 
-CHUNKSIZE = 4096
+
+#: Maximum number of pages of a version listing to request at the same time
+MAX_CONCURRENT_PAGES = 8
 
 
 class NoSuchCollection(Exception):
     pass
 
-class DownloadFailure(Exception):
-    pass
 
+def _page_number(url):
+    """Return the page number that a paginated Galaxy url refers to or None if it has none"""
+    page = parse_qs(urlsplit(url).query).get('page')
+    if page and page[0].isdigit():
+        return int(page[0])
+    return None
 
-class GalaxyClient:
-    def __init__(self, galaxy_server, aio_session):
-        self.galaxy_server = galaxy_server
-        self.aio_session = aio_session
-        self.params = {'format': 'json'}
 
-    async def _get_galaxy_versions(self, galaxy_url):
-        async with self.aio_session.get(galaxy_url, params=self.params) as response:
-            if response.status == 404:
-                raise NoSuchCollection(f'No collection found at: {galaxy_url}')
-            collection_info = await response.json()
+def _set_page_number(url, page):
+    """Return url modified to refer to a different page of results"""
+    url_parts = urlsplit(url)
+    query = parse_qs(url_parts.query)
+    query['page'] = [str(page)]
+    return urlunsplit(url_parts._replace(query=urlencode(query, doseq=True)))
 
-        versions = []
-        for version_record in collection_info['results']:
-            versions.append(version_record['version'])
 
-        if collection_info['next']:
-            versions.extend(await self._get_galaxy_versions(collection_info['next']))
+class GalaxyClient:
+    """
+    Client for the Galaxy API
+
+    Requests to the API are paced by a :class:`~ansible_infra.ratelimit.RequestScheduler` so that
+    we back off when Galaxy throttles us.  The methods which make requests take a priority
+    (one of the ``PRIORITY_*`` constants in :mod:`ansible_infra.ratelimit`) which decides which
+    waiting request goes first.  Artifact downloads are not paced.
 
-        return versions
+    A client is meant to be shared by every step of a command.  Each API document is only requested
+    once per client, so the steps which look at the same releases do not fetch them again.
+    """
 
-    async def get_versions(self, collection):
+    def __init__(self, galaxy_server, aio_session, artifact_cache=None, metadata_cache=None,
+                 scheduler=None):
+        self.galaxy_server = galaxy_server
+        self.aio_session = aio_session
+        self.artifact_cache = artifact_cache
+        self.metadata_cache = metadata_cache
+        self.scheduler = scheduler or RequestScheduler()
+        self.params = {'format': 'json'}
+        # Mapping of url to the future of its document
+        self._documents = {}
+
+    async def _get_json(self, galaxy_url, priority=PRIORITY_NORMAL):
+        document = self._documents.get(galaxy_url)
+        if document is None:
+            document = asyncio.ensure_future(self._fetch_json(galaxy_url, priority))
+            self._documents[galaxy_url] = document
+
+        try:
+            # Shielded so that one caller being cancelled does not cancel it for the others
+            return await asyncio.shield(document)
+        except Exception:
+            # Let the next caller try again
+            if self._documents.get(galaxy_url) is document:
+                del self._documents[galaxy_url]
+            raise
+
+    async def _fetch_json(self, galaxy_url, priority):
+        try:
+            return await get_json(self.aio_session, galaxy_url, params=self.params,
+                                  metadata_cache=self.metadata_cache, scheduler=self.scheduler,
+                                  priority=priority)
+        except NotFound:
+            raise NoSuchCollection(f'No collection found at: {galaxy_url}')
+
+    async def _get_galaxy_versions(self, galaxy_url, priority=PRIORITY_NORMAL):
+        """
+        Retrieve all of the versions from a paginated Galaxy versions listing
+
+        The first page tells us how many versions there are so the remaining pages are requested
+        concurrently (at most MAX_CONCURRENT_PAGES at a time) instead of following the next links
+        one by one.
+        """
+        collection_info = await self._get_json(galaxy_url, priority)
+        versions = [r['version'] for r in collection_info['results']]
+
+        next_url = collection_info['next']
+        page_size = len(collection_info['results'])
+        if next_url and page_size and _page_number(next_url) is not None:
+            num_pages = math.ceil(collection_info['count'] / page_size)
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+
+            async def get_page(page_url):
+                async with semaphore:
+                    try:
+                        return await self._get_json(page_url, priority)
+                    except NoSuchCollection:
+                        # Galaxy answers pages past the end of the listing with a 404.  The count
+                        # was too big.
+                        return None
+
+            page_numbers = range(2, num_pages + 1)
+            pages = await asyncio.gather(*(get_page(_set_page_number(next_url, page))
+                                           for page in page_numbers))
+            pages = [page_info for page_info in pages if page_info is not None]
+            for page_info in pages:
+                versions.extend(r['version'] for r in page_info['results'])
+
+            # If versions were published while we were fetching, there may be more pages than the
+            # first page said.  Pick those up below.  When the count was too small for there to be
+            # any more pages, next_url is still the second page and is followed from there.
+            if page_numbers:
+                next_url = pages[-1]['next'] if pages else None
+
+        # Sequential fallback for pages that we could not request up front
+        while next_url:
+            try:
+                page_info = await self._get_json(next_url, priority)
+            except NoSuchCollection:
+                # The listing shrank while we were reading it
+                break
+            versions.extend(r['version'] for r in page_info['results'])
+            next_url = page_info['next']
+
+        # Releases that were published while paging can shift an entry onto two pages
+        return list(dict.fromkeys(versions))
+
+    async def get_versions(self, collection, priority=PRIORITY_NORMAL):
         collection = collection.replace('.', '/')
         galaxy_url = urljoin(self.galaxy_server, f'api/v2/collections/{collection}/versions/')
-        retval = await self._get_galaxy_versions(galaxy_url)
+        retval = await self._get_galaxy_versions(galaxy_url, priority)
         return retval
 
-    async def get_info(self, collection):
+    async def get_info(self, collection, priority=PRIORITY_NORMAL):
         collection = collection.replace('.', '/')
         galaxy_url = urljoin(self.galaxy_server, f'api/v2/collections/{collection}/')
 
-        async with self.aio_session.get(galaxy_url, params=self.params) as response:
-            if response.status == 404:
-                raise NoSuchCollection(f'No collection found at: {galaxy_url}')
-            collection_info = await response.json()
-
-        return collection_info
+        return await self._get_json(galaxy_url, priority)
 
-    async def get_release_info(self, collection, version):
+    async def get_release_info(self, collection, version, priority=PRIORITY_NORMAL):
         collection = collection.replace('.', '/')
         galaxy_url = urljoin(self.galaxy_server,
                              f'api/v2/collections/{collection}/versions/{version}/')
 
-        async with self.aio_session.get(galaxy_url, params=self.params) as response:
-            if response.status == 404:
-                raise NoSuchCollection(f'No collection found at: {galaxy_url}')
-            collection_info = await response.json()
-
-        return collection_info
+        return await self._get_json(galaxy_url, priority)
 
     async def get_release(self, collection, version, dest_dir):
         collection = collection.replace('.', '/')
-        release_info = await self.get_release_info(collection, version)
-        release_url = release_info['download_url']
+        # A download is waiting on this so it goes ahead of metadata lookups
+        release_info = await self.get_release_info(collection, version, PRIORITY_CRITICAL)
+        return await self.download_artifact(release_info['download_url'],
+                                            release_info['artifact']['filename'],
+                                            release_info['artifact']['sha256'], dest_dir,
+                                            size=release_info['artifact'].get('size'))
 
-        download_filename = os.path.join(dest_dir, release_info['artifact']['filename'])
-        sha256sum = release_info['artifact']['sha256']
+    async def download_artifact(self, release_url, filename, sha256sum, dest_dir, size=None):
+        """
+        Download a collection artifact whose release info is already known
 
-        async with self.aio_session.get(release_url) as response:
-            if response.status == 404:
-                raise NoSuchCollection(f'No collection found at: {release_url}')
+        :kwarg size: Size of the artifact in bytes if the release info gave it
 
-            with open(download_filename, 'wb') as f:
-                while chunk := await response.content.read(CHUNKSIZE):
-                    f.write(chunk)
+        :returns: The filename that the artifact was saved to
+        """
+        download_filename = os.path.join(dest_dir, filename)
 
-        # Verify the download
-        hasher = hashlib.sha256()
-        with open(download_filename, 'rb') as f:
-            while chunk := f.read(CHUNKSIZE):
-                hasher.update(chunk)
-        if hasher.hexdigest() != sha256sum:
-            raise DownloadFailure(f'{release_url} failed to download correctly.  Failed checksum:\n'
-                                  f'Expected: {sha256sum}\n'
-                                  f'Actual:   {hasher.hexdigest()}')
+        if self.artifact_cache and self.artifact_cache.retrieve(sha256sum, download_filename):
+            return download_filename
 
+        try:
+            await download_file(self.aio_session, release_url, download_filename, sha256sum,
+                                size=size)
+        except NotFound:
+            raise NoSuchCollection(f'No collection found at: {release_url}')
 
-class CollectionDownloader:
-    def __init__(self, galaxy_server, aio_session, download_dir):
-        self.galaxy_client = GalaxyClient(galaxy_server, aio_session)
-        self.download_dir = download_dir
+        if self.artifact_cache:
+            self.artifact_cache.store(sha256sum, download_filename)
 
-    async def _get_latest_matching_version(self, collection, version_spec):
-        versions = await self.galaxy_client.get_versions(collection)
-        versions = [semver.Version(v) for v in versions]
-        versions.sort(reverse=True)
+        return download_filename
 
-        spec = semver.SimpleSpec(version_spec)
-        for version in (v for v in versions if v in spec):
-            return version
 
-        # No matching versions were found
+class CollectionDownloader:
+    def __init__(self, galaxy_client, locked_releases=None):
+        self.galaxy_client = galaxy_client
+        self.locked_releases = locked_releases or {}
+
+    def _locked_release(self, collection, version_spec):
+        """Return the release pinned by the lock file if it satisfies version_spec"""
+        locked = self.locked_releases.get(collection)
+        if locked is not None and semver.Version(locked.version) in semver.SimpleSpec(version_spec):
+            return locked
         return None
 
+    async def get_latest_matching_version(self, collection, version_spec):
+        # Downloads wait on this so it goes ahead of metadata lookups
+        versions = await self.galaxy_client.get_versions(collection, PRIORITY_CRITICAL)
+        index = version_index(collection, versions, self.galaxy_client.metadata_cache)
+        return index.latest_matching(semver.SimpleSpec(version_spec))
+
+    async def resolve(self, collection, version_spec):
+        """
+        Return the version of a collection to use for version_spec
+
+        This is the version from the lock file when there is one, otherwise the latest version
+        which matches.
+        """
+        if (locked := self._locked_release(collection, version_spec)) is not None:
+            return semver.Version(locked.version)
+        return await self.get_latest_matching_version(collection, version_spec)
+
+    async def download(self, collection, version_spec, dest_dir):
+        """
+        Download the version of a collection which matches version_spec
+
+        If the lock file pinned a version which matches, it is downloaded without asking Galaxy for
+        the versions or release info.
+
+        :returns: A tuple of the version that was downloaded and the filename it was saved to
+        """
+        if (locked := self._locked_release(collection, version_spec)) is not None:
+            filename = await self.galaxy_client.download_artifact(locked.download_url,
+                                                                  locked.filename, locked.sha256,
+                                                                  dest_dir)
+            return semver.Version(locked.version), filename
+
+        version = await self.get_latest_matching_version(collection, version_spec)
+        filename = await self.galaxy_client.get_release(collection, version, dest_dir)
+        return version, filename
+
     async def retrieve(self, collection, version_spec, dest_dir):
-        version = await self._get_latest_matching_version(collection, version_spec)
-        await self.galaxy_client.get_release(collection, version, dest_dir)
+        version, _filename = await self.download(collection, version_spec, dest_dir)
         return version
@@ -0,0 +1,85 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Install collection tarballs without running ansible-galaxy
+"""
+
+import json
+import os
+import os.path
+import shutil
+import tarfile
+
+
+#: Size of the buffer used when copying files out of a tarball
+COPY_BUFSIZE = 1024 * 1024
+
+
+class InvalidCollection(Exception):
+    pass
+
+
+def _member_path(collection_dir, member_name):
+    """Return where a tarball member will be written, refusing anything outside collection_dir"""
+    dest = os.path.normpath(os.path.join(collection_dir, member_name))
+    if os.path.isabs(member_name) or os.path.commonpath([collection_dir, dest]) != collection_dir:
+        raise InvalidCollection(f'{member_name} would be installed outside of {collection_dir}')
+    return dest
+
+
+def install_collection(tarball, collections_dir):
+    """
+    Install a collection tarball the same way that ``ansible-galaxy collection install`` does
+
+    The collection is extracted into ``collections_dir/ansible_collections/NAMESPACE/NAME``, using
+    the namespace and name from the collection's MANIFEST.json.  The tarball must already have been
+    verified.
+
+    :returns: The namespace.name of the collection which was installed
+    :raises InvalidCollection: if the tarball is not a collection or tries to write files outside
+        of the collection's directory
+    """
+    with tarfile.open(tarball, 'r:gz') as tar:
+        try:
+            with tar.extractfile('MANIFEST.json') as f:
+                collection_info = json.load(f)['collection_info']
+        except (KeyError, ValueError):
+            raise InvalidCollection(f'{tarball} does not contain a valid MANIFEST.json')
+
+        namespace = collection_info['namespace']
+        name = collection_info['name']
+        collection_dir = os.path.abspath(os.path.join(collections_dir, 'ansible_collections',
+                                                      namespace, name))
+        if os.path.exists(collection_dir):
+            shutil.rmtree(collection_dir)
+        os.makedirs(collection_dir, mode=0o755)
+
+        for member in tar:
+            if member.name in ('.', './'):
+                continue
+            dest = _member_path(collection_dir, member.name)
+
+            if member.isdir():
+                os.makedirs(dest, mode=0o755, exist_ok=True)
+
+            elif member.isfile():
+                os.makedirs(os.path.dirname(dest), mode=0o755, exist_ok=True)
+                with tar.extractfile(member) as src, open(dest, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+                # ansible-galaxy only preserves whether the file is executable
+                os.chmod(dest, 0o755 if member.mode & 0o111 else 0o644)
+
+            elif member.issym():
+                _member_path(collection_dir,
+                             os.path.join(os.path.dirname(member.name), member.linkname))
+                os.makedirs(os.path.dirname(dest), mode=0o755, exist_ok=True)
+                os.symlink(member.linkname, dest)
+
+            else:
+                raise InvalidCollection(f'{tarball} contains {member.name} which is not a'
+                                        ' regular file, directory, or symlink')
+
+    return f'{namespace}.{name}'
@@ -0,0 +1,41 @@
+#!/usr/bin/python -tt
+
+from setuptools import setup
+
+
+__version__ = '${version}'
+__author__ = 'Ansible, Inc.'
+
+
+setup(
+    name='${dist_name}',
+    version=__version__,
+    description='Radically simple IT automation',
+    author=__author__,
+    author_email='info@ansible.com',
+    url='https://ansible.com/',
+    project_urls={
+        'Bug Tracker': 'https://github.com/ansible/ansible/issues',
+        'Code of Conduct': 'https://docs.ansible.com/ansible/latest/community/code_of_conduct.html',
+        'Documentation': 'https://docs.ansible.com/ansible/',
+        'Mailing lists': 'https://docs.ansible.com/ansible/latest/community/communication.html#mailing-list-information',
+        'Source Code': 'https://github.com/ansible/ansible',
+    },
+    license='GPLv3+',
+    python_requires='>=2.7,!=3.0.*,!=3.1.*,!=3.2.*,!=3.3.*,!=3.4.*',
+    install_requires=${install_requires},
+    packages=[],
+    classifiers=[
+        'Development Status :: 5 - Production/Stable',
+        'Environment :: Console',
+        'Intended Audience :: Developers',
+        'Intended Audience :: Information Technology',
+        'Intended Audience :: System Administrators',
+        'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
+        'Natural Language :: English',
+        'Operating System :: POSIX',
+        'Topic :: System :: Installation/Setup',
+        'Topic :: System :: Systems Administration',
+        'Topic :: Utilities',
+    ],
+)
@@ -0,0 +1,230 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Build the Python distributions of an ACD release
+
+A single-file ACD is one distribution which contains all of the collections.  A multi-file ACD is
+one distribution per collection plus an ``ansible`` meta-package which depends on ansible-base and
+on each of the collection distributions at the exact version which was included in the release.
+"""
+
+import os
+import os.path
+import pkgutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from mako.template import Template
+
+from .cache import DEFAULT_PACKAGE_CACHE_SIZE, evict_least_recently_used, link_or_copy
+from .scan import scan_collections, scan_tree
+from .sdist import TreeBlockCache, pkg_info, python_packages, write_sdist
+
+
+MANIFEST_IN = b'graft ansible_collections\nglobal-exclude *.py[cod]\n'
+
+#: Distribution name of the meta-package of a multi-file ACD.  It is not ``ansible`` so that it
+#: does not overwrite the single-file ACD when both are built into the same directory.
+META_DIST_NAME = 'ansible-meta'
+
+
+def collection_dist_name(collection):
+    """Return the name of the Python distribution which contains a collection"""
+    namespace, name = collection.split('.', 1)
+    return f'ansible-collection-{namespace}-{name}'
+
+
+def sdist_filename(dist_name, version):
+    return f'{dist_name}-{version}.tar.gz'
+
+
+def build_collection_sdist(collection, version, collection_dir, dest_dir, manifest=None):
+    """
+    Build the sdist for one collection from its installed directory
+
+    :arg collection: namespace.name of the collection
+    :arg version: Version of the collection
+    :arg collection_dir: Directory the collection was installed into
+        (``.../ansible_collections/NAMESPACE/NAME``)
+    :arg dest_dir: Directory to write the sdist to
+    :kwarg manifest: The :func:`~ansible_infra.scan.scan_tree` manifest of collection_dir if it
+        has already been scanned
+    :returns: Filename of the sdist
+    """
+    namespace, name = collection.split('.', 1)
+    dist_name = collection_dist_name(collection)
+    if manifest is None:
+        manifest = scan_tree(collection_dir)
+
+    packages = ['ansible_collections', f'ansible_collections.{namespace}']
+    packages.extend(python_packages(manifest, toplevel=f'ansible_collections.{namespace}.{name}'))
+
+    setup_tmpl = Template(pkgutil.get_data('ansible_infra', 'collection_setup_py.mk')
+                          .decode('utf-8'))
+    setup_contents = setup_tmpl.render(dist_name=dist_name, version=version,
+                                       collection=collection, namespace=namespace, name=name,
+                                       python_packages=repr(packages))
+
+    generated_files = {
+        'setup.py': setup_contents.encode('utf-8'),
+        'MANIFEST.in': MANIFEST_IN,
+        'PKG-INFO': pkg_info(dist_name, version,
+                             f'The {collection} collection for the Ansible Community'
+                             ' Distribution',
+                             f'https://galaxy.ansible.com/{namespace}/{name}'),
+    }
+
+    filename = os.path.join(dest_dir, sdist_filename(dist_name, version))
+    write_sdist(filename, f'{dist_name}-{version}', generated_files,
+                trees=[(f'ansible_collections/{namespace}/{name}', collection_dir, manifest)])
+    return filename
+
+
+def build_meta_sdist(acd_version, ansible_base_version, included_versions, dest_dir):
+    """
+    Build the :data:`META_DIST_NAME` meta-package which pulls in all of the collection
+    distributions
+
+    :returns: Filename of the sdist
+    """
+    install_requires = [f'ansible-base>={ansible_base_version}']
+    install_requires.extend(f'{collection_dist_name(collection)}=={version}'
+                            for collection, version in sorted(included_versions.items()))
+
+    setup_tmpl = Template(pkgutil.get_data('ansible_infra', 'meta_setup_py.mk').decode('utf-8'))
+    setup_contents = setup_tmpl.render(dist_name=META_DIST_NAME, version=acd_version,
+                                       install_requires=repr(install_requires))
+
+    generated_files = {
+        'setup.py': setup_contents.encode('utf-8'),
+        'COPYING': pkgutil.get_data('ansible_infra', 'gplv3.txt'),
+        'README': pkgutil.get_data('ansible_infra', 'acd-readme.txt'),
+        'PKG-INFO': pkg_info(META_DIST_NAME, acd_version, 'Radically simple IT automation',
+                             'https://ansible.com/'),
+    }
+
+    filename = os.path.join(dest_dir, sdist_filename(META_DIST_NAME, acd_version))
+    write_sdist(filename, f'{META_DIST_NAME}-{acd_version}', generated_files)
+    return filename
+
+
+def build_acd_sdist(acd_version, ansible_base_version, ansible_dir, included_versions, dest_dir,
+                    block_cache=None, max_workers=None):
+    """
+    Build the single-file ACD sdist straight from the build tree
+
+    :arg ansible_dir: The build tree which the collections were installed into
+    :arg included_versions: Mapping of the collections in the build tree to their versions
+    :arg block_cache: A :class:`~ansible_infra.sdist.TreeBlockCache`.  Collections which were
+        packed by an earlier build of this ACD version are copied from it without compressing them
+        again.
+    :kwarg max_workers: Number of collections to compress at the same time.  zlib does not hold
+        the GIL while it compresses so these run in threads.
+    :returns: Filename of the sdist
+    """
+    base_dir = f'ansible-{acd_version}'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if block_cache is None:
+            block_cache = TreeBlockCache(tmp_dir)
+
+        arcnames = {}
+        for collection in included_versions:
+            namespace, name = collection.split('.', 1)
+            arcnames[collection] = f'{base_dir}/ansible_collections/{namespace}/{name}'
+
+        # Only the collections which have not been packed before need to be scanned
+        manifests = scan_collections(ansible_dir,
+                                     collections=[c for c, v in included_versions.items()
+                                                  if not block_cache.has(c, v, arcnames[c])])
+
+        def get_block(collection):
+            namespace, name = collection.split('.', 1)
+            collection_dir = os.path.join(ansible_dir, 'ansible_collections', namespace, name)
+            return block_cache.get(collection, included_versions[collection],
+                                   arcnames[collection], collection_dir,
+                                   manifest=manifests.get(collection))
+
+        collections = sorted(included_versions)
+        with ThreadPoolExecutor(max_workers=max_workers
+                                or min(32, (os.cpu_count() or 1) + 4)) as pool:
+            blocks = list(pool.map(get_block, collections))
+
+        packages = {'ansible_collections'}
+        for collection, block in zip(collections, blocks):
+            namespace, name = collection.split('.', 1)
+            toplevel = f'ansible_collections.{namespace}.{name}'
+            packages.update((f'ansible_collections.{namespace}', toplevel))
+            packages.update(f'{toplevel}.{d.replace("/", ".")}' for d in block.directories)
+
+        install_requires = [f'ansible-base>={ansible_base_version}']
+        setup_tmpl = Template(pkgutil.get_data('ansible_infra', 'setup_py.mk').decode('utf-8'))
+        setup_contents = setup_tmpl.render(version=acd_version,
+                                           install_requires=repr(install_requires),
+                                           python_packages=repr(sorted(packages)))
+
+        generated_files = {
+            'setup.py': setup_contents.encode('utf-8'),
+            'MANIFEST.in': b'include COPYING README\n' + MANIFEST_IN,
+            'COPYING': pkgutil.get_data('ansible_infra', 'gplv3.txt'),
+            'README': pkgutil.get_data('ansible_infra', 'acd-readme.txt'),
+            'PKG-INFO': pkg_info('ansible', acd_version, 'Radically simple IT automation',
+                                 'https://ansible.com/'),
+        }
+
+        filename = os.path.join(dest_dir, sdist_filename('ansible', acd_version))
+        write_sdist(filename, base_dir, generated_files, blocks=blocks)
+
+    block_cache.evict()
+    return filename
+
+
+class PackageCache:
+    """
+    Cache of collection sdists that have already been built
+
+    Packages are keyed by collection and version so a new ACD release only has to build the
+    collections whose version changed.  Using a package updates its mtime so that, when the cache
+    grows larger than max_size bytes, :meth:`evict` can remove the least recently used packages
+    first.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_PACKAGE_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _package_path(self, collection, version):
+        return os.path.join(self.cache_dir, collection, str(version),
+                            sdist_filename(collection_dist_name(collection), version))
+
+    def has(self, collection, version):
+        return os.path.exists(self._package_path(collection, version))
+
+    def retrieve(self, collection, version, dest_dir):
+        """Place the cached sdist for collection into dest_dir and return its filename"""
+        package = self._package_path(collection, version)
+        filename = os.path.join(dest_dir, os.path.basename(package))
+        if os.path.exists(filename):
+            os.unlink(filename)
+        # Mark the package as recently used
+        os.utime(package)
+        link_or_copy(package, filename)
+        return filename
+
+    def store(self, collection, version, filename):
+        package = self._package_path(collection, version)
+        os.makedirs(os.path.dirname(package), exist_ok=True)
+        tmp_filename = f'{package}.{os.getpid()}.tmp'
+        link_or_copy(filename, tmp_filename)
+        os.replace(tmp_filename, package)
+
+    def evict(self):
+        """
+        Remove least recently used packages until the cache fits within max_size
+
+        This is left to the caller so that the packages of a release are not evicted before all
+        of them have been retrieved.
+        """
+        evict_least_recently_used(self.cache_dir, self.max_size)
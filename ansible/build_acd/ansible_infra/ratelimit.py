@@ -0,0 +1,144 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Pace the requests made to an API which rate limits its clients
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from .retry import parse_retry_after
+
+
+#: Requests which something is waiting on right now, like the release info of a download
+PRIORITY_CRITICAL = 0
+#: Ordinary metadata lookups
+PRIORITY_NORMAL = 1
+#: Speculative lookups whose results may not be needed
+PRIORITY_BACKGROUND = 2
+
+#: Requests per second to start at, the range that the rate is tuned within, and how many
+#: requests may be sent at once after a quiet period
+DEFAULT_RATE = 50.0
+MIN_RATE = 0.5
+MAX_RATE = 200.0
+DEFAULT_BURST = 20
+
+#: Requests per second added to the rate after each successful request
+RATE_INCREASE = 1.0
+
+
+def _rate_limit_headers(headers):
+    """Return the (remaining requests, seconds until the limit resets) that a server sent"""
+    for prefix in ('X-RateLimit-', 'RateLimit-'):
+        remaining = headers.get(f'{prefix}Remaining')
+        reset = headers.get(f'{prefix}Reset')
+        if remaining is None or reset is None:
+            continue
+        try:
+            remaining = int(remaining)
+            reset = float(reset)
+        except ValueError:
+            return None
+        # Some servers send the time of the reset instead of the seconds until it
+        if reset > 1000000000:
+            reset = reset - time.time()
+        return remaining, max(reset, 0)
+    return None
+
+
+class RequestScheduler:
+    """
+    Adaptive token bucket which hands out request slots in priority order
+
+    Tokens refill at rate per second up to burst.  Waiting requests are let through in order of
+    priority, and in the order they arrived within a priority.  The rate adapts to the server:
+    it grows a little after every successful request, halves when the server answers 429, and is
+    lowered to what the server's rate limit headers say is left of the limit.  While the server
+    has asked us to wait with Retry-After, nothing is let through.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=MIN_RATE,
+                 max_rate=MAX_RATE):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def _dispatch(self):
+        self._timer = None
+        now = self._refill()
+
+        delay = None
+        while self._waiters:
+            waiter = self._waiters[0][2]
+            if waiter.done():
+                # The request was cancelled while it waited
+                heapq.heappop(self._waiters)
+                continue
+
+            if now < self._paused_until:
+                delay = self._paused_until - now
+                break
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                break
+
+            self._tokens -= 1
+            heapq.heappop(self._waiters)
+            waiter.set_result(None)
+
+        if delay is not None:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _reschedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    async def acquire(self, priority=PRIORITY_NORMAL):
+        """Wait until a request of the given priority may be sent"""
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._reschedule()
+        await waiter
+
+    def observe(self, response):
+        """Adjust the rate to what a response says about the server's rate limit"""
+        self._refill()
+        if response.status == 429:
+            self.rate = max(self.min_rate, self.rate / 2)
+            retry_after = parse_retry_after(response.headers)
+            self._paused_until = time.monotonic() + (1 / self.rate if retry_after is None
+                                                     else retry_after)
+            # Whatever had accumulated in the bucket is what got us throttled
+            self._tokens = 0
+        elif response.status < 400:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+
+        if (limits := _rate_limit_headers(response.headers)) is not None:
+            remaining, reset = limits
+            if remaining == 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + reset)
+            else:
+                self.rate = max(self.min_rate, min(self.rate, remaining / max(reset, 1)))
+
+        if self._waiters:
+            self._reschedule()
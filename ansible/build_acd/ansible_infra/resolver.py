@@ -0,0 +1,107 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Close a set of collections over the dependencies declared in their Galaxy metadata
+"""
+
+import asyncio
+from collections import defaultdict
+
+import semantic_version as semver
+
+from .versions import version_index
+
+
+class DependencyConflict(Exception):
+    pass
+
+
+def _combined_spec(requirements):
+    """Return a SimpleSpec which only matches versions allowed by every requirement"""
+    specs = [spec for spec, _required_by in requirements if spec.strip() not in ('', '*')]
+    return semver.SimpleSpec(','.join(specs) if specs else '*')
+
+
+def _describe(requirements):
+    return ', '.join(f'{spec} (from {required_by})' for spec, required_by in requirements)
+
+
+class DependencyResolver:
+    """
+    Walk the dependency graph of a set of collections breadth-first
+
+    Every level of the graph is expanded at once: the release info of all of the collections in
+    the frontier is fetched concurrently, then the versions of all of the newly found dependencies.
+    Each collection is only visited once.  A dependency is satisfied with the newest version which
+    matches all of the ranges requested for it at that level.  If a collection which was already
+    chosen does not satisfy a range found later, :exc:`DependencyConflict` is raised.
+
+    When a :class:`~ansible_infra.compat.CompatibilityChecker` is given, dependencies are only
+    satisfied with versions which are compatible with its ansible-base version.
+    """
+
+    def __init__(self, galaxy_client, metadata_cache=None, compatibility_checker=None):
+        self.galaxy_client = galaxy_client
+        self.metadata_cache = metadata_cache
+        self.compatibility_checker = compatibility_checker
+
+    async def _dependencies(self, collection, version):
+        release_info = await self.galaxy_client.get_release_info(collection, version)
+        return (release_info.get('metadata') or {}).get('dependencies') or {}
+
+    async def _pick(self, collection, requirements):
+        versions = await self.galaxy_client.get_versions(collection)
+        index = version_index(collection, versions, self.metadata_cache)
+        spec = _combined_spec(requirements)
+        if self.compatibility_checker is None:
+            version = index.latest_matching(spec)
+        else:
+            version = await self.compatibility_checker.latest_compatible(collection, index, spec)
+
+        if version is None:
+            compatible = ''
+            if self.compatibility_checker is not None:
+                compatible = (' compatible with ansible-base'
+                              f' {self.compatibility_checker.ansible_base_version}')
+            raise DependencyConflict(f'No version of {collection}{compatible} satisfies all of'
+                                     f' {_describe(requirements)}')
+        return version
+
+    async def resolve(self, collections):
+        """
+        Add the dependencies of collections, and their dependencies, to the set of collections
+
+        :arg collections: Mapping of collection names to the semantic_version.Version chosen for
+            them.  These versions are never changed.
+        :returns: A new mapping of collection names to versions which contains collections and
+            all of their transitive dependencies
+        """
+        selected = dict(collections)
+        requirements = defaultdict(list)
+        frontier = list(selected.items())
+
+        while frontier:
+            dependencies = await asyncio.gather(*(self._dependencies(c, v) for c, v in frontier))
+
+            new_collections = []
+            for (collection, version), deps in zip(frontier, dependencies):
+                for dep, spec in deps.items():
+                    requirements[dep].append((spec, f'{collection} {version}'))
+                    if dep not in selected and dep not in new_collections:
+                        new_collections.append(dep)
+
+            # Ranges found at this level must also hold for the collections chosen earlier
+            for dep, dep_requirements in requirements.items():
+                if dep in selected and selected[dep] not in _combined_spec(dep_requirements):
+                    raise DependencyConflict(f'{dep} {selected[dep]} does not satisfy'
+                                             f' {_describe(dep_requirements)}')
+
+            versions = await asyncio.gather(*(self._pick(dep, requirements[dep])
+                                              for dep in new_collections))
+            selected.update(zip(new_collections, versions))
+            frontier = list(zip(new_collections, versions))
+
+        return selected
@@ -0,0 +1,127 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Retry failed requests and keep the results of the ones which succeeded
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+
+import aiohttp
+
+
+#: Number of times to retry a request before giving up
+MAX_RETRIES = 5
+
+#: Base delay (in seconds) of the exponential backoff between attempts and the longest that we
+#: will wait between attempts, even if the server asks for longer
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 60
+
+#: HTTP statuses which mean that the same request may succeed later
+RETRYABLE_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class RetryableError(Exception):
+    """A request failed in a way that may succeed if it is tried again"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PartialFailure(Exception):
+    """
+    Some of a group of tasks failed
+
+    :ivar results: Mapping of the names of the tasks which succeeded to their results
+    :ivar failures: Mapping of the names of the tasks which failed to their exceptions
+    """
+
+    def __init__(self, results, failures):
+        self.results = results
+        self.failures = failures
+        super().__init__(f'{len(failures)} of {len(results) + len(failures)} failed: '
+                         + ', '.join(sorted(failures)))
+
+
+def parse_retry_after(headers):
+    """Return the seconds that a Retry-After header asks us to wait or None if there isn't one"""
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+
+    if value.strip().isdigit():
+        return int(value)
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, retry_at.timestamp() - time.time())
+
+
+def check_status(response, url):
+    """Raise :exc:`RetryableError` if a response means that the request should be tried again"""
+    if response.status in RETRYABLE_STATUSES:
+        raise RetryableError(f'{url} returned HTTP status {response.status}',
+                             retry_after=parse_retry_after(response.headers))
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Return how long to wait before retrying
+
+    The server's Retry-After is honored when it gave one.  Otherwise the delay is exponential
+    backoff with full jitter so that many clients which failed at once do not retry in lockstep.
+    """
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY)
+    return random.uniform(0, min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** attempt))
+
+
+async def with_retries(func, *args, retries=MAX_RETRIES, **kwargs):
+    """
+    Await func(*args, **kwargs), calling it again when it fails with a retryable error
+
+    :raises: The last error if func still fails after retries more attempts
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await func(*args, **kwargs)
+        except (RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, getattr(e, 'retry_after', None)))
+
+
+async def gather_all(awaitables):
+    """
+    Wait for all of a mapping of names to awaitables even if some of them fail
+
+    :returns: Mapping of the names to the results
+    :raises PartialFailure: after everything has finished if any of the awaitables failed.  It
+        carries the results of the ones which succeeded.
+    """
+    names = list(awaitables)
+    outcomes = await asyncio.gather(*awaitables.values(), return_exceptions=True)
+
+    results = {}
+    failures = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            failures[name] = outcome
+        elif isinstance(outcome, BaseException):
+            # Cancellation and interrupts are not a failure of the task
+            raise outcome
+        else:
+            results[name] = outcome
+
+    if failures:
+        raise PartialFailure(results, failures)
+    return results
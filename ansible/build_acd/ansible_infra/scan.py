@@ -0,0 +1,120 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Scan build trees into manifests of the files they contain
+"""
+
+import hashlib
+import os
+import os.path
+import stat
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+#: Size of the buffer used when checksumming files
+HASH_BUFSIZE = 1024 * 1024
+
+FILE = 'f'
+DIR = 'd'
+SYMLINK = 'l'
+
+#: One entry in a manifest.  path is relative to the directory which was scanned.  mode is
+#: normalized to what ansible-galaxy installs (0o755 or 0o644 for files).  sha256 is None unless
+#: checksums were asked for and linkname is empty for anything but a symlink.
+ManifestEntry = namedtuple('ManifestEntry', ('path', 'kind', 'size', 'mode', 'sha256', 'linkname'))
+
+
+def _sha256(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        while chunk := f.read(HASH_BUFSIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _scan(directory, relative, checksum, entries):
+    with os.scandir(directory) as it:
+        dir_entries = sorted(it, key=lambda e: e.name)
+
+    for entry in dir_entries:
+        rel_path = f'{relative}{entry.name}'
+        if entry.is_symlink():
+            entries.append(ManifestEntry(rel_path, SYMLINK, 0, 0o777, None,
+                                         os.readlink(entry.path)))
+        elif entry.is_dir():
+            entries.append(ManifestEntry(rel_path, DIR, 0, 0o755, None, ''))
+            _scan(entry.path, f'{rel_path}/', checksum, entries)
+        else:
+            st = entry.stat()
+            mode = 0o755 if st.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH) else 0o644
+            entries.append(ManifestEntry(rel_path, FILE, st.st_size, mode,
+                                         _sha256(entry.path) if checksum else None, ''))
+
+
+def scan_tree(directory, checksum=False):
+    """
+    Return the manifest of everything beneath directory
+
+    The entries are sorted by name with each directory coming before its contents, which is the
+    order they are written into a tarball in.
+    """
+    entries = []
+    _scan(directory, '', checksum, entries)
+    return entries
+
+
+def _scan_namespace(namespace_dir, names, checksum):
+    return {name: scan_tree(os.path.join(namespace_dir, name), checksum=checksum)
+            for name in names}
+
+
+def scan_collections(ansible_dir, collections=None, checksum=False, max_workers=None):
+    """
+    Return the manifests of the collections installed in a build tree
+
+    Every namespace is scanned by its own worker thread.  The threads only overlap while they
+    wait on the filesystem (scandir, stat, readlink, and the reads and digests of hashing release
+    the GIL).  The Python code in between still runs one thread at a time, so this helps most on a
+    cold cache, a network filesystem, or when checksumming.
+
+    :arg ansible_dir: The build tree.  Collections are in its ``ansible_collections`` directory.
+    :kwarg collections: The namespace.name of the collections to scan.  By default, every
+        collection in the tree is scanned.
+    :kwarg checksum: Whether to record the sha256 of every file.  This reads every byte of the
+        tree so it is off by default.
+    :returns: Dict mapping namespace.name to the collection's manifest, sorted by namespace.name
+    """
+    collections_dir = os.path.join(ansible_dir, 'ansible_collections')
+
+    namespaces = defaultdict(list)
+    if collections is None:
+        with os.scandir(collections_dir) as namespace_entries:
+            for namespace_entry in namespace_entries:
+                if namespace_entry.is_dir(follow_symlinks=False):
+                    with os.scandir(namespace_entry.path) as name_entries:
+                        namespaces[namespace_entry.name].extend(
+                            e.name for e in name_entries if e.is_dir(follow_symlinks=False))
+    else:
+        for collection in collections:
+            namespace, name = collection.split('.', 1)
+            namespaces[namespace].append(name)
+
+    manifests = {}
+    if not namespaces:
+        return manifests
+
+    with ThreadPoolExecutor(max_workers=max_workers or min(32, len(namespaces))) as pool:
+        scanners = {namespace: pool.submit(_scan_namespace,
+                                           os.path.join(collections_dir, namespace), names,
+                                           checksum)
+                    for namespace, names in namespaces.items()}
+
+        for namespace, scanner in scanners.items():
+            for name, entries in scanner.result().items():
+                manifests[f'{namespace}.{name}'] = entries
+
+    return dict(sorted(manifests.items()))
@@ -0,0 +1,243 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Write Python source distributions directly from the build tree
+
+The tarballs are reproducible: entries are sorted, timestamps, owners, and permissions are
+normalized, and the gzip headers do not record a time or filename.  A tarball is written as a
+series of gzip members, which decompress to a single tar stream.  Each directory tree is
+compressed as one member so that the files in it share a compression window.  That lets the
+compressed tree (a :class:`TreeBlock`) be built on its own, in parallel with the other trees, and
+copied into a tarball without compressing it again.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import tarfile
+
+from .cache import DEFAULT_PACKAGE_CACHE_SIZE, evict_least_recently_used
+from .scan import DIR, FILE, SYMLINK, scan_tree
+
+
+#: Time given to every entry in a tarball.  Wheels built from an sdist are zip files, which cannot
+#: hold times before 1980, so this cannot be 0.
+DEFAULT_MTIME = 1577836800  # 2020-01-01T00:00:00Z
+
+COMPRESS_LEVEL = 9
+
+#: Size of the buffer used when copying file contents into a tarball
+COPY_BUFSIZE = 1024 * 1024
+
+
+def sdist_mtime():
+    """Return the time to give to tarball entries, honoring SOURCE_DATE_EPOCH"""
+    return int(os.environ.get('SOURCE_DATE_EPOCH', DEFAULT_MTIME))
+
+
+def pkg_info(dist_name, version, summary, home_page):
+    """Return the contents of the PKG-INFO file for a distribution"""
+    return (f'Metadata-Version: 1.1\n'
+            f'Name: {dist_name}\n'
+            f'Version: {version}\n'
+            f'Summary: {summary}\n'
+            f'Home-page: {home_page}\n'
+            f'Author: Ansible, Inc.\n'
+            f'Author-email: info@ansible.com\n'
+            f'License: GPLv3+\n').encode('utf-8')
+
+
+def python_packages(manifest, toplevel='ansible_collections'):
+    """Return the dotted names of all of the directories in a :mod:`~ansible_infra.scan` manifest"""
+    packages = [toplevel]
+    packages.extend(f'{toplevel}.{e.path.replace("/", ".")}' for e in manifest if e.kind == DIR)
+    packages.sort()
+    return packages
+
+
+def _header(name, kind, mode, size=0, linkname=''):
+    """Return the tar header block(s) for an entry with all of its metadata normalized"""
+    info = tarfile.TarInfo(name)
+    info.type = {FILE: tarfile.REGTYPE, DIR: tarfile.DIRTYPE, SYMLINK: tarfile.SYMTYPE}[kind]
+    info.mode = mode
+    info.size = size if kind == FILE else 0
+    info.linkname = linkname
+    info.mtime = sdist_mtime()
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    return info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+
+def _padding(size):
+    return b'\0' * (-size % tarfile.BLOCKSIZE)
+
+
+def _copy_contents(path, size, out):
+    with open(path, 'rb') as f:
+        shutil.copyfileobj(f, out, COPY_BUFSIZE)
+    out.write(_padding(size))
+
+
+def _gzip_member(out):
+    """Return a file object which writes one deterministic gzip member to out"""
+    return gzip.GzipFile(filename='', mode='wb', compresslevel=COMPRESS_LEVEL, fileobj=out,
+                         mtime=0)
+
+
+def _write_tree(out, arcname, directory, manifest=None):
+    """Write a directory tree as one gzip member of a tarball being written to out"""
+    with _gzip_member(out) as member:
+        member.write(_header(arcname, DIR, 0o755))
+        for entry in (scan_tree(directory) if manifest is None else manifest):
+            member.write(_header(f'{arcname}/{entry.path}', entry.kind, entry.mode, entry.size,
+                                 entry.linkname))
+            if entry.kind == FILE:
+                _copy_contents(os.path.join(directory, entry.path), entry.size, member)
+
+
+class TreeBlock:
+    """
+    A directory tree compressed as it will appear at arcname in a tarball
+
+    The tar headers hold arcname so a block can only be copied into tarballs which place the tree
+    at the same path.
+    """
+
+    def __init__(self, arcname, directories, data_filename):
+        self.arcname = arcname
+        self.directories = directories
+        self.data_filename = data_filename
+
+    @classmethod
+    def build(cls, directory, arcname, data_filename, manifest=None):
+        """
+        Compress the tree beneath directory into data_filename
+
+        :kwarg manifest: The :func:`~ansible_infra.scan.scan_tree` manifest of directory if it has
+            already been scanned
+        """
+        if manifest is None:
+            manifest = scan_tree(directory)
+
+        with open(data_filename, 'wb') as data:
+            _write_tree(data, arcname, directory, manifest)
+        return cls(arcname, [e.path for e in manifest if e.kind == DIR], data_filename)
+
+    @classmethod
+    def load(cls, index_filename, data_filename):
+        with open(index_filename, 'r') as f:
+            index = json.load(f)
+        return cls(index['arcname'], index['directories'], data_filename)
+
+    def save_index(self, index_filename):
+        with open(index_filename, 'w') as f:
+            json.dump({'arcname': self.arcname, 'directories': self.directories}, f)
+
+    def write(self, out):
+        """Copy the compressed tree into a tarball being written to out"""
+        with open(self.data_filename, 'rb') as data:
+            shutil.copyfileobj(data, out, COPY_BUFSIZE)
+
+
+class TreeBlockCache:
+    """
+    :class:`TreeBlock` for collections which have been packed before, keyed by collection, version,
+    and the path the collection is placed at
+
+    Using a block updates its mtime so that, when the cache grows larger than max_size bytes,
+    :meth:`evict` can remove the least recently used blocks first.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_PACKAGE_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _paths(self, collection, version, arcname):
+        key = hashlib.sha256(arcname.encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(self.cache_dir, collection, str(version), key)
+        return f'{base}.json', f'{base}.gz'
+
+    def has(self, collection, version, arcname):
+        return all(os.path.exists(p) for p in self._paths(collection, version, arcname))
+
+    def get(self, collection, version, arcname, directory, manifest=None):
+        """
+        Return the block for a collection, building it from directory if it is not cached
+
+        :kwarg manifest: The manifest of directory if it has already been scanned
+        """
+        index_filename, data_filename = self._paths(collection, version, arcname)
+        if self.has(collection, version, arcname):
+            try:
+                # Mark the block as recently used
+                for filename in (data_filename, index_filename):
+                    os.utime(filename)
+                block = TreeBlock.load(index_filename, data_filename)
+            except (FileNotFoundError, ValueError, KeyError, TypeError):
+                # Evicted by another build or not written by this version of the code
+                pass
+            else:
+                if block.arcname == arcname:
+                    return block
+
+        os.makedirs(os.path.dirname(index_filename), exist_ok=True)
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        block = TreeBlock.build(directory, arcname, data_filename + tmp_suffix,
+                                manifest=manifest)
+        block.save_index(index_filename + tmp_suffix)
+
+        # The data has to be in place before the index which says that it is usable
+        os.replace(data_filename + tmp_suffix, data_filename)
+        os.replace(index_filename + tmp_suffix, index_filename)
+        block.data_filename = data_filename
+        return block
+
+    def evict(self):
+        """
+        Remove least recently used blocks until the cache fits within max_size
+
+        This is left to the caller so that blocks are not evicted while a tarball that uses them
+        is being written.
+        """
+        evict_least_recently_used(self.cache_dir, self.max_size)
+
+
+def write_sdist(filename, base_dir, generated_files, trees=(), blocks=()):
+    """
+    Write a reproducible source distribution tarball
+
+    :arg filename: The tarball to create
+    :arg base_dir: The directory that everything in the tarball will be inside of.  This is
+        ``NAME-VERSION`` for an sdist.
+    :arg generated_files: Mapping of paths (relative to base_dir) to the bytes to write there
+    :arg trees: Sequence of (path relative to base_dir, directory on disk, manifest) triples.
+        The directories are added to the tarball recursively.  The manifest is the directory's
+        :func:`~ansible_infra.scan.scan_tree` or None to scan it here.
+    :arg blocks: Sequence of :class:`TreeBlock` whose arcnames are inside of base_dir.  They are
+        copied into the tarball without being compressed again.
+    """
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'wb') as out:
+        with _gzip_member(out) as member:
+            for name, data in sorted(generated_files.items()):
+                member.write(_header(f'{base_dir}/{name}', FILE, 0o644, len(data)))
+                member.write(data)
+                member.write(_padding(len(data)))
+
+        for name, directory, manifest in sorted(trees, key=lambda t: t[0]):
+            _write_tree(out, f'{base_dir}/{name}', directory, manifest)
+
+        for block in sorted(blocks, key=lambda b: b.arcname):
+            block.write(out)
+
+        # End of archive marker
+        with _gzip_member(out) as member:
+            member.write(b'\0' * (tarfile.BLOCKSIZE * 2))
+
+    os.replace(tmp_filename, filename)
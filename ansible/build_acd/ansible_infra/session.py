@@ -0,0 +1,174 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+HTTP session shared by all of the requests a build makes to Galaxy and PyPI
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from .cache import NotCached
+from .ratelimit import PRIORITY_NORMAL
+from .retry import check_status, with_retries
+
+
+#: Default maximum number of open connections to any one host
+DEFAULT_CONNECTIONS_PER_HOST = 10
+
+#: Default maximum number of requests which may be in flight at the same time
+DEFAULT_MAX_REQUESTS = 20
+
+#: Seconds to keep an idle connection open for reuse
+KEEPALIVE_TIMEOUT = 30
+
+
+class NotFound(Exception):
+    pass
+
+
+def request_info(kind, queued=None):
+    """
+    Describe a request for the :class:`~ansible_infra.stats.BuildStats` of a :class:`PooledSession`
+
+    Pass the return value as the ``trace_request_ctx`` of a request.  A plain
+    :class:`aiohttp.ClientSession` accepts it too and ignores it.
+
+    :arg kind: ``metadata`` or ``download``
+    :kwarg queued: :func:`time.monotonic` time that the caller started waiting to make the
+        request, for instance on a :class:`~ansible_infra.ratelimit.RequestScheduler`.  By default
+        only the wait for a free request slot is counted.
+    """
+    return {'kind': kind, 'queued': queued}
+
+
+class _LimitedRequest:
+    """Async context manager which holds a slot of the in-flight limit for the life of a request"""
+
+    def __init__(self, semaphore, request_context, stats=None, method='GET', info=None):
+        self._semaphore = semaphore
+        self._request_context = request_context
+        self._stats = stats
+        self._method = method
+        self._info = info or request_info('metadata')
+
+    async def __aenter__(self):
+        queued = self._info['queued'] or time.monotonic()
+        await self._semaphore.acquire()
+        started = time.monotonic()
+        try:
+            response = await self._request_context.__aenter__()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        if self._stats is not None:
+            self._stats.record_request(self._info['kind'], started - queued,
+                                       time.monotonic() - started,
+                                       response.content_length if self._method == 'GET' else 0)
+        return response
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        try:
+            return await self._request_context.__aexit__(exc_type, exc, traceback)
+        finally:
+            self._semaphore.release()
+
+
+class PooledSession:
+    """
+    Connection pool and request limiter to share between all of the clients in a build
+
+    The pool keeps connections alive so that they can be reused, opens at most
+    connections_per_host connections to any server, and lets at most max_requests requests be in
+    flight at once.  Everything else waits for a free slot.
+
+    If a :class:`~ansible_infra.stats.BuildStats` is given, every request is recorded in it.
+
+    Use it as an async context manager.  The object it returns has the same ``get()`` interface as
+    an :class:`aiohttp.ClientSession` so it can be passed anywhere that an aio_session is expected.
+    """
+
+    def __init__(self, connections_per_host=DEFAULT_CONNECTIONS_PER_HOST,
+                 max_requests=DEFAULT_MAX_REQUESTS, stats=None):
+        self.connections_per_host = connections_per_host
+        self.max_requests = max_requests
+        self.stats = stats
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        # The aiohttp objects and the semaphore have to be created inside of the running event loop
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.connections_per_host,
+                                         keepalive_timeout=KEEPALIVE_TIMEOUT)
+        self._session = aiohttp.ClientSession(connector=connector)
+        self._semaphore = asyncio.Semaphore(self.max_requests)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self._session.close()
+        self._session = None
+        self._semaphore = None
+
+    def get(self, url, **kwargs):
+        return _LimitedRequest(self._semaphore, self._session.get(url, **kwargs), self.stats,
+                               info=kwargs.get('trace_request_ctx'))
+
+    def head(self, url, **kwargs):
+        return _LimitedRequest(self._semaphore, self._session.head(url, **kwargs), self.stats,
+                               method='HEAD', info=kwargs.get('trace_request_ctx'))
+
+
+async def get_json(aio_session, url, params=None, metadata_cache=None, scheduler=None,
+                   priority=PRIORITY_NORMAL):
+    """
+    Retrieve a JSON document, going through a :class:`MetadataCache` if one is given
+
+    Requests which fail with a server error, a rate limit, or a network error are retried.  If a
+    :class:`~ansible_infra.ratelimit.RequestScheduler` is given, every attempt waits for its turn
+    at priority and the scheduler learns from every response.
+
+    :raises NotFound: if the server does not have anything at url
+    :raises NotCached: if the cache is in offline mode and does not have the document
+    """
+    cache_entry = None
+    headers = {}
+    if metadata_cache:
+        cache_entry = metadata_cache.load(url)
+        if cache_entry is not None and metadata_cache.is_fresh(cache_entry):
+            return cache_entry['body']
+        if metadata_cache.offline:
+            raise NotCached(f'{url} is not cached and we are in offline mode')
+        headers = metadata_cache.conditional_headers(cache_entry)
+
+    async def fetch():
+        # Waiting for the scheduler counts as waiting in the queue
+        queued = time.monotonic()
+        if scheduler is not None:
+            await scheduler.acquire(priority)
+        async with aio_session.get(url, params=params, headers=headers,
+                                   trace_request_ctx=request_info('metadata', queued)) as response:
+            if scheduler is not None:
+                scheduler.observe(response)
+            if response.status == 404:
+                raise NotFound(f'Nothing found at: {url}')
+            check_status(response, url)
+
+            if response.status == 304:
+                return response.status, None, response.headers
+            return response.status, await response.json(), response.headers
+
+    status, body, response_headers = await with_retries(fetch)
+
+    if status == 304 and cache_entry is not None:
+        metadata_cache.refresh(url, cache_entry)
+        return cache_entry['body']
+
+    if metadata_cache:
+        metadata_cache.store(url, body, response_headers)
+
+    return body
@@ -1,7 +1,6 @@
 #!/usr/bin/python -tt
 
-from distutils import setup
-from setuptools import find_packages
+from setuptools import setup
 
 
 __version__ = '${version}'
@@ -28,7 +27,7 @@ setup(
     package_dir={'ansible_collections': 'ansible_collections'},
     packages=${python_packages},
     include_package_data=True,
-    requires=['ansible-base'],
+    install_requires=${install_requires},
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Console',
@@ -0,0 +1,145 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Record where the time of a build goes
+"""
+
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+#: Number of collections listed in the slowest collections part of a report
+SLOWEST_COLLECTIONS = 10
+
+_MIB = 1024 * 1024
+
+
+class _RequestStats:
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.queue_wait = 0.0
+
+    def to_json(self):
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'total_latency': round(self.latency, 3),
+            'mean_latency': round(self.latency / self.count, 3) if self.count else 0,
+            'max_latency': round(self.max_latency, 3),
+            'total_queue_wait': round(self.queue_wait, 3),
+        }
+
+
+class BuildStats:
+    """
+    Timings of the phases of a build, the HTTP requests it makes, and each collection it includes
+
+    :kwarg progress: File object to show the progress of downloads and installs on (for instance,
+        sys.stderr) or None to not show progress
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.started = time.monotonic()
+        self.phases = {}
+        self.requests = defaultdict(_RequestStats)
+        self.collections = defaultdict(lambda: defaultdict(int))
+        self._expected_collections = 0
+        self._downloaded = 0
+        self._installed = 0
+        self._download_bytes = 0
+        self._progress_shown = False
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager which records how long the code inside of it takes as phase name"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.monotonic() - start
+            if self._progress_shown:
+                self.progress.write('\n')
+                self.progress.flush()
+                self._progress_shown = False
+
+    def record_request(self, kind, queue_wait, latency, nbytes):
+        """
+        Record one HTTP request
+
+        :arg kind: ``metadata`` or ``download``
+        :arg queue_wait: Seconds the request waited for its turn, both on the rate limiter and
+            for a free request slot
+        :arg latency: Seconds until the response headers arrived
+        :arg nbytes: Size of the response body or None if it is not known
+        """
+        request_stats = self.requests[kind]
+        request_stats.count += 1
+        request_stats.bytes += nbytes or 0
+        request_stats.latency += latency
+        request_stats.max_latency = max(request_stats.max_latency, latency)
+        request_stats.queue_wait += queue_wait
+
+    def expect_collections(self, count):
+        """Set how many collections the progress display should count towards"""
+        self._expected_collections = count
+        self._downloaded = self._installed = self._download_bytes = 0
+
+    def record_download(self, collection, seconds, nbytes):
+        self.collections[collection]['download_seconds'] += seconds
+        self.collections[collection]['bytes'] += nbytes
+        self._downloaded += 1
+        self._download_bytes += nbytes
+        self._show_progress()
+
+    def record_install(self, collection, queue_wait, seconds):
+        self.collections[collection]['install_queue_wait'] += queue_wait
+        self.collections[collection]['install_seconds'] += seconds
+        self._installed += 1
+        self._show_progress()
+
+    def _show_progress(self):
+        if not self.progress or not self._expected_collections:
+            return
+        elapsed = time.monotonic() - self.started
+        self.progress.write(f'\rdownloaded {self._downloaded}/{self._expected_collections}'
+                            f'  installed {self._installed}/{self._expected_collections}'
+                            f'  {self._download_bytes / _MIB:.1f} MiB'
+                            f'  {self._download_bytes / _MIB / elapsed:.1f} MiB/s')
+        self.progress.flush()
+        self._progress_shown = True
+
+    def report(self):
+        """Return the report as a dict which can be serialized to JSON"""
+        collections = {c: {k: round(v, 3) for k, v in values.items()}
+                       for c, values in sorted(self.collections.items())}
+        slowest = sorted(collections, key=lambda c: (collections[c].get('download_seconds', 0)
+                                                     + collections[c].get('install_seconds', 0)),
+                         reverse=True)[:SLOWEST_COLLECTIONS]
+
+        download_bytes = sum(c.get('bytes', 0) for c in collections.values())
+        download_time = sum(t for p, t in self.phases.items() if 'download' in p)
+
+        return {
+            'total_seconds': round(time.monotonic() - self.started, 3),
+            'phases': {p: round(t, 3) for p, t in self.phases.items()},
+            'requests': {k: r.to_json() for k, r in sorted(self.requests.items())},
+            'download_bytes': download_bytes,
+            'download_mib_per_second': (round(download_bytes / _MIB / download_time, 3)
+                                        if download_time else 0),
+            'slowest_collections': slowest,
+            'collections': collections,
+        }
+
+    def write_report(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
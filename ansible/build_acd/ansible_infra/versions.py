@@ -0,0 +1,132 @@
+# coding: utf-8
+# Author: Toshio Kuratomi <tkuratom@redhat.com>
+# License: GPLv3+
+# Copyright: Ansible Project, 2020
+
+"""
+Indexes which answer version queries without parsing and scanning every version
+"""
+
+import bisect
+import hashlib
+import json
+
+import semantic_version as semver
+
+
+def _upper_bound(clause):
+    """
+    Return the highest version that a spec clause could match or None if it is unbounded
+    """
+    if isinstance(clause, semver.base.Range):
+        if clause.operator in (semver.base.Range.OP_EQ, semver.base.Range.OP_LT,
+                               semver.base.Range.OP_LTE):
+            return clause.target
+        return None
+
+    if isinstance(clause, semver.base.AllOf):
+        bounds = [b for c in clause.clauses if (b := _upper_bound(c)) is not None]
+        return min(bounds) if bounds else None
+
+    if isinstance(clause, semver.base.AnyOf):
+        bounds = [_upper_bound(c) for c in clause.clauses]
+        if not bounds or None in bounds:
+            return None
+        return max(bounds)
+
+    # Always, Never, and anything else we don't know how to bound
+    return None
+
+
+class VersionIndex:
+    """
+    Sorted index of the versions of a collection
+
+    The versions are stored in ascending order next to compact (major, minor, patch) integer keys.
+    Finding the latest version which matches a spec bisects the keys to the spec's upper bound and
+    only parses versions from there downwards until one matches.  The index can be serialized so
+    that it does not have to be rebuilt when the versions have not changed.
+    """
+
+    def __init__(self, versions, keys):
+        # These must already be sorted.  Use from_versions() to build an index from a raw list.
+        self._versions = versions
+        self._keys = keys
+        self._parsed = {}
+
+    @classmethod
+    def from_versions(cls, versions):
+        parsed = sorted(semver.Version(v) for v in versions)
+        index = cls([str(v) for v in parsed], [(v.major, v.minor, v.patch) for v in parsed])
+        index._parsed = dict(enumerate(parsed))
+        return index
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['versions'], [tuple(k) for k in data['keys']])
+
+    def to_json(self):
+        return {'versions': self._versions, 'keys': self._keys}
+
+    def __len__(self):
+        return len(self._versions)
+
+    def _version(self, idx):
+        if (version := self._parsed.get(idx)) is None:
+            version = self._parsed[idx] = semver.Version(self._versions[idx])
+        return version
+
+    def descending(self, start=None):
+        """Yield the versions from newest to oldest, optionally starting below index start"""
+        if start is None:
+            start = len(self._versions)
+        for idx in range(start - 1, -1, -1):
+            yield self._version(idx)
+
+    def matching(self, spec):
+        """
+        Yield the versions matching spec from newest to oldest
+
+        :arg spec: A :class:`semantic_version.SimpleSpec`
+        """
+        upper_bound = _upper_bound(spec.clause)
+        start = None
+        if upper_bound is not None:
+            # Every version that could match sorts at or below the bound's key
+            start = bisect.bisect_right(self._keys, (upper_bound.major, upper_bound.minor,
+                                                     upper_bound.patch))
+
+        for version in self.descending(start):
+            if version in spec:
+                yield version
+
+    def latest_matching(self, spec):
+        """
+        Return the newest version matching spec or None if nothing matches
+
+        :arg spec: A :class:`semantic_version.SimpleSpec`
+        """
+        return next(self.matching(spec), None)
+
+
+def version_index(collection, versions, metadata_cache=None):
+    """
+    Return a :class:`VersionIndex` for versions
+
+    When a metadata_cache is given, the index is stored in it so that the next run with the same
+    list of versions can load the index instead of parsing and sorting the versions again.  There
+    is one entry per collection.  It records a digest of the versions it was built from and is
+    replaced when the collection's versions change.
+    """
+    if metadata_cache is None:
+        return VersionIndex.from_versions(versions)
+
+    digest = hashlib.sha256(json.dumps(versions).encode('utf-8')).hexdigest()
+    key = f'version-index:{collection}'
+    if (data := metadata_cache.load_value(key)) is not None and data['digest'] == digest:
+        return VersionIndex.from_json(data)
+
+    index = VersionIndex.from_versions(versions)
+    if not metadata_cache.offline:
+        metadata_cache.store_value(key, {'digest': digest, **index.to_json()})
+    return index
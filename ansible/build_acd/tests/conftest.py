@@ -0,0 +1,20 @@
+import pytest
+
+from ansible_infra.cli import main
+
+
+@pytest.fixture
+def build_acd(tmp_path):
+    """
+    Return a function which runs a build-acd.py subcommand against a MockGalaxy
+
+    Everything that the command reads and writes is in tmp_path.  The function returns the exit
+    status of the command.
+    """
+    def run(command, galaxy, *extra_args, acd_version='2.10.0'):
+        args = ['build-acd.py', command, acd_version, '--dest-dir', str(tmp_path),
+                '--cache-dir', str(tmp_path / 'cache'), '--galaxy-server', galaxy.url,
+                '--pypi-server', galaxy.url, '--build-file', str(tmp_path / 'acd-2.10.build')]
+        return main(args + list(extra_args))
+
+    return run
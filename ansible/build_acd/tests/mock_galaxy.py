@@ -0,0 +1,248 @@
+"""
+A local stand-in for Galaxy and PyPI which serves synthetic collections
+
+The server runs its own event loop in a background thread so that code which calls asyncio.run()
+itself, like the build-acd subcommands, can talk to it.
+
+JSON documents carry an ETag and are answered with 304 Not Modified when the client sends it back
+in If-None-Match, like Galaxy does.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import random
+import tarfile
+import threading
+
+import aiohttp.web
+
+
+class MockGalaxy:
+    """
+    Serve num_collections synthetic collections the way that Galaxy does
+
+    :kwarg num_collections: Number of collections to serve
+    :kwarg versions_per_collection: Number of versions (1.0.0, 1.1.0, ...) of each collection
+    :kwarg page_size: Number of versions in each page of a versions listing
+    :kwarg count_skew: Number to add to the count of versions that a listing reports, to
+        simulate a listing whose count is out of date
+    :kwarg artifact_size: Bytes of incompressible data in each collection tarball
+    :kwarg latency: Seconds to wait before answering every request
+    :kwarg failure_rate: Fraction of requests to answer with a 503
+    :kwarg dependencies: Mapping of a collection to the dependencies its releases declare
+    :kwarg requires_ansible: requires_ansible of every release
+    :kwarg broken_collections: Collections whose tarballs have no MANIFEST.json so that they
+        download fine but cannot be installed
+    :kwarg ansible_base_version: Version of ansible-base which the PyPI stand-in returns
+    :kwarg byte_ranges: Whether artifact downloads honor Range requests
+    :kwarg seed: Seed for the artifact data and the failures
+    """
+
+    def __init__(self, num_collections=10, versions_per_collection=3, page_size=10,
+                 count_skew=0, artifact_size=16 * 1024, latency=0, failure_rate=0, dependencies=None,
+                 requires_ansible=None, broken_collections=(), ansible_base_version='2.10.0',
+                 byte_ranges=True, seed=0):
+        self.collections = {f'ns{n % 10}.collection{n}':
+                            [f'1.{v}.0' for v in range(versions_per_collection)]
+                            for n in range(num_collections)}
+        self.page_size = page_size
+        self.count_skew = count_skew
+        self.artifact_size = artifact_size
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.dependencies = dependencies or {}
+        self.requires_ansible = requires_ansible
+        self.broken_collections = frozenset(broken_collections)
+        self.ansible_base_version = ansible_base_version
+        self.byte_ranges = byte_ranges
+        self.seed = seed
+        self.requests = []
+        # Paths of the requests which were answered with 304 Not Modified
+        self.not_modified = []
+        # (filename, start, stop) of every byte range request for an artifact
+        self.range_requests = []
+        self.url = None
+
+        self._random = random.Random(seed)
+        self._artifacts = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def write_pieces_file(self, filename):
+        with open(filename, 'w') as f:
+            f.write(''.join(f'{c}\n' for c in self.collections))
+
+    def artifact(self, collection, version):
+        """Return the tarball of a collection release, creating it the first time it is needed"""
+        with self._lock:
+            if (collection, version) not in self._artifacts:
+                self._artifacts[collection, version] = self._make_artifact(collection, version)
+            return self._artifacts[collection, version]
+
+    def _make_artifact(self, collection, version):
+        namespace, name = collection.split('.', 1)
+        manifest = {'collection_info': {'namespace': namespace, 'name': name, 'version': version,
+                                        'dependencies': self.dependencies.get(collection, {})}}
+        rand = random.Random(f'{self.seed}-{collection}-{version}')
+        data = rand.getrandbits(self.artifact_size * 8).to_bytes(self.artifact_size, 'little')
+        members = (
+            ('MANIFEST.json', json.dumps(manifest).encode('utf-8')),
+            ('README.md', f'# {collection}\n'.encode('utf-8')),
+            (f'plugins/modules/{name}_info.py', b'#!/usr/bin/python\n'),
+            ('plugins/module_utils/data.bin', data),
+        )
+
+        if collection in self.broken_collections:
+            members = members[1:]
+
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+            for member_name, data in members:
+                info = tarfile.TarInfo(member_name)
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+    #
+    # Request handlers
+    #
+
+    @aiohttp.web.middleware
+    async def _simulate_network(self, request, handler):
+        self.requests.append((request.method, request.path_qs))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+        if fail:
+            return aiohttp.web.Response(status=503, headers={'Retry-After': '0'})
+        return await handler(request)
+
+    def _json_response(self, request, data):
+        """Answer with data, or with a 304 if the client already has this version of it"""
+        text = json.dumps(data, sort_keys=True)
+        headers = {'ETag': f'"{hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]}"'}
+        if request.headers.get('If-None-Match') == headers['ETag']:
+            self.not_modified.append(request.path_qs)
+            return aiohttp.web.Response(status=304, headers=headers)
+        return aiohttp.web.Response(text=text, content_type='application/json', headers=headers)
+
+    def _collection(self, request):
+        collection = f'{request.match_info["namespace"]}.{request.match_info["name"]}'
+        if collection not in self.collections:
+            raise aiohttp.web.HTTPNotFound()
+        return collection
+
+    async def _versions(self, request):
+        collection = self._collection(request)
+        versions = self.collections[collection]
+        page = int(request.query.get('page', 1))
+        start = (page - 1) * self.page_size
+        if page > 1 and start >= len(versions):
+            # Like Django REST framework's pagination, which Galaxy uses
+            raise aiohttp.web.HTTPNotFound(text='{"detail": "Invalid page."}',
+                                           content_type='application/json')
+        results = [{'version': v, 'href': f'{request.url.with_query({})}{v}/'}
+                   for v in versions[start:start + self.page_size]]
+
+        next_url = None
+        if start + self.page_size < len(versions):
+            next_url = str(request.url.update_query({'page': page + 1}))
+        return self._json_response(request, {'count': max(0, len(versions) + self.count_skew),
+                                             'next': next_url, 'previous': None,
+                                             'results': results})
+
+    async def _release(self, request):
+        collection = self._collection(request)
+        version = request.match_info['version']
+        if version not in self.collections[collection]:
+            raise aiohttp.web.HTTPNotFound()
+
+        namespace, name = collection.split('.', 1)
+        filename = f'{namespace}-{name}-{version}.tar.gz'
+        artifact = self.artifact(collection, version)
+        metadata = {'dependencies': self.dependencies.get(collection, {})}
+        if self.requires_ansible:
+            metadata['requires_ansible'] = self.requires_ansible
+        return self._json_response(request, {
+            'version': version,
+            'download_url': str(request.url.with_path(f'/download/{filename}').with_query({})),
+            'artifact': {'filename': filename, 'sha256': hashlib.sha256(artifact).hexdigest(),
+                         'size': len(artifact)},
+            'metadata': metadata,
+        })
+
+    async def _download(self, request):
+        namespace, name, version = request.match_info['filename'][:-len('.tar.gz')].split('-')
+        collection = f'{namespace}.{name}'
+        if version not in self.collections.get(collection, ()):
+            raise aiohttp.web.HTTPNotFound()
+        artifact = self.artifact(collection, version)
+
+        if not self.byte_ranges:
+            return aiohttp.web.Response(body=artifact, headers={'Accept-Ranges': 'none',
+                                                                'Content-Type': 'application/gzip'})
+
+        headers = {'Accept-Ranges': 'bytes', 'Content-Type': 'application/gzip'}
+        if request.http_range.start is not None or request.http_range.stop is not None:
+            start, stop, _step = request.http_range.indices(len(artifact))
+            self.range_requests.append((request.match_info['filename'], start, stop))
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{len(artifact)}'
+            return aiohttp.web.Response(status=206, body=artifact[start:stop], headers=headers)
+        return aiohttp.web.Response(body=artifact, headers=headers)
+
+    async def _pypi(self, request):
+        return self._json_response(request, {'info': {'version': self.ansible_base_version}})
+
+    def _app(self):
+        app = aiohttp.web.Application(middlewares=[self._simulate_network])
+        app.router.add_get('/api/v2/collections/{namespace}/{name}/versions/', self._versions)
+        app.router.add_get('/api/v2/collections/{namespace}/{name}/versions/{version}/',
+                           self._release)
+        app.router.add_get('/download/{filename}', self._download)
+        app.router.add_get('/pypi/ansible-base/json', self._pypi)
+        return app
+
+    #
+    # Running the server
+    #
+
+    async def _start(self):
+        self._runner = aiohttp.web.AppRunner(self._app())
+        await self._runner.setup()
+        site = aiohttp.web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f'http://127.0.0.1:{port}/'
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
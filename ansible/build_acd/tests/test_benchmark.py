@@ -0,0 +1,61 @@
+"""
+End to end runs of the build against a local stand-in for Galaxy and PyPI
+
+The benchmarks only run when BUILD_ACD_BENCHMARK is set in the environment::
+
+    BUILD_ACD_BENCHMARK=1 python3.8 -m pytest tests/test_benchmark.py -s
+
+Set BUILD_ACD_BENCHMARK_LATENCY to the seconds each request should take to simulate a real
+network.
+"""
+
+import os
+import tarfile
+import time
+
+import pytest
+from mock_galaxy import MockGalaxy
+
+
+BENCHMARK = bool(os.environ.get('BUILD_ACD_BENCHMARK'))
+LATENCY = float(os.environ.get('BUILD_ACD_BENCHMARK_LATENCY', '0'))
+
+
+def _timed(build_acd, command, galaxy, *extra_args):
+    start = time.monotonic()
+    assert build_acd(command, galaxy, *extra_args) == 0
+    return time.monotonic() - start
+
+
+def test_new_acd_and_build_single(tmp_path, build_acd):
+    with MockGalaxy(num_collections=3, versions_per_collection=12, page_size=5) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-single', galaxy) == 0
+
+    assert (tmp_path / 'acd-2.10.lock').read_text().count(': 1.11.0 ') == 3
+    with tarfile.open(tmp_path / 'ansible-2.10.0.tar.gz') as tar:
+        names = tar.getnames()
+    for collection in galaxy.collections:
+        namespace, name = collection.split('.')
+        assert (f'ansible-2.10.0/ansible_collections/{namespace}/{name}/plugins/modules/'
+                f'{name}_info.py') in names
+
+
+@pytest.mark.skipif(not BENCHMARK, reason='BUILD_ACD_BENCHMARK is not set')
+@pytest.mark.parametrize('num_collections', [10, 100, 500])
+def test_benchmark_build(tmp_path, build_acd, num_collections):
+    with MockGalaxy(num_collections=num_collections, versions_per_collection=30,
+                    artifact_size=256 * 1024, latency=LATENCY) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        timings = {
+            'new-acd': _timed(build_acd, 'new-acd', galaxy, '--pieces-file',
+                              str(tmp_path / 'acd.in')),
+            'build-single': _timed(build_acd, 'build-single', galaxy),
+        }
+        # A second build has everything in its caches
+        timings['build-single (cached)'] = _timed(build_acd, 'build-single', galaxy)
+
+    print()
+    for step, seconds in timings.items():
+        print(f'{num_collections} collections, {step}: {seconds:.2f}s')
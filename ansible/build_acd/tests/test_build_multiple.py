@@ -0,0 +1,74 @@
+import tarfile
+
+from mock_galaxy import MockGalaxy
+
+
+def _downloads(galaxy):
+    return [path for _method, path in galaxy.requests if path.startswith('/download/')]
+
+
+def test_build_multiple(tmp_path, build_acd):
+    with MockGalaxy(num_collections=3) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-multiple', galaxy) == 0
+
+        # Every collection has been packaged so a rebuild downloads nothing
+        downloads = len(_downloads(galaxy))
+        (tmp_path / 'ansible-meta-2.10.0.tar.gz').unlink()
+        assert build_acd('build-multiple', galaxy) == 0
+        assert len(_downloads(galaxy)) == downloads
+
+        # The single-file ACD does not overwrite the meta-package
+        assert build_acd('build-single', galaxy) == 0
+
+    for collection in galaxy.collections:
+        namespace, name = collection.split('.')
+        dist = f'ansible-collection-{namespace}-{name}-1.2.0'
+        with tarfile.open(tmp_path / f'{dist}.tar.gz') as tar:
+            assert (f'{dist}/ansible_collections/{namespace}/{name}/plugins/modules/'
+                    f'{name}_info.py') in tar.getnames()
+
+    with tarfile.open(tmp_path / 'ansible-meta-2.10.0.tar.gz') as tar:
+        setup_py = tar.extractfile('ansible-meta-2.10.0/setup.py').read().decode('utf-8')
+    assert "name='ansible-meta'" in setup_py
+    assert "'ansible-collection-ns1-collection1==1.2.0'" in setup_py
+    assert (tmp_path / 'ansible-2.10.0.tar.gz').exists()
+
+
+def test_build_multiple_packages_what_it_can(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=3, broken_collections=['ns1.collection1']) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-multiple', galaxy) == 1
+
+    assert '1 of 3 collections failed' in capsys.readouterr().out
+    assert not (tmp_path / 'ansible-meta-2.10.0.tar.gz').exists()
+    # The collections which did install are in the package cache for the next run
+    packages = sorted(p.name for p in (tmp_path / 'cache' / 'packages').rglob('*.tar.gz'))
+    assert packages == ['ansible-collection-ns0-collection0-1.2.0.tar.gz',
+                        'ansible-collection-ns2-collection2-1.2.0.tar.gz']
+
+
+def test_build_file_version_warning(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=1) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        build_acd('build-multiple', galaxy, acd_version='2.11.0')
+
+    assert 'is for version 2.10 but we need 2.11' in capsys.readouterr().out
+
+
+def test_build_multiple_reports_missing_collections(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=3) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        with open(tmp_path / 'acd-2.10.build', 'a') as f:
+            f.write('ns9.missing: >=1.0.0,<2.0.0\n')
+        assert build_acd('build-multiple', galaxy) == 1
+
+    out = capsys.readouterr().out
+    assert 'ns9.missing: ' in out
+    assert '1 of 4 collections failed' in out
+    # The collections which were found are packaged for the next run
+    assert len(list((tmp_path / 'cache' / 'packages').rglob('*.tar.gz'))) == 3
@@ -0,0 +1,112 @@
+import json
+import os
+
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.cache import ArtifactCache, MetadataCache
+from ansible_infra.packages import PackageCache
+
+
+def _make_artifact(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    return path
+
+
+def test_artifact_cache_roundtrip(tmp_path):
+    cache = ArtifactCache(tmp_path / 'cache')
+    artifact = _make_artifact(tmp_path / 'community-general-1.0.0.tar.gz', 10)
+
+    assert not cache.retrieve('abcdef', tmp_path / 'dest.tar.gz')
+
+    cache.store('abcdef', artifact)
+    assert cache.retrieve('abcdef', tmp_path / 'dest.tar.gz')
+    with open(tmp_path / 'dest.tar.gz', 'rb') as f:
+        assert f.read() == b'x' * 10
+
+
+def test_artifact_cache_evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(tmp_path / 'cache', max_size=30)
+    for idx, sha256sum in enumerate(('aa11', 'bb22', 'cc33')):
+        cache.store(sha256sum, _make_artifact(tmp_path / f'{sha256sum}.tar.gz', 10))
+        # Make the usage order deterministic regardless of filesystem timestamp granularity
+        os.utime(cache._artifact_path(sha256sum), (idx, idx))
+
+    cache.max_size = 25
+    # Using the oldest artifact makes it the most recently used one
+    assert cache.retrieve('aa11', tmp_path / 'used.tar.gz')
+    cache.evict()
+
+    assert os.path.exists(cache._artifact_path('aa11'))
+    assert not os.path.exists(cache._artifact_path('bb22'))
+    assert os.path.exists(cache._artifact_path('cc33'))
+
+
+def test_package_cache_evicts_least_recently_used(tmp_path):
+    cache = PackageCache(tmp_path / 'packages', max_size=25)
+    for idx, version in enumerate(('1.0.0', '2.0.0', '3.0.0')):
+        cache.store('ns.coll', version, _make_artifact(tmp_path / f'{version}.tar.gz', 10))
+        os.utime(cache._package_path('ns.coll', version), (idx, idx))
+    # Storing does not evict so that all of a release's packages can be retrieved
+    assert cache.has('ns.coll', '1.0.0')
+
+    (tmp_path / 'dest').mkdir()
+    cache.retrieve('ns.coll', '1.0.0', tmp_path / 'dest')
+    cache.evict()
+
+    assert cache.has('ns.coll', '1.0.0')
+    assert not cache.has('ns.coll', '2.0.0')
+    assert cache.has('ns.coll', '3.0.0')
+
+
+def test_metadata_cache_validators(tmp_path):
+    cache = MetadataCache(tmp_path / 'metadata')
+    url = 'https://galaxy.ansible.com/api/v2/collections/community/general/'
+
+    assert cache.load(url) is None
+    cache.store(url, {'name': 'general'}, {'ETag': '"abc"', 'Last-Modified': 'yesterday'})
+
+    entry = cache.load(url)
+    assert entry['body'] == {'name': 'general'}
+    assert cache.conditional_headers(entry) == {'If-None-Match': '"abc"',
+                                                'If-Modified-Since': 'yesterday'}
+    # With no ttl, entries always have to be revalidated
+    assert not cache.is_fresh(entry)
+
+
+def test_metadata_cache_ttl_and_offline(tmp_path):
+    url = 'https://galaxy.ansible.com/api/v2/collections/community/general/'
+    MetadataCache(tmp_path).store(url, {}, {})
+    entry = MetadataCache(tmp_path).load(url)
+
+    assert MetadataCache(tmp_path, ttl=3600).is_fresh(entry)
+    entry['fetched'] -= 7200
+    assert not MetadataCache(tmp_path, ttl=3600).is_fresh(entry)
+    assert MetadataCache(tmp_path, offline=True).is_fresh(entry)
+
+
+def test_second_run_revalidates_metadata(tmp_path, build_acd):
+    with MockGalaxy(num_collections=3) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        pieces = ['--pieces-file', str(tmp_path / 'acd.in')]
+
+        assert build_acd('new-acd', galaxy, *pieces) == 0
+        assert galaxy.not_modified == []
+        build_file = (tmp_path / 'acd-2.10.build').read_text()
+
+        first_run = len(galaxy.requests)
+        assert build_acd('new-acd', galaxy, *pieces) == 0
+        # Every document was revalidated and its cached body was used
+        second_run = [path for _method, path in galaxy.requests[first_run:]]
+        assert sorted(galaxy.not_modified) == sorted(second_run)
+        assert (tmp_path / 'acd-2.10.build').read_text() == build_file
+
+        # Without the lock file a rebuild revalidates the metadata.  The artifacts come from the
+        # artifact cache.  The 304s are counted as metadata.
+        (tmp_path / 'acd-2.10.lock').unlink()
+        assert build_acd('build-single', galaxy) == 0
+        assert build_acd('build-single', galaxy) == 0
+
+    stats = json.loads((tmp_path / 'acd-2.10-2.10.0.stats.json').read_text())
+    assert stats['requests']['metadata']['count'] > 0
+    assert stats['requests'].get('download', {'count': 0})['count'] == 0
@@ -0,0 +1,70 @@
+import asyncio
+
+import semantic_version as semver
+
+from ansible_infra.cache import MetadataCache
+from ansible_infra.compat import CompatibilityChecker, version_is_compatible
+from ansible_infra.versions import VersionIndex
+
+
+class FakeGalaxyClient:
+    def __init__(self, requires):
+        self.requires = requires
+        self.requested = []
+
+    async def get_release_info(self, collection, version, priority=None):
+        self.requested.append(str(version))
+        return {'version': str(version),
+                'metadata': {'requires_ansible': self.requires[str(version)]}}
+
+
+def test_version_is_compatible():
+    assert version_is_compatible('2.10.0', None)
+    assert version_is_compatible('2.10.0', '>=2.9.10,<2.11')
+    assert not version_is_compatible('2.10.0', '>=2.11')
+    assert version_is_compatible('2.10.3', '~=2.10.0')
+    assert not version_is_compatible('2.11.0', '~=2.10.0')
+    assert version_is_compatible('2.10.1', '==2.10.*')
+    assert not version_is_compatible('2.9.1', '==2.10.*')
+    assert version_is_compatible('2.10.0rc1', '>=2.9')
+
+
+def test_latest_compatible_stops_early(tmp_path):
+    requires = {f'1.{n}.0': '>=2.11' if n > 5 else '>=2.9' for n in range(10)}
+    index = VersionIndex.from_versions(requires)
+    client = FakeGalaxyClient(requires)
+    checker = CompatibilityChecker(client, '2.10.0', metadata_cache=MetadataCache(tmp_path))
+
+    assert str(asyncio.run(checker.latest_compatible('ns.coll', index))) == '1.5.0'
+    # The newest release on its own and then one batch of older ones were enough
+    assert client.requested == ['1.9.0', '1.8.0', '1.7.0', '1.6.0', '1.5.0']
+
+    # The metadata is memoized so a second search does not ask galaxy again
+    client.requested = []
+    assert str(asyncio.run(checker.latest_compatible('ns.coll', index))) == '1.5.0'
+    assert client.requested == []
+
+
+def test_latest_compatible_skips_bad_requires_ansible(capsys):
+    requires = {'1.0.0': '>=2.9', '1.1.0': '>=2.9', '1.2.0': '>=two.ten', '1.3.0': '2.10'}
+    index = VersionIndex.from_versions(requires)
+    checker = CompatibilityChecker(FakeGalaxyClient(requires), '2.10.0')
+
+    assert str(asyncio.run(checker.latest_compatible('ns.coll', index))) == '1.1.0'
+    out = capsys.readouterr().out
+    assert 'Skipping ns.coll 1.3.0' in out
+    assert 'Skipping ns.coll 1.2.0' in out
+
+
+def test_latest_compatible_checks_newest_alone():
+    requires = {f'1.{n}.0': '>=2.9' for n in range(10)}
+    client = FakeGalaxyClient(requires)
+    checker = CompatibilityChecker(client, '2.10.0')
+
+    index = VersionIndex.from_versions(requires)
+    assert str(asyncio.run(checker.latest_compatible('ns.coll', index))) == '1.9.0'
+    # Nothing older is fetched when the newest release is compatible
+    assert client.requested == ['1.9.0']
+
+    assert str(asyncio.run(checker.latest_compatible(
+        'ns.coll', index, semver.SimpleSpec('<1.5.0')))) == '1.4.0'
@@ -0,0 +1,41 @@
+import semantic_version as semver
+
+from ansible_infra.dependency_files import DepsFile, LockedRelease, LockFile, changed_collections
+
+
+DEPS = """_acd_version: 2.10.0
+_ansible_base_version: 2.10.1
+ansible.posix: 1.1.0
+community.general: 1.0.0
+"""
+
+
+def test_deps_file_roundtrip(tmp_path):
+    deps_filename = tmp_path / 'acd-2.10-2.10.0.deps'
+    with open(deps_filename, 'w') as f:
+        f.write(DEPS)
+
+    acd_version, ansible_base_version, deps = DepsFile(deps_filename).parse()
+    assert acd_version == '2.10.0'
+    assert ansible_base_version == '2.10.1'
+    assert deps == {'ansible.posix': '1.1.0', 'community.general': '1.0.0'}
+
+    DepsFile(tmp_path / 'copy.deps').write(acd_version, ansible_base_version, deps)
+    assert (tmp_path / 'copy.deps').read_text() == DEPS
+
+
+def test_changed_collections():
+    previous = {'ansible.posix': '1.1.0', 'community.general': '1.0.0'}
+    new = {'ansible.posix': '1.1.0', 'community.general': '1.0.1', 'community.crypto': '1.0.0'}
+    assert changed_collections(previous, new) == {'community.general', 'community.crypto'}
+
+
+def test_lock_file_roundtrip(tmp_path):
+    releases = {'community.general': LockedRelease(
+        '1.0.0', 'abc123', 'community-general-1.0.0.tar.gz',
+        'https://galaxy.ansible.com/download/community-general-1.0.0.tar.gz')}
+
+    lock_file = LockFile(tmp_path / 'acd-2.10.lock')
+    lock_file.write(semver.Version('2.10.0'), '2.10.1', releases)
+
+    assert lock_file.parse() == ('2.10.0', '2.10.1', releases)
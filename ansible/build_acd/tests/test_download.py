@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+
+import aiohttp
+import pytest
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.download import DownloadFailure, download_file
+
+
+COLLECTION = 'ns0.collection0'
+FILENAME = 'ns0-collection0-1.0.0.tar.gz'
+
+
+def _download(galaxy, dest_filename, sha256sum, size=None):
+    async def run():
+        async with aiohttp.ClientSession() as aio_session:
+            await download_file(aio_session, f'{galaxy.url}download/{FILENAME}', dest_filename,
+                                sha256sum, size=size)
+
+    asyncio.run(run())
+
+
+def _leftovers(tmp_path):
+    return sorted(p.name for p in tmp_path.iterdir() if '.part' in p.name)
+
+
+def test_resume_truncated_part_file(tmp_path):
+    with MockGalaxy(num_collections=1, artifact_size=64 * 1024) as galaxy:
+        artifact = galaxy.artifact(COLLECTION, '1.0.0')
+        dest = tmp_path / FILENAME
+        # What an interrupted download left behind
+        half = len(artifact) // 2
+        (tmp_path / f'{FILENAME}.part').write_bytes(artifact[:half])
+
+        _download(galaxy, dest, hashlib.sha256(artifact).hexdigest())
+
+    assert dest.read_bytes() == artifact
+    # Only the missing bytes were requested
+    assert galaxy.range_requests == [(FILENAME, half, len(artifact))]
+    assert [method for method, _path in galaxy.requests] == ['GET']
+    assert _leftovers(tmp_path) == []
+
+
+def test_small_download_is_a_single_get(tmp_path):
+    with MockGalaxy(num_collections=1, artifact_size=64 * 1024) as galaxy:
+        artifact = galaxy.artifact(COLLECTION, '1.0.0')
+        dest = tmp_path / FILENAME
+        _download(galaxy, dest, hashlib.sha256(artifact).hexdigest(), size=len(artifact))
+
+    assert dest.read_bytes() == artifact
+    assert galaxy.requests == [('GET', f'/download/{FILENAME}')]
+    assert galaxy.range_requests == []
+
+
+def test_segmented_download(tmp_path, monkeypatch):
+    monkeypatch.setattr('ansible_infra.download.MIN_SEGMENT_SIZE', 16 * 1024)
+    with MockGalaxy(num_collections=1, artifact_size=128 * 1024) as galaxy:
+        artifact = galaxy.artifact(COLLECTION, '1.0.0')
+        dest = tmp_path / FILENAME
+        _download(galaxy, dest, hashlib.sha256(artifact).hexdigest(), size=len(artifact))
+
+    assert dest.read_bytes() == artifact
+    assert all(method == 'GET' for method, _path in galaxy.requests)
+    # The segments cover the artifact without gaps or overlaps
+    ranges = sorted((start, stop) for _filename, start, stop in galaxy.range_requests)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(artifact)
+    assert all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1))
+    assert _leftovers(tmp_path) == []
+
+
+def test_segmented_download_without_byte_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr('ansible_infra.download.MIN_SEGMENT_SIZE', 16 * 1024)
+    with MockGalaxy(num_collections=1, artifact_size=128 * 1024, byte_ranges=False) as galaxy:
+        artifact = galaxy.artifact(COLLECTION, '1.0.0')
+        dest = tmp_path / FILENAME
+        # A part file that cannot be resumed
+        (tmp_path / f'{FILENAME}.part').write_bytes(artifact[:1024])
+        _download(galaxy, dest, hashlib.sha256(artifact).hexdigest(), size=len(artifact))
+
+    # The whole file was downloaded in one piece instead
+    assert dest.read_bytes() == artifact
+    assert _leftovers(tmp_path) == []
+
+
+@pytest.mark.parametrize('min_segment_size', [None, 16 * 1024])
+def test_checksum_mismatch_removes_part_files(tmp_path, monkeypatch, min_segment_size):
+    if min_segment_size:
+        monkeypatch.setattr('ansible_infra.download.MIN_SEGMENT_SIZE', min_segment_size)
+    with MockGalaxy(num_collections=1, artifact_size=128 * 1024) as galaxy:
+        dest = tmp_path / FILENAME
+        with pytest.raises(DownloadFailure, match='Failed checksum'):
+            _download(galaxy, dest, '0' * 64, size=128 * 1024)
+
+    assert not dest.exists()
+    assert _leftovers(tmp_path) == []
@@ -0,0 +1,70 @@
+import asyncio
+
+import aiohttp
+import pytest
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.galaxy import CollectionDownloader, GalaxyClient
+from ansible_infra.ratelimit import PRIORITY_CRITICAL
+
+
+class RecordingScheduler:
+    def __init__(self):
+        self.priorities = []
+
+    async def acquire(self, priority):
+        self.priorities.append(priority)
+
+    def observe(self, response):
+        pass
+
+
+def _get_versions(galaxy, collection):
+    async def run():
+        async with aiohttp.ClientSession() as aio_session:
+            client = GalaxyClient(galaxy.url, aio_session)
+            return await client.get_versions(collection)
+
+    return asyncio.run(run())
+
+
+def _page_requests(galaxy):
+    return [path for _method, path in galaxy.requests if '/versions/' in path]
+
+
+@pytest.mark.parametrize('num_versions', [1, 10, 11, 35])
+def test_get_versions_reads_every_page(num_versions):
+    with MockGalaxy(num_collections=1, versions_per_collection=num_versions,
+                    page_size=10) as galaxy:
+        versions = _get_versions(galaxy, 'ns0.collection0')
+
+    assert versions == galaxy.collections['ns0.collection0']
+    # Every page is requested exactly once
+    assert len(_page_requests(galaxy)) == -(-num_versions // 10)
+
+
+@pytest.mark.parametrize('num_versions, count_skew', [(35, -25), (35, -5), (35, 30), (5, 30)])
+def test_get_versions_with_stale_count(num_versions, count_skew):
+    """A count which is out of date must not lose versions or fetch them twice"""
+    with MockGalaxy(num_collections=1, versions_per_collection=num_versions, page_size=10,
+                    count_skew=count_skew) as galaxy:
+        versions = _get_versions(galaxy, 'ns0.collection0')
+
+    assert versions == galaxy.collections['ns0.collection0']
+
+
+def test_download_version_lookup_is_critical():
+    """The versions listing that a download waits on goes ahead of metadata lookups"""
+    scheduler = RecordingScheduler()
+
+    async def run():
+        async with aiohttp.ClientSession() as aio_session:
+            client = GalaxyClient(galaxy.url, aio_session, scheduler=scheduler)
+            downloader = CollectionDownloader(client)
+            return await downloader.get_latest_matching_version('ns0.collection0', '>=1.0.0')
+
+    with MockGalaxy(num_collections=1, versions_per_collection=25, page_size=10) as galaxy:
+        version = asyncio.run(run())
+
+    assert str(version) == '1.24.0'
+    assert scheduler.priorities == [PRIORITY_CRITICAL] * 3
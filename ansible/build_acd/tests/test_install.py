@@ -0,0 +1,45 @@
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+from ansible_infra.install import InvalidCollection, install_collection
+
+
+MANIFEST = {'collection_info': {'namespace': 'community', 'name': 'general', 'version': '1.0.0'}}
+
+
+def _make_collection(path, extra_members=()):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, data, mode in ((('MANIFEST.json', json.dumps(MANIFEST).encode('utf-8'), 0o600),
+                                  ('plugins/modules/ping.py', b'#!/usr/bin/python\n', 0o700))
+                                 + tuple(extra_members)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = mode
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def test_install_collection(tmp_path):
+    tarball = _make_collection(tmp_path / 'community-general-1.0.0.tar.gz')
+
+    assert install_collection(tarball, tmp_path / 'ansible') == 'community.general'
+
+    collection_dir = tmp_path / 'ansible' / 'ansible_collections' / 'community' / 'general'
+    assert json.loads((collection_dir / 'MANIFEST.json').read_text()) == MANIFEST
+    module = collection_dir / 'plugins' / 'modules' / 'ping.py'
+    assert module.read_bytes() == b'#!/usr/bin/python\n'
+    assert os.stat(module).st_mode & 0o777 == 0o755
+    assert os.stat(collection_dir / 'MANIFEST.json').st_mode & 0o777 == 0o644
+
+
+def test_install_collection_path_traversal(tmp_path):
+    tarball = _make_collection(tmp_path / 'community-general-1.0.0.tar.gz',
+                               (('../../../../evil.py', b'', 0o644),))
+
+    with pytest.raises(InvalidCollection):
+        install_collection(tarball, tmp_path / 'ansible')
+    assert not (tmp_path / 'evil.py').exists()
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.cli import download_and_install_collections
+from ansible_infra.galaxy import CollectionDownloader, GalaxyClient
+from ansible_infra.install import InvalidCollection
+from ansible_infra.retry import PartialFailure
+from ansible_infra.session import PooledSession
+from ansible_infra.stats import BuildStats
+
+
+def _pipeline(galaxy, tmp_path, deps, stats=None):
+    download_dir = tmp_path / 'downloads'
+    download_dir.mkdir()
+
+    async def run():
+        async with PooledSession() as aio_session:
+            downloader = CollectionDownloader(GalaxyClient(galaxy.url, aio_session))
+            return await download_and_install_collections(
+                str(tmp_path / 'ansible'), deps, str(download_dir), downloader, stats=stats)
+
+    return asyncio.run(run())
+
+
+def _installed(tmp_path, collection):
+    return (tmp_path / 'ansible' / 'ansible_collections' / collection.replace('.', '/')
+            / 'MANIFEST.json').exists()
+
+
+def test_pipeline_installs_everything(tmp_path):
+    stats = BuildStats()
+    with MockGalaxy(num_collections=4) as galaxy:
+        deps = {c: '>=1.0.0' for c in galaxy.collections}
+        versions = _pipeline(galaxy, tmp_path, deps, stats=stats)
+
+    assert {c: str(v) for c, v in versions.items()} == {c: '1.2.0' for c in deps}
+    assert all(_installed(tmp_path, c) for c in deps)
+    assert all('install_seconds' in stats.collections[c] for c in deps)
+
+
+def test_pipeline_reports_download_and_install_failures(tmp_path):
+    with MockGalaxy(num_collections=4, broken_collections=['ns1.collection1']) as galaxy:
+        deps = {c: '>=1.0.0' for c in galaxy.collections}
+        deps['ns9.missing'] = '>=1.0.0'
+        with pytest.raises(PartialFailure) as excinfo:
+            _pipeline(galaxy, tmp_path, deps)
+
+    failure = excinfo.value
+    assert sorted(failure.failures) == ['ns1.collection1', 'ns9.missing']
+    assert isinstance(failure.failures['ns1.collection1'], InvalidCollection)
+    # Everything else was still installed
+    assert sorted(failure.results) == ['ns0.collection0', 'ns2.collection2', 'ns3.collection3']
+    assert all(_installed(tmp_path, c) for c in failure.results)
+
+
+def test_build_single_reports_install_failures(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=3, broken_collections=['ns1.collection1']) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-single', galaxy) == 1
+
+    out = capsys.readouterr().out
+    assert 'ns1.collection1: ' in out
+    assert '1 of 3 collections failed' in out
+    assert not (tmp_path / 'ansible-2.10.0.tar.gz').exists()
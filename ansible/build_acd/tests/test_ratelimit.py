@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from ansible_infra.ratelimit import PRIORITY_BACKGROUND, PRIORITY_CRITICAL, RequestScheduler
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+
+def test_critical_requests_go_first():
+    order = []
+
+    async def request(scheduler, name, priority):
+        await scheduler.acquire(priority)
+        order.append(name)
+
+    async def run():
+        scheduler = RequestScheduler(rate=50, burst=1)
+        tasks = [asyncio.create_task(request(scheduler, f'prefetch{n}', PRIORITY_BACKGROUND))
+                 for n in range(3)]
+        # Let the prefetches queue up behind the first one before the critical request arrives
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request(scheduler, 'download', PRIORITY_CRITICAL)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ['prefetch0', 'download', 'prefetch1', 'prefetch2']
+
+
+def test_throttling_slows_down():
+    async def run():
+        scheduler = RequestScheduler(rate=40, burst=4)
+        scheduler.observe(FakeResponse(429, {'Retry-After': '0'}))
+        assert scheduler.rate == 20
+
+        # The bucket was emptied so each request now waits for a token
+        start = time.monotonic()
+        for _ in range(3):
+            await scheduler.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.1
+
+
+def test_rate_limit_headers():
+    scheduler = RequestScheduler(rate=40)
+    scheduler.observe(FakeResponse(200, {'X-RateLimit-Remaining': '30',
+                                         'X-RateLimit-Reset': '10'}))
+    assert scheduler.rate == 3
+
+    scheduler.observe(FakeResponse(200))
+    assert scheduler.rate == 4
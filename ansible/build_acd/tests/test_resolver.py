@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+import semantic_version as semver
+
+from ansible_infra.compat import CompatibilityChecker
+from ansible_infra.resolver import DependencyConflict, DependencyResolver
+
+
+class FakeGalaxyClient:
+    def __init__(self, releases, requires=None):
+        # releases maps collection to a mapping of version to its dependencies
+        self.releases = releases
+        # requires maps (collection, version) to the release's requires_ansible
+        self.requires = requires or {}
+        self.requested = []
+
+    async def get_versions(self, collection):
+        return list(self.releases[collection])
+
+    async def get_release_info(self, collection, version, priority=None):
+        self.requested.append((collection, str(version)))
+        return {'version': str(version),
+                'metadata': {'dependencies': self.releases[collection][str(version)],
+                             'requires_ansible': self.requires.get((collection, str(version)))}}
+
+
+def test_resolve_adds_transitive_dependencies():
+    client = FakeGalaxyClient({
+        'ns.app': {'1.0.0': {'ns.lib': '>=1.0.0,<2.0.0', 'ns.util': '*'}},
+        'ns.lib': {'1.0.0': {}, '1.4.0': {'ns.util': '>=2.0.0'}, '2.0.0': {}},
+        'ns.util': {'1.0.0': {}, '2.1.0': {}},
+    })
+    resolved = asyncio.run(DependencyResolver(client).resolve(
+        {'ns.app': semver.Version('1.0.0')}))
+
+    assert resolved == {'ns.app': semver.Version('1.0.0'), 'ns.lib': semver.Version('1.4.0'),
+                        'ns.util': semver.Version('2.1.0')}
+    # Every collection is only visited once
+    assert sorted(client.requested) == [('ns.app', '1.0.0'), ('ns.lib', '1.4.0'),
+                                        ('ns.util', '2.1.0')]
+
+
+def test_resolve_conflict():
+    client = FakeGalaxyClient({
+        'ns.app': {'1.0.0': {'ns.lib': '>=2.0.0'}},
+        'ns.lib': {'1.0.0': {}, '2.0.0': {}},
+    })
+    with pytest.raises(DependencyConflict):
+        asyncio.run(DependencyResolver(client).resolve({'ns.app': semver.Version('1.0.0'),
+                                                        'ns.lib': semver.Version('1.0.0')}))
+
+
+def test_resolve_only_picks_compatible_dependencies():
+    client = FakeGalaxyClient({
+        'ns.app': {'1.0.0': {'ns.lib': '>=1.0.0'}},
+        'ns.lib': {'1.0.0': {}, '1.4.0': {}, '2.0.0': {}},
+    }, requires={('ns.lib', '2.0.0'): '>=2.11', ('ns.lib', '1.4.0'): '>=2.9,<2.11'})
+    resolver = DependencyResolver(client,
+                                  compatibility_checker=CompatibilityChecker(client, '2.10.0'))
+
+    resolved = asyncio.run(resolver.resolve({'ns.app': semver.Version('1.0.0')}))
+    assert resolved['ns.lib'] == semver.Version('1.4.0')
+
+    client.requires[('ns.lib', '1.4.0')] = client.requires[('ns.lib', '1.0.0')] = '>=2.11'
+    resolver = DependencyResolver(client,
+                                  compatibility_checker=CompatibilityChecker(client, '2.10.0'))
+    with pytest.raises(DependencyConflict, match='compatible with ansible-base 2.10.0'):
+        asyncio.run(resolver.resolve({'ns.app': semver.Version('1.0.0')}))
@@ -0,0 +1,63 @@
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.dependency_files import DepsFile
+
+
+def _downloads(galaxy):
+    return [path for method, path in galaxy.requests
+            if method == 'GET' and path.startswith('/download/')]
+
+
+def test_respin_picks_up_new_releases(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=3) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-single', galaxy) == 0
+        assert 'Ignoring' not in capsys.readouterr().out
+
+        # A collection releases a bugfix after 2.10.0 is out
+        galaxy.collections['ns1.collection1'].append('1.2.1')
+        downloads = len(_downloads(galaxy))
+
+        assert build_acd('build-single', galaxy,
+                         '--previous-deps-file', str(tmp_path / 'acd-2.10-2.10.0.deps'),
+                         '--previous-build-dir', str(tmp_path / 'ansible-2.10.0'),
+                         acd_version='2.10.1') == 0
+
+    # The lock file pins 2.10.0 only so the respin resolved the build file again
+    assert 'Ignoring' in capsys.readouterr().out
+    versions = DepsFile(tmp_path / 'acd-2.10-2.10.1.deps').parse()[2]
+    assert versions == {'ns0.collection0': '1.2.0', 'ns1.collection1': '1.2.1',
+                        'ns2.collection2': '1.2.0'}
+    # Only the collection which changed was downloaded
+    assert _downloads(galaxy)[downloads:] == ['/download/ns1-collection1-1.2.1.tar.gz']
+
+
+def test_new_acd_fetches_each_document_once(tmp_path, build_acd):
+    dependencies = {'ns1.collection1': {'ns0.collection0': '>=1.0.0'}}
+    with MockGalaxy(num_collections=3, dependencies=dependencies,
+                    requires_ansible='>=2.10') as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+
+    # The compatibility check, the dependency resolver, and the lock file all need the release
+    # info of the chosen versions but share one client for the whole command
+    api_requests = [path for method, path in galaxy.requests
+                    if method == 'GET' and path.startswith('/api/')]
+    assert len(api_requests) == len(set(api_requests))
+    assert '/api/v2/collections/ns1/collection1/versions/1.2.0/?format=json' in api_requests
+
+
+def test_respin_reports_missing_collections(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=2) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-single', galaxy) == 0
+        with open(tmp_path / 'acd-2.10.build', 'a') as f:
+            f.write('ns9.missing: >=1.0.0,<2.0.0\n')
+        assert build_acd('build-single', galaxy,
+                         '--previous-deps-file', str(tmp_path / 'acd-2.10-2.10.0.deps'),
+                         '--previous-build-dir', str(tmp_path / 'ansible-2.10.0'),
+                         acd_version='2.10.1') == 1
+
+    assert '1 of 3 collections failed' in capsys.readouterr().out
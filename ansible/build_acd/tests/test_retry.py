@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.retry import (MAX_RETRY_DELAY, PartialFailure, backoff_delay, gather_all,
+                                 parse_retry_after)
+
+
+def test_backoff_delay():
+    assert parse_retry_after({'Retry-After': '3'}) == 3
+    assert parse_retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0
+    assert parse_retry_after({}) is None
+
+    assert backoff_delay(0, retry_after=3) == 3
+    assert backoff_delay(0, retry_after=3600) == MAX_RETRY_DELAY
+    assert all(0 <= backoff_delay(2) <= 2 for _ in range(100))
+
+
+def test_gather_all_keeps_results():
+    async def succeed():
+        return 1
+
+    async def fail():
+        raise ValueError('broken')
+
+    with pytest.raises(PartialFailure) as excinfo:
+        asyncio.run(gather_all({'a.one': succeed(), 'a.two': fail()}))
+    assert excinfo.value.results == {'a.one': 1}
+    assert list(excinfo.value.failures) == ['a.two']
+
+
+def test_build_survives_server_errors(tmp_path, build_acd, monkeypatch):
+    monkeypatch.setattr('ansible_infra.retry.RETRY_DELAY', 0.01)
+    with MockGalaxy(num_collections=5, failure_rate=0.3) as galaxy:
+        galaxy.write_pieces_file(tmp_path / 'acd.in')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 0
+        assert build_acd('build-single', galaxy) == 0
+
+    assert any(r[1].startswith('/download/') for r in galaxy.requests)
+    assert (tmp_path / 'ansible-2.10.0.tar.gz').exists()
+
+
+def test_new_acd_reports_missing_collections(tmp_path, build_acd, capsys):
+    with MockGalaxy(num_collections=2) as galaxy:
+        (tmp_path / 'acd.in').write_text('ns0.collection0\nns9.missing\nns1.collection1\n')
+        assert build_acd('new-acd', galaxy, '--pieces-file', str(tmp_path / 'acd.in')) == 1
+
+    output = capsys.readouterr().out
+    assert 'ns9.missing' in output
+    assert '1 of 3 collections failed' in output
@@ -0,0 +1,27 @@
+import hashlib
+import os
+
+from ansible_infra.scan import DIR, FILE, SYMLINK, ManifestEntry, scan_collections
+
+
+def test_scan_collections(tmp_path):
+    collections_dir = tmp_path / 'ansible_collections'
+    for collection in ('community/general', 'ansible/posix', 'ansible/netcommon'):
+        (collections_dir / collection / 'plugins').mkdir(parents=True)
+        (collections_dir / collection / 'plugins' / 'ping.py').write_text(collection)
+    os.chmod(collections_dir / 'ansible/posix/plugins/ping.py', 0o700)
+    os.symlink('plugins/ping.py', collections_dir / 'ansible/posix/ping.py')
+
+    manifests = scan_collections(tmp_path, checksum=True)
+
+    assert list(manifests) == ['ansible.netcommon', 'ansible.posix', 'community.general']
+    assert manifests['ansible.posix'] == [
+        ManifestEntry('ping.py', SYMLINK, 0, 0o777, None, 'plugins/ping.py'),
+        ManifestEntry('plugins', DIR, 0, 0o755, None, ''),
+        ManifestEntry('plugins/ping.py', FILE, len('ansible/posix'), 0o755,
+                      hashlib.sha256(b'ansible/posix').hexdigest(), ''),
+    ]
+
+    manifests = scan_collections(tmp_path, collections=['community.general'])
+    assert list(manifests) == ['community.general']
+    assert manifests['community.general'][-1].sha256 is None
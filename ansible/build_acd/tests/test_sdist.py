@@ -0,0 +1,83 @@
+import os
+import tarfile
+
+from ansible_infra.sdist import TreeBlockCache, write_sdist
+
+
+def _make_tree(path):
+    modules = path / 'plugins' / 'modules'
+    modules.mkdir(parents=True)
+    (modules / 'ping.py').write_text('#!/usr/bin/python\n' * 100)
+    os.chmod(modules / 'ping.py', 0o700)
+    (path / 'README.md').write_text('readme\n')
+    os.symlink('plugins/modules/ping.py', path / 'ping.py')
+    return path
+
+
+def _contents(filename):
+    with tarfile.open(filename, 'r:gz') as tar:
+        return [(m.name, m.type, m.mode, m.mtime, m.linkname,
+                 tar.extractfile(m).read() if m.isfile() else None) for m in tar]
+
+
+def test_write_sdist_is_reproducible(tmp_path):
+    tree = _make_tree(tmp_path / 'tree')
+    first = tmp_path / 'first.tar.gz'
+    write_sdist(first, 'dist-1.0', {'setup.py': b'pass\n'}, trees=[('coll', tree, None)])
+    os.utime(tree / 'README.md', (0, 0))
+    second = tmp_path / 'second.tar.gz'
+    write_sdist(second, 'dist-1.0', {'setup.py': b'pass\n'}, trees=[('coll', tree, None)])
+
+    assert first.read_bytes() == second.read_bytes()
+    contents = _contents(first)
+    assert [c[0] for c in contents] == ['dist-1.0/setup.py', 'dist-1.0/coll',
+                                        'dist-1.0/coll/README.md', 'dist-1.0/coll/ping.py',
+                                        'dist-1.0/coll/plugins', 'dist-1.0/coll/plugins/modules',
+                                        'dist-1.0/coll/plugins/modules/ping.py']
+    assert contents[-1][2] == 0o755
+
+
+def test_tree_blocks_are_reused(tmp_path):
+    tree = _make_tree(tmp_path / 'tree')
+    block_cache = TreeBlockCache(tmp_path / 'cache')
+    from_tree = tmp_path / 'tree.tar.gz'
+    write_sdist(from_tree, 'dist-1.0', {}, trees=[('coll', tree, None)])
+    from_block = tmp_path / 'block.tar.gz'
+    write_sdist(from_block, 'dist-1.0', {},
+                blocks=[block_cache.get('ns.coll', '1.0.0', 'dist-1.0/coll', tree)])
+    # The block is compressed as a single member, just like the tree
+    assert from_block.read_bytes() == from_tree.read_bytes()
+
+    # A cached block does not read the tree again
+    (tree / 'README.md').write_text('changed\n')
+    reused = tmp_path / 'reused.tar.gz'
+    write_sdist(reused, 'dist-1.0', {},
+                blocks=[block_cache.get('ns.coll', '1.0.0', 'dist-1.0/coll', tree)])
+    assert reused.read_bytes() == from_tree.read_bytes()
+
+    # Placing the collection at another path needs a new block
+    moved = tmp_path / 'moved.tar.gz'
+    write_sdist(moved, 'dist-2.0', {},
+                blocks=[block_cache.get('ns.coll', '1.0.0', 'dist-2.0/coll', tree)])
+    assert (b'changed\n', 'dist-2.0/coll/README.md') in [(c[5], c[0]) for c in _contents(moved)]
+
+
+def test_tree_block_cache_evicts_least_recently_used(tmp_path):
+    tree = _make_tree(tmp_path / 'tree')
+    block_cache = TreeBlockCache(tmp_path / 'cache')
+    for idx, version in enumerate(('1.0.0', '2.0.0', '3.0.0')):
+        block = block_cache.get('ns.coll', version, 'dist/coll', tree)
+        # Make the usage order deterministic regardless of filesystem timestamp granularity
+        for filename in block_cache._paths('ns.coll', version, 'dist/coll'):
+            os.utime(filename, (idx, idx))
+    block_size = sum(os.path.getsize(f)
+                     for f in block_cache._paths('ns.coll', '1.0.0', 'dist/coll'))
+
+    # Using the oldest block makes it the most recently used one
+    block_cache.get('ns.coll', '1.0.0', 'dist/coll', tree)
+    block_cache.max_size = 2 * block_size
+    block_cache.evict()
+
+    assert block_cache.has('ns.coll', '1.0.0', 'dist/coll')
+    assert not block_cache.has('ns.coll', '2.0.0', 'dist/coll')
+    assert block_cache.has('ns.coll', '3.0.0', 'dist/coll')
@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+import io
+import json
+
+from mock_galaxy import MockGalaxy
+
+from ansible_infra.download import download_file
+from ansible_infra.ratelimit import RequestScheduler
+from ansible_infra.session import PooledSession, get_json
+from ansible_infra.stats import BuildStats
+
+
+def test_report(tmp_path):
+    progress = io.StringIO()
+    stats = BuildStats(progress=progress)
+    with stats.phase('download'):
+        stats.expect_collections(2)
+        stats.record_request('metadata', 0.5, 0.25, 100)
+        stats.record_request('download', 0, 1.0, None)
+        stats.record_download('community.general', 2.0, 1024)
+        stats.record_download('ansible.posix', 0.5, 2048)
+        stats.record_install('ansible.posix', 0.1, 3.0)
+
+    report_file = tmp_path / 'acd-2.10.0.stats.json'
+    stats.write_report(report_file)
+    report = json.loads(report_file.read_text())
+
+    assert list(report['phases']) == ['download']
+    assert report['requests']['metadata'] == {'count': 1, 'bytes': 100, 'total_latency': 0.25,
+                                              'mean_latency': 0.25, 'max_latency': 0.25,
+                                              'total_queue_wait': 0.5}
+    assert report['download_bytes'] == 3072
+    assert report['slowest_collections'] == ['ansible.posix', 'community.general']
+    assert report['collections']['ansible.posix']['install_seconds'] == 3.0
+    assert 'downloaded 2/2' in progress.getvalue()
+    assert progress.getvalue().endswith('\n')
+
+
+def test_requests_are_counted_by_kind(tmp_path):
+    stats = BuildStats()
+    # Room for one request at once so the second one waits on the scheduler
+    scheduler = RequestScheduler(rate=5, burst=1)
+
+    async def run():
+        async with PooledSession(stats=stats) as aio_session:
+            for _ in range(2):
+                await get_json(aio_session, f'{galaxy.url}pypi/ansible-base/json',
+                               scheduler=scheduler)
+            await download_file(aio_session, f'{galaxy.url}download/ns0-collection0-1.0.0.tar.gz',
+                                tmp_path / 'ns0-collection0-1.0.0.tar.gz', sha256sum)
+
+    with MockGalaxy(num_collections=1) as galaxy:
+        sha256sum = hashlib.sha256(galaxy.artifact('ns0.collection0', '1.0.0')).hexdigest()
+        asyncio.run(run())
+
+    assert stats.requests['metadata'].count == 2
+    assert stats.requests['metadata'].queue_wait >= 0.1
+    assert stats.requests['download'].count >= 1
+    assert (stats.requests['download'].bytes
+            == (tmp_path / 'ns0-collection0-1.0.0.tar.gz').stat().st_size)
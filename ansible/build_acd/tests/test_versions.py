@@ -0,0 +1,50 @@
+import semantic_version as semver
+
+from ansible_infra.cache import MetadataCache
+from ansible_infra.versions import VersionIndex, version_index
+
+
+VERSIONS = ['1.0.0', '0.1.1', '2.0.0-beta.1', '1.10.0', '1.2.0', '2.0.0', '3.1.4', '1.2.0-rc1']
+
+
+def _brute_force(spec):
+    matching = [v for v in (semver.Version(v) for v in VERSIONS) if v in spec]
+    return max(matching) if matching else None
+
+
+def test_latest_matching():
+    index = VersionIndex.from_versions(VERSIONS)
+    for spec in ('>=1.0.0,<2.0.0', '>=1.0.0', '<1.0.0', '==1.2.0', '*', '>=4.0.0', '~1.2',
+                 '>=2.0.0-beta.1,<2.0.0', '<=3.1.4,>=3.0.0'):
+        spec = semver.SimpleSpec(spec)
+        assert index.latest_matching(spec) == _brute_force(spec)
+
+
+def test_descending():
+    index = VersionIndex.from_versions(VERSIONS)
+    assert [str(v) for v in index.descending()] == ['3.1.4', '2.0.0', '2.0.0-beta.1', '1.10.0',
+                                                    '1.2.0', '1.2.0-rc1', '1.0.0', '0.1.1']
+
+
+def test_version_index_is_cached(tmp_path):
+    metadata_cache = MetadataCache(tmp_path)
+    version_index('community.general', VERSIONS, metadata_cache)
+
+    cached = version_index('community.general', VERSIONS, metadata_cache)
+    # Loaded from the cache, nothing has been parsed yet
+    assert not cached._parsed
+    assert cached.latest_matching(semver.SimpleSpec('>=1.0.0,<2.0.0')) == semver.Version('1.10.0')
+
+
+def test_version_index_is_replaced_when_versions_change(tmp_path):
+    metadata_cache = MetadataCache(tmp_path)
+    version_index('community.general', VERSIONS, metadata_cache)
+    entries = sorted(tmp_path.rglob('*'))
+
+    index = version_index('community.general', VERSIONS + ['4.0.0'], metadata_cache)
+    assert index.latest_matching(semver.SimpleSpec('*')) == semver.Version('4.0.0')
+    # The new index took the place of the old one
+    assert sorted(tmp_path.rglob('*')) == entries
+    cached = version_index('community.general', VERSIONS + ['4.0.0'], metadata_cache)
+    assert not cached._parsed
+    assert len(cached) == len(VERSIONS) + 1
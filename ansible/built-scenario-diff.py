@@ -3,7 +3,7 @@ import os
 import sys
 from pprint import pprint
 
-import yaml
+import fastyaml
 
 
 PLUGIN_TYPES = ('modules', 'module_utils', 'action', 'become', 'cache', 'callback', 'cliconf',
@@ -62,7 +62,7 @@ def main():
         extra_plugins = plugins.difference(base_plugins[plugin_type])
         if extra_plugins:
             print(f'## {plugin_type} ##')
-            print(yaml.dump(sorted(list(extra_plugins))))
+            print(fastyaml.dump(sorted(list(extra_plugins))))
             print()
 
     print('***************************')
@@ -71,7 +71,7 @@ def main():
         extra_plugins = plugins.difference(minimal_plugins[plugin_type])
         if extra_plugins:
             print(f'## {plugin_type} ##')
-            print(yaml.dump(sorted(list(extra_plugins))))
+            print(fastyaml.dump(sorted(list(extra_plugins))))
             print()
 
     print('********************************')
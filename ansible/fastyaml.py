@@ -0,0 +1,55 @@
+"""
+YAML loading and dumping shared by the scripts in this directory
+
+PyYAML's C bindings to LibYAML are used when they are available as they are many times faster than
+the pure Python implementation.  ansible's vault-aware loader is only used for the files which need
+it (they have vaulted values or ansible-specific tags) as it is much slower still.
+"""
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+
+# Markers of content that only ansible's loader understands
+ANSIBLE_MARKERS = ('!vault', '!unsafe', '$ANSIBLE_VAULT')
+
+# ansible's DataLoader, created the first time that it's needed
+_data_loader = None
+
+
+def safe_load(stream):
+    """
+    yaml.safe_load() using LibYAML when it is available
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def dump(data, stream=None, **kwargs):
+    """
+    yaml.dump() for plain python data using LibYAML when it is available
+    """
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwargs)
+
+
+def load_ansible_yaml(text):
+    """
+    Load a playbook, task file, or other yaml file that ansible would read
+
+    Files are loaded with the safe loader unless they contain vaulted values or ansible-specific
+    tags, or the safe loader can't parse them.  Those are loaded by ansible's DataLoader.
+    """
+    if not any(marker in text for marker in ANSIBLE_MARKERS):
+        try:
+            return safe_load(text)
+        except yaml.YAMLError:
+            pass
+
+    global _data_loader
+    if _data_loader is None:
+        from ansible.parsing.dataloader import DataLoader
+        _data_loader = DataLoader()
+    return _data_loader.load(text)
@@ -7,18 +7,22 @@ Note:  mattclay is creating some tools which will be much better for answering t
 This script might still be helpful for answering the question:
     * What modules are widely used by other integration tests?
 """
+import functools
+import hashlib
 import itertools
+import json
 import os
 import pathlib
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pprint
-from collections import defaultdict
+from collections import defaultdict, deque
 from collections.abc import Mapping, Sequence
 
 import requests
-import yaml
 from six import string_types
-from ansible.parsing.dataloader import DataLoader
+
+import fastyaml
 
 
 # Tests for core features
@@ -203,8 +207,99 @@ SPECIAL_CASES = {
 }
 
 
-def parse_yaml_for_modules(ydata):
+# Keywords which bring in the tasks of another task file
+INCLUDE_KEYWORDS = ('include_tasks', 'import_tasks', 'include',
+                    'ansible.builtin.include_tasks', 'ansible.builtin.import_tasks',
+                    'ansible.builtin.include')
+
+# Keys of a play which hold task lists
+PLAY_TASK_LISTS = ('tasks', 'pre_tasks', 'post_tasks', 'handlers')
+
+
+def iter_tasks(ydata):
+    """
+    Yield the tasks of a playbook or task list, including the ones nested in blocks
+
+    The tasks are walked with a worklist so the time taken is linear in the number of tasks and
+    blocks can be nested to any depth.
+    """
+    # skip files that are not task lists
+    if not ydata or not isinstance(ydata, Sequence) or isinstance(ydata, string_types):
+        return
+
+    for x in ydata:
+
+        if not isinstance(x, Mapping):
+            continue
+
+        if 'hosts' in x or any(key in x for key in PLAY_TASK_LISTS):
+            tasks = deque()
+            for key in PLAY_TASK_LISTS:
+                if isinstance(x.get(key), list):
+                    tasks.extend(x[key])
+        else:
+            tasks = deque([x])
+
+        while tasks:
+            task = tasks.popleft()
+
+            if not task:
+                continue
+
+            # 'include ../tasks/main.yml'
+            if not hasattr(task, 'keys'):
+                continue
+
+            if 'block' in task:
+                for key in ('block', 'rescue', 'always'):
+                    if isinstance(task.get(key), list):
+                        tasks.extend(task[key])
+                continue
 
+            yield task
+
+
+def task_includes(task):
+    """
+    Yield the task files that a task includes or imports, as they are written in the task
+    """
+    for keyword in INCLUDE_KEYWORDS:
+        reference = task.get(keyword)
+        if isinstance(reference, Mapping):
+            reference = reference.get('file')
+        # Templated filenames can't be followed
+        if not isinstance(reference, string_types) or '{{' in reference:
+            continue
+
+        # 'include: tasks.yml var=value'
+        reference = reference.split()
+        if reference:
+            yield reference[0]
+
+
+def resolve_include(filename, reference):
+    """
+    Return the path of a task file that filename includes or None if it does not exist
+    """
+    included = os.path.normpath(os.path.join(os.path.dirname(filename), reference))
+    if os.path.isfile(included):
+        return included
+    return None
+
+
+def warn_unparsable_task(task):
+    """
+    Tell the user that the module a task uses could not be worked out so the task is skipped
+    """
+    print('Skipping a task whose module cannot be determined: %r' % (task,), file=sys.stderr)
+
+
+def parse_yaml_for_modules(ydata, includes=None):
+    """
+    Return the modules used by the tasks in ydata
+
+    If includes is a set, the task files that the tasks include or import are added to it.
+    """
     keywords = ['args', 'beome', 'become', 'bocome_users', 'become_user',
                 'name',
                 'register', 'regrister', 'any_errors_fatal', 'change_when',
@@ -228,270 +323,410 @@ def parse_yaml_for_modules(ydata):
 
     mrefs = set()
 
-    if ydata:
-        # skip files that are not task lists
-        if not isinstance(ydata, Sequence) or isinstance(ydata, string_types):
-            return mrefs
+    for task in iter_tasks(ydata):
+        if includes is not None:
+            includes.update(task_includes(task))
+
+        module = None
+
+        keys = [k for k in task.keys() if k not in keywords]
+        keys = [k for k in keys if not k.startswith('with_')]
+
+        #print keys
+        if not keys:
+            continue
+
+        elif len(keys) == 1:
+            module = keys[0]
+
+            if module == 'action':
+                module = task[module]
+                if isinstance(module, dict) and 'module' in module:
+                    module = module['module']
+                elif module.startswith('{{'):
+                    # action: {{ ansible_pkg_mgr }}
+                    module = module.split('}}')[0]
+                    module = module.replace('{{', '')
+                    module = module.strip()
+                elif ' ' in module:
+                    module = module.split()[0].strip()
+
+            if isinstance(module, Mapping):
+                if 'module' in module:
+                    module = module['module']
+
+            if module == 'local_action':
+                if isinstance(task['local_action'], Mapping):
+                    module = task['local_action']['module']
+                elif isinstance(task['local_action'], string_types):
+                    module = task['local_action'].split()[0].strip()
+            if module == 'action':
+                if isinstance(task['action'], Mapping):
+                    module = task['action']['module']
+                elif isinstance(task['action'], string_types):
+                    module = task['action'].split()[0].strip()
+
+            if '{{' in module:
+                module = module.replace('{{', '')
+                module = module.replace('}}', '')
+
+            #if not module in mrefs:
+            #    mrefs[module] = 0
+            #mrefs[module] += 1
+
+        elif 'vars_prompt' in keys:
+            module = 'vars_prompt'
+
+        else:
+
+            module = None
+            if 'include' in keys:
+                module = 'include'
+            elif 'action' in keys:
+                if isinstance(task['action'], Mapping) and 'module' in task['action']:
+                    module = task['action']['module']
+                elif isinstance(task['action'], string_types):
+                    module = task['action']
+                    if module.startswith('{{'):
+                        # action: {{ ansible_pkg_mgr }}
+                        module = module.split('}}')[0]
+                        module = module.replace('{{', '')
+                        module = module.strip()
+                    elif ' ' in module:
+                        module = module.split()[0].strip()
+                    else:
+                        warn_unparsable_task(task)
+                        continue
+                else:
+                    warn_unparsable_task(task)
+                    continue
+            elif len(keys) == 1:
+                module = keys[0]
 
-        for x in ydata:
+            else:
 
-            if not isinstance(x, Mapping):
-                continue
+                for key in keys:
+                    if key in mrefs:
+                        module = key
+                        break
 
-            if x is None:
-                continue
+        if module:
+            mrefs.add(module)
 
-            if 'hosts' in x or 'tasks' in x or 'post_tasks' in x or 'pre_tasks' in x or 'handlers' in x:
+    return mrefs
 
-                tasks = []
-                if 'tasks' in x and x['tasks']:
-                    tasks += x['tasks']
-                if 'pre_tasks' in x and x['pre_tasks']:
-                    tasks += x['pre_tasks']
-                if 'post_tasks' in x and x['post_tasks']:
-                    tasks += x['post_tasks']
-                if 'handlers' in x and x['handlers']:
-                    tasks += x['handlers']
 
-            else:
-                tasks = [x]
+def get_minimal_set():
+    url = 'https://raw.githubusercontent.com/ansible-community/collection_migration/master/scenarios/nwo/ansible.yml'
+    data = requests.get(url)
 
-            if not tasks:
-                continue
+    parsed_data = fastyaml.safe_load(data.text)
 
-            if not isinstance(tasks, list):
-                continue
+    return parsed_data['_core']
 
-            iterations = 0
-            while tasks and iterations <= 100:
 
-                iterations += 1
+def format_tasks(tasks):
+    return (os.path.splitext(os.path.basename(t))[0] for t in tasks)
 
-                for task in tasks[:]:
 
-                    #if 'homebrew' in str(task) and 'darwin-family' in cp:
-                    #    import epdb; epdb.st()
+def get_minimal_tasks(minimal_plugins):
+    minimal_actions = minimal_plugins['action']
+    minimal_modules = minimal_plugins['modules']
+    minimal_tasks = frozenset(itertools.chain(format_tasks(minimal_actions), format_tasks(minimal_modules)))
+    return minimal_tasks
 
-                    tasks.remove(task)
 
-                    module = None
+# Rules which decide the groups of a test target, tried in order until one matches.  Each rule is
+# (kind, pattern, groups):
+#   * exact: The target is named pattern
+#   * prefix: The target's name starts with pattern
+#   * strip_prefix: The target's name starts with pattern.  The group is the rest of the name and
+#     groups is ignored
+#
+# These are other potential special cases but I'm not sure how to deal with them:
+#
+# lookup_properties (?) uses ini lookup plugin but is that what it's testing(?)
+# lookup_passwordstore (?)
+# lookup_lmdb_kv
+# lookup_hashi_vault
+# netconf_config netconf_get netconf_rpc (?) netconf is a plugin type but all of these
+#   tests require a specific device (junos, iosxr sros)
+# inventory_kubevirt_conformance
+# inventory_foreman_script
+# inventory_foreman
+# connection_lxd
+# connection_lxc
+# connection_libvirt_lxc
+# connection_jail
+# connection_chroot
+# connection_buildah
+# callback_log_plays
+TARGET_RULES = (
+    [('exact', target, groups) for target, groups in SPECIAL_CASES.items()]
+    + [('prefix', 'digital_', ['digital_ocean'])]
+    + [('prefix', prefix, ['aws']) for prefix in (
+        'sts_', 'sqs_', 's3_', 'rds_', 'lambda_', 'inventory_aws_', 'iam_', 'elb_', 'ecs_', 'ec2_',
+        'dms_', 'cloudtrail_', 'cloudformation_', 'cloudfront_')]
+    + [('exact', target, ['aws']) for target in (
+        'sns', 'sns_topic', 'setup_ec2', 'route53', 'cloudtrail', 'cloudformation', 'cloudfront')]
+    # test targets for core features (vars_prompt, strategy)
+    + [('exact', target, ['_core']) for target in sorted(CORE_FEATURE_TARGETS)]
+)
+
+# Rules tried after TARGET_RULES and the minimal set
+FALLBACK_TARGET_RULES = (
+    ('strip_prefix', 'setup_', None),
+    ('strip_prefix', 'prepare_', None),
+)
+
+
+class TargetClassifier:
+    """
+    Rules compiled into a lookup table of exact names and a prefix trie
 
-                    if not task:
-                        continue
+    Classifying a target takes time proportional to the length of its name, however many rules
+    there are, and the result is remembered.
+    """
 
-                    # 'include ../tasks/main.yml'
-                    if not hasattr(task, 'keys'):
-                        continue
+    def __init__(self, rules):
+        self.rules = rules
+        self._exact = {}
+        self._trie = {}
+        self._memo = {}
+
+        for index, (kind, pattern, _groups) in enumerate(rules):
+            if kind == 'exact':
+                self._exact.setdefault(pattern, index)
+            elif kind in ('prefix', 'strip_prefix'):
+                node = self._trie
+                for char in pattern:
+                    node = node.setdefault(char, {})
+                # The None key of a node marks the end of a prefix
+                node.setdefault(None, index)
+            else:
+                raise ValueError('Unknown kind of target rule: %s' % kind)
+
+    def _match(self, target):
+        """
+        Return the index of the first rule which matches target or None
+        """
+        matches = []
+        if target in self._exact:
+            matches.append(self._exact[target])
+
+        node = self._trie
+        for char in target:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                matches.append(node[None])
+
+        return min(matches, default=None)
+
+    def classify(self, target):
+        """
+        Return the groups a target belongs to
+        """
+        if target in self._memo:
+            return self._memo[target]
+
+        index = self._match(target)
+        if index is not None:
+            kind, pattern, groups = self.rules[index]
+            if kind == 'strip_prefix':
+                groups = [target[len(pattern):]]
+        elif '_' in target:
+            subject = target.index('_')
+            groups = [target[:subject]]
+        else:
+            groups = [target]
+
+        self._memo[target] = groups
+        return groups
+
+
+@functools.lru_cache(maxsize=None)
+def _classifier(core_targets):
+    # The minimal set goes between the fixed rules and the fallbacks
+    rules = (list(TARGET_RULES)
+             + [('exact', target, ['_core']) for target in sorted(core_targets)]
+             + list(FALLBACK_TARGET_RULES))
+    return TargetClassifier(rules)
 
-                    if 'block' in task:
-                        if 'block' not in mrefs:
-                            #mrefs.add('block')
-                            tasks += task['block']
-                        if 'rescue' in task:
-                            tasks += task['rescue']
-                        if 'always' in task:
-                            tasks += task['always']
-                        continue
 
-                    keys = [k for k in task.keys() if k not in keywords]
-                    keys = [k for k in keys if not k.startswith('with_')]
+def which_groups(target, core_targets):
+    """
+    Return the groups a target belongs to
 
-                    #print keys
-                    if not keys:
-                        continue
+    :arg core_targets: frozenset of the targets in the minimal set
+    """
+    return _classifier(core_targets).classify(target)
 
-                    elif len(keys) == 1:
-                        module = keys[0]
-
-                        if module == 'action':
-                            module = task[module]
-                            if isinstance(module, dict) and 'module' in module:
-                                module = module['module']
-                            elif module.startswith('{{'):
-                                # action: {{ ansible_pkg_mgr }}
-                                module = module.split('}}')[0]
-                                module = module.replace('{{', '')
-                                module = module.strip()
-                            elif ' ' in module:
-                                module = module.split()[0].strip()
-                            #else:
-                            #    import epdb; epdb.st()
-
-                        if isinstance(module, Mapping):
-                            if 'module' in module:
-                                module = module['module']
-                            #import epdb; epdb.st()
-
-                        if module == 'local_action':
-                            if isinstance(task['local_action'], Mapping):
-                                module = task['local_action']['module']
-                            elif isinstance(task['local_action'], string_types):
-                                module = task['local_action'].split()[0].strip()
-                        if module == 'action':
-                            if isinstance(task['action'], Mapping):
-                                module = task['action']['module']
-                            elif isinstance(task['action'], string_types):
-                                module = task['action'].split()[0].strip()
-
-                        if '{{' in module:
-                            module = module.replace('{{', '')
-                            module = module.replace('}}', '')
-
-                        #if not module in mrefs:
-                        #    mrefs[module] = 0
-                        #mrefs[module] += 1
-
-                    elif 'vars_prompt' in keys:
-                        module = 'vars_prompt'
 
-                    else:
+# Bump this whenever parse_yaml_for_modules changes what it returns so that stale cache entries
+# are not used
+MODULE_CACHE_VERSION = 3
 
-                        module = None
-                        if 'include' in keys:
-                            module = 'include'
-                        elif 'action' in keys:
-                            #import epdb; epdb.st()
-                            if isinstance(task['action'], Mapping):
-                                module = task['action']['module']
-                                #import epdb; epdb.st()
-                            elif isinstance(task['action'], string_types):
-                                module = task['action']
-                                if module.startswith('{{'):
-                                    # action: {{ ansible_pkg_mgr }}
-                                    module = module.split('}}')[0]
-                                    module = module.replace('{{', '')
-                                    module = module.strip()
-                                elif ' ' in module:
-                                    module = module.split()[0].strip()
-                                else:
-                                    import epdb; epdb.st()
-                            else:
-                                import epdb; epdb.st()
-                        elif len(keys) == 1:
-                            module = keys[0]
-
-                        else:
-
-                            known = False
-                            for key in keys:
-                                if key in mrefs:
-                                    known = True
-                                    module = key
-                                    break
-
-                            '''
-                            if not known:
-                                print('#    Too many keys left ...')
-                                print('\t' + ','.join(keys))
-                                import epdb; epdb.st()
-                                module = keys[0]
-                                #pass
-                            '''
-
-                    if module:
-                        mrefs.add(module)
 
-    return mrefs
+def default_cache_file():
+    """
+    Return the module cache file to use, which can be overridden with $INTEGRATION_TEST_PARSER_CACHE
+    """
+    if 'INTEGRATION_TEST_PARSER_CACHE' in os.environ:
+        return os.environ['INTEGRATION_TEST_PARSER_CACHE']
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache_home, 'integration-test-parser', 'modules.json')
 
 
-def get_minimal_set():
-    url = 'https://raw.githubusercontent.com/ansible-community/collection_migration/master/scenarios/nwo/ansible.yml'
-    data = requests.get(url)
+class ModuleCache:
+    """
+    Persistent record of the modules that each yaml file uses and the task files it includes
 
-    parsed_data = yaml.safe_load(data.text)
+    An entry is used as long as the file has the same size and mtime.  If only the mtime changed
+    (for instance, git rewrote the file when switching branches), the file's sha256 decides.
+    """
 
-    return parsed_data['_core']
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        # A cache from another version of this script, or one that isn't ours, is started over
+        if isinstance(data, dict) and data.get('version') == MODULE_CACHE_VERSION:
+            self.entries = data['files']
+
+    def lookup(self, filename, stat):
+        """
+        Return the modules that filename uses and the task files it includes or None if they have
+        to be parsed from the file
+        """
+        entry = self.entries.get(filename)
+        if entry is None or entry['size'] != stat.st_size:
+            return None
+
+        if entry['mtime_ns'] != stat.st_mtime_ns:
+            with open(filename, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() != entry['sha256']:
+                    return None
+            entry['mtime_ns'] = stat.st_mtime_ns
+
+        return set(entry['modules']), entry['includes']
+
+    def store(self, filename, stat, sha256, modules, includes):
+        self.entries[filename] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                  'sha256': sha256, 'modules': sorted(modules),
+                                  'includes': includes}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        tmp_filename = '%s.%s.tmp' % (self.filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            json.dump({'version': MODULE_CACHE_VERSION, 'files': self.entries}, f)
+        os.replace(tmp_filename, self.filename)
+
+
+def find_yaml_files(target):
+    """
+    Yield the yaml files in a test target
+    """
+    for root, _dummy, files in os.walk(target):
+        root = pathlib.Path(root)
+        for potential_file in files:
+            if potential_file.endswith('.yml') or potential_file.endswith('.yaml'):
+                yield os.path.abspath(root / potential_file)
 
 
-def format_tasks(tasks):
-    return (os.path.splitext(os.path.basename(t))[0] for t in tasks)
+def scan_file(filename):
+    """
+    Return the filename, the sha256 of its contents, the modules used by it, and the task files
+    that it includes.  Runs in a worker of the scanning pool.
+    """
+    with open(filename, 'rb') as f:
+        contents = f.read()
 
+    try:
+        data = fastyaml.load_ansible_yaml(contents.decode('utf-8'))
+    except Exception:
+        print('Error while parsing yaml file %s' % filename)
+        raise
 
-def get_minimal_tasks(minimal_plugins):
-    minimal_actions = minimal_plugins['action']
-    minimal_modules = minimal_plugins['modules']
-    minimal_tasks = frozenset(itertools.chain(format_tasks(minimal_actions), format_tasks(minimal_modules)))
-    return minimal_tasks
+    includes = set()
+    modules = parse_yaml_for_modules(data, includes=includes)
+    return filename, hashlib.sha256(contents).hexdigest(), modules, sorted(includes)
 
 
-def which_groups(target, core_targets):
+def scan_groups(groups, max_workers=None, cache=None):
     """
-    Return the groups a target belongs to
+    Return the modules used by the test targets of each group
+
+    The yaml files are parsed by a pool of max_workers processes (default: one per cpu).  Task
+    files that they include or import are followed, even into other targets, and the modules used
+    there count towards the groups of the including file.  Every file is only parsed once, however
+    many groups use it, and files which a :class:`ModuleCache` has up to date entries for are not
+    parsed at all.
     """
-    # The first conditions are all special cases
-    if target in SPECIAL_CASES:
-        return SPECIAL_CASES[target]
-    elif target.startswith('digital_'):
-        return ['digital_ocean']
-    elif target.startswith('sts_'):
-        return ['aws']
-    elif target.startswith('sqs_'):
-        return ['aws']
-    elif target.startswith('s3_'):
-        return ['aws']
-    elif target.startswith('rds_'):
-        return ['aws']
-    elif target.startswith('lambda_'):
-        return ['aws']
-    elif target.startswith('inventory_aws_'):
-        return ['aws']
-    elif target.startswith('iam_'):
-        return ['aws']
-    elif target.startswith('elb_'):
-        return ['aws']
-    elif target.startswith('ecs_'):
-        return ['aws']
-    elif target.startswith('ec2_'):
-        return ['aws']
-    elif target.startswith('dms_'):
-        return ['aws']
-    elif target in ('sns', 'sns_topic'):
-        return ['aws']
-    elif target == 'setup_ec2':
-        return ['aws']
-    elif target == 'route53':
-        return ['aws']
-    elif target =='cloudtrail' or target.startswith('cloudtrail_'):
-        return ['aws']
-    elif target =='cloudformation' or target.startswith('cloudformation_'):
-        return ['aws']
-    elif target =='cloudfront' or target.startswith('cloudfront_'):
-        return ['aws']
-    elif False:
-        # These are other potential special cases but I'm not sure how to deal with them:
-        #
-        # lookup_properties (?) uses ini lookup plugin but is that what it's testing(?)
-        # lookup_passwordstore (?)
-        # lookup_lmdb_kv
-        # lookup_hashi_vault
-        # netconf_config netconf_get netconf_rpc (?) netconf is a plugin type but all of these
-        #   tests require a specific device (junos, iosxr sros)
-        # inventory_kubevirt_conformance
-        # inventory_foreman_script
-        # inventory_foreman
-        # connection_lxd
-        # connection_lxc
-        # connection_libvirt_lxc
-        # connection_jail
-        # connection_chroot
-        # connection_buildah
-        # callback_log_plays
-        pass
-    elif target in CORE_FEATURE_TARGETS:
-        # test targets for core features (vars_prompt, strategy)
-        return ['_core']
-    elif target in core_targets:
-        # The minimal set
-        return ['_core']
-    elif target.startswith('setup_'):
-        return [target[6:]]
-    elif target.startswith('prepare_'):
-        return [target[8:]]
-    elif '_' in target:
-        subject = target.index('_')
-        return [target[:subject]]
-    else:
-        return [target]
+    file_groups = defaultdict(set)
+    for group, test_targets in groups.items():
+        for target in test_targets:
+            for filename in find_yaml_files(target):
+                file_groups[filename].add(group)
+
+    # Modules used by each file and the files it includes
+    file_modules = {}
+    file_includes = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = set(file_groups)
+        while pending:
+            to_parse = {}
+            for filename in pending:
+                stat = os.stat(filename)
+                if cache is not None and (cached := cache.lookup(filename, stat)) is not None:
+                    file_modules[filename], includes = cached
+                    file_includes[filename] = includes
+                else:
+                    to_parse[filename] = stat
+
+            for filename, sha256, modules, includes in pool.map(scan_file, to_parse,
+                                                                chunksize=16):
+                file_modules[filename] = modules
+                file_includes[filename] = includes
+                if cache is not None:
+                    cache.store(filename, to_parse[filename], sha256, modules, includes)
+
+            # Resolve the includes of the files we just read and parse the ones we haven't yet
+            new_pending = set()
+            for filename in pending:
+                resolved = (resolve_include(filename, i) for i in file_includes[filename])
+                file_includes[filename] = [i for i in resolved if i is not None]
+                new_pending.update(i for i in file_includes[filename] if i not in file_modules)
+            pending = new_pending
+
+    if cache is not None:
+        cache.save()
+
+    modules = defaultdict(set)
+    for filename, groups_of_file in file_groups.items():
+        # Walk everything that the file includes, directly or indirectly
+        used = set()
+        seen = {filename}
+        worklist = deque([filename])
+        while worklist:
+            current = worklist.popleft()
+            used.update(file_modules[current])
+            for included in file_includes[current]:
+                if included not in seen:
+                    seen.add(included)
+                    worklist.append(included)
+
+        for group in groups_of_file:
+            modules[group].update(used)
+
+    return modules
 
 
 def get_groups_of_tests(integration_dir, core_targets):
@@ -515,24 +750,7 @@ def main():
     groups = get_groups_of_tests(sys.argv[1], minimal_tasks)
 
     # for each of the targets in the integration tests, figure out what modules are used.
-    modules = defaultdict(set)
-    for group, test_targets in groups.items():
-        for target in test_targets:
-            for root, _dummy, files in os.walk(target):
-                root = pathlib.Path(root)
-                for potential_file in files:
-                    if not (potential_file.endswith('.yml') or potential_file.endswith('.yaml')):
-                        continue
-
-                    with open(root / potential_file) as f:
-                        try:
-                            data = DataLoader().load(f.read())
-                        except Exception:
-                            print('Error while parsing yaml file %s' % (root / potential_file))
-                            raise
-
-                    new_modules = parse_yaml_for_modules(data)
-                    modules[group].update(new_modules)
+    modules = scan_groups(groups, cache=ModuleCache(default_cache_file()))
 
     for group_name, task_list in modules.items():
         # Filter out modules already in minimal
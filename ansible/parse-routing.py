@@ -2,14 +2,14 @@
 
 import os
 
-import yaml
+import fastyaml
 
 
 CHECKOUTDIR='/srv/ansible/vanilla'
 
 
 def main():
-    routing_data = yaml.safe_load(open(os.path.join(CHECKOUTDIR, 'lib/ansible/config/routing.yml')).read())
+    routing_data = fastyaml.safe_load(open(os.path.join(CHECKOUTDIR, 'lib/ansible/config/routing.yml')).read())
 
     collections = set()
     for plugin_type, plugins in routing_data['plugin_routing'].items():
@@ -18,7 +18,7 @@ def main():
             collection = replacement.split('.')[0:2]
             collections.add('.'.join(collection))
 
-    print(yaml.dump(sorted(list(collections))))
+    print(fastyaml.dump(sorted(list(collections))))
 
 if __name__ == '__main__':
     main()
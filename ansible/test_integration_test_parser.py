@@ -0,0 +1,219 @@
+import importlib.util
+import pathlib
+import sys
+
+import pytest
+
+
+HERE = pathlib.Path(__file__).parent
+
+
+@pytest.fixture(scope='module')
+def itp():
+    pytest.importorskip('requests')
+    pytest.importorskip('six')
+    # The script's name is not importable so load it from its path.  It is registered in
+    # sys.modules so that the scanning pool's workers can find its functions.
+    spec = importlib.util.spec_from_file_location('integration_test_parser',
+                                                  HERE / 'integration-test-parser.py')
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules[spec.name]
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def test_iter_tasks_order(itp):
+    play = {'hosts': 'all',
+            'pre_tasks': [{'name': 'pre'}],
+            'tasks': [{'name': 'first'},
+                      {'block': [{'name': 'in block'}, {'block': [{'name': 'nested'}]}],
+                       'rescue': [{'name': 'rescue'}],
+                       'always': [{'name': 'always'}]},
+                      {'name': 'last'}],
+            'handlers': [{'name': 'handler'}]}
+
+    names = [t['name'] for t in itp.iter_tasks([play])]
+    # Each level of blocks is walked after the level it is in
+    assert names == ['first', 'last', 'pre', 'handler', 'in block', 'rescue', 'always', 'nested']
+
+    # Blocks nested deeper than the recursion limit are fine
+    task = {'name': 'deep'}
+    for _ in range(sys.getrecursionlimit() + 100):
+        task = {'block': [task]}
+    assert [t['name'] for t in itp.iter_tasks([task])] == ['deep']
+
+
+def test_parse_yaml_skips_unparsable_tasks(itp, capsys):
+    tasks = [{'action': 'ping', 'foo': 1},
+             {'action': ['not', 'a', 'module'], 'foo': 1},
+             {'name': 'copy it', 'copy': {'src': 'a', 'dest': 'b'}}]
+
+    assert itp.parse_yaml_for_modules(tasks) == {'copy'}
+    assert capsys.readouterr().err.count('Skipping a task') == 2
+
+
+def test_task_includes(itp):
+    includes = set()
+    tasks = [{'include_tasks': 'one.yml'},
+             {'import_tasks': {'file': 'two.yml'}},
+             {'include': 'three.yml var=value'},
+             {'include_tasks': '{{ templated }}.yml'}]
+    itp.parse_yaml_for_modules(tasks, includes=includes)
+    assert includes == {'one.yml', 'two.yml', 'three.yml'}
+
+
+def test_scan_groups_follows_includes(itp, tmp_path):
+    targets = tmp_path / 'targets'
+    main = _write(targets / 'app' / 'tasks' / 'main.yml',
+                  '- include_tasks: other.yml\n- command: echo\n')
+    _write(targets / 'app' / 'tasks' / 'other.yml',
+           '- import_tasks: ../../shared/tasks/common.yml\n- file: path=/tmp\n'
+           '- include_tasks: missing.yml\n')
+    # Includes the first file again
+    _write(targets / 'shared' / 'tasks' / 'common.yml',
+           '- include_tasks: ../../app/tasks/main.yml\n- apt: name=foo\n')
+
+    assert itp.resolve_include(str(main), 'other.yml') == str(main.parent / 'other.yml')
+    assert itp.resolve_include(str(main), 'missing.yml') is None
+
+    modules = itp.scan_groups({'app': [str(targets / 'app')]}, max_workers=1)
+    assert modules['app'] == {'include_tasks', 'import_tasks', 'command', 'file', 'apt'}
+
+
+def test_module_cache_hits_and_invalidation(itp, tmp_path):
+    target = tmp_path / 'targets' / 'app'
+    tasks = _write(target / 'tasks' / 'main.yml', '- command: echo\n')
+    cache_file = tmp_path / 'cache' / 'modules.json'
+    parsed = []
+
+    class RecordingCache(itp.ModuleCache):
+        # Only files which had to be parsed are stored
+        def store(self, filename, *args):
+            parsed.append(filename)
+            super().store(filename, *args)
+
+    def scan():
+        parsed.clear()
+        modules = itp.scan_groups({'app': [str(target)]}, max_workers=1,
+                                  cache=RecordingCache(str(cache_file)))
+        return modules['app']
+
+    def touch():
+        stat = tasks.stat()
+        itp.os.utime(tasks, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert scan() == {'command'}
+    assert parsed == [str(tasks)]
+
+    # Unchanged files come from the cache
+    assert scan() == {'command'}
+    assert parsed == []
+
+    # A new mtime with the same contents is checked against the checksum
+    touch()
+    assert scan() == {'command'}
+    assert parsed == []
+
+    # Same size and a new mtime, but different contents
+    tasks.write_text('- service: echo\n')
+    touch()
+    assert scan() == {'service'}
+    assert parsed == [str(tasks)]
+
+    # A different size
+    tasks.write_text('- command: echo\n- copy: src=a dest=b\n')
+    assert scan() == {'command', 'copy'}
+    assert parsed == [str(tasks)]
+    assert scan() == {'command', 'copy'}
+    assert parsed == []
+
+
+@pytest.mark.parametrize('contents', ['{"version": 1, "files": {"x": {}}}', '{not json', '',
+                                      '[]'])
+def test_module_cache_ignores_bad_files(itp, tmp_path, contents):
+    cache_file = _write(tmp_path / 'modules.json', contents)
+    cache = itp.ModuleCache(str(cache_file))
+    assert cache.entries == {}
+
+    # and replaces them with a good one
+    tasks = _write(tmp_path / 'main.yml', '- command: echo\n')
+    cache.store(str(tasks), tasks.stat(), 'sha', {'command'}, [])
+    cache.save()
+    assert itp.ModuleCache(str(cache_file)).lookup(str(tasks), tasks.stat()) == ({'command'}, [])
+
+
+def _chained_which_groups(itp, target, core_targets):
+    """The if/elif chain which TargetClassifier replaced"""
+    aws_prefixes = ('sts_', 'sqs_', 's3_', 'rds_', 'lambda_', 'inventory_aws_', 'iam_', 'elb_',
+                    'ecs_', 'ec2_', 'dms_')
+    if target in itp.SPECIAL_CASES:
+        return itp.SPECIAL_CASES[target]
+    elif target.startswith('digital_'):
+        return ['digital_ocean']
+    elif target.startswith(aws_prefixes):
+        return ['aws']
+    elif target in ('sns', 'sns_topic', 'setup_ec2', 'route53'):
+        return ['aws']
+    elif target == 'cloudtrail' or target.startswith('cloudtrail_'):
+        return ['aws']
+    elif target == 'cloudformation' or target.startswith('cloudformation_'):
+        return ['aws']
+    elif target == 'cloudfront' or target.startswith('cloudfront_'):
+        return ['aws']
+    elif target in itp.CORE_FEATURE_TARGETS:
+        return ['_core']
+    elif target in core_targets:
+        return ['_core']
+    elif target.startswith('setup_'):
+        return [target[6:]]
+    elif target.startswith('prepare_'):
+        return [target[8:]]
+    elif '_' in target:
+        return [target[:target.index('_')]]
+    else:
+        return [target]
+
+
+CORE_TARGETS = frozenset(('copy', 'file', 'setup_minimal', 'ec2_minimal', 'stat'))
+
+
+def test_which_groups_matches_the_old_chain(itp):
+    names = set(CORE_TARGETS) | set(itp.SPECIAL_CASES) | set(itp.CORE_FEATURE_TARGETS)
+    for _kind, pattern, _groups in list(itp.TARGET_RULES) + list(itp.FALLBACK_TARGET_RULES):
+        # The name itself, names which start with it, and near misses
+        names.update((pattern, f'{pattern}thing', f'{pattern}_thing', pattern[:-1],
+                      f'x{pattern}', f'setup_{pattern}', f'prepare_{pattern}'))
+    names.update(('', '_', 'plain', 'two_parts', 'setup_', 'prepare_', 'cloudtrailx'))
+
+    for name in sorted(names):
+        assert (itp.which_groups(name, CORE_TARGETS)
+                == _chained_which_groups(itp, name, CORE_TARGETS)), name
+
+
+@pytest.mark.parametrize('target, groups', [
+    ('vsphere_file', ['vmware']),
+    ('setup_tls', ['rabbitmq', 'mqtt']),
+    ('digital_ocean_droplet', ['digital_ocean']),
+    ('ec2_instance', ['aws']),
+    ('inventory_aws_ec2', ['aws']),
+    ('sns_topic', ['aws']),
+    ('cloudtrail', ['aws']),
+    ('cloudformation_stack_set', ['aws']),
+    ('blocks', ['_core']),
+    ('stat', ['_core']),
+    ('ec2_minimal', ['aws']),
+    ('setup_minimal', ['_core']),
+    ('setup_docker', ['docker']),
+    ('prepare_foo_tests', ['foo_tests']),
+    ('postgresql_db', ['postgresql']),
+    ('zypper', ['zypper']),
+])
+def test_which_groups(itp, target, groups):
+    assert itp.which_groups(target, CORE_TARGETS) == groups